@@ -0,0 +1,101 @@
+"""
+Compiled lexicon engine for the rule-based sentiment analyzers.
+
+Lexicons map terms (single words or multi-word phrases) to weights and are
+grouped by category, e.g. "positive", "negation" or "phrase_neutral". All
+categories are compiled into one token trie, so a text is tokenized once and
+every term occurrence is found in a single left-to-right pass. The cost of a
+scan grows with the length of the text, not with the size of the vocabulary.
+Terms match whole tokens only. For a short keyword list where substrings
+should match too (e.g. "loved" for "love"), `word in text.lower()` is both
+what is wanted and faster; see benchmarks/bench_lexicon.py.
+
+Usage:
+    engine = LexiconEngine({"positive": {"great": 1.2}, "negative": {"not good": -1.0}})
+    tokens, matches = engine.scan("Not good, but not great either")
+    counts = engine.count_distinct("great great day")   # {"positive": 1}
+"""
+
+import re
+from collections import Counter, namedtuple
+from typing import Dict, List, Tuple
+
+# Same tokenization the analyzers have always used
+TOKEN_RE = re.compile(r"\b[\w']+\b")
+
+# Key under which a trie node stores the terms that end at it
+_TERMINAL = None
+
+Match = namedtuple("Match", ["start", "end", "category", "term", "weight"])
+
+
+def normalize_token(token: str) -> str:
+    """Lowercase and drop apostrophes so "can't" and "cant" are the same token"""
+    return token.lower().replace("'", "")
+
+
+class LexiconEngine:
+    """Token trie over every term of every category"""
+
+    def __init__(self, lexicons: Dict[str, Dict[str, float]]):
+        self._root = {}
+        self.max_term_tokens = 0
+        self.size = 0
+
+        for category, terms in lexicons.items():
+            for term, weight in terms.items():
+                self.add(category, term, weight)
+
+    def add(self, category: str, term: str, weight: float = 1.0):
+        """Add one term to the trie"""
+        tokens = self.tokenize(term)
+        if not tokens:
+            return
+
+        node = self._root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node.setdefault(_TERMINAL, []).append((category, term, weight))
+
+        self.max_term_tokens = max(self.max_term_tokens, len(tokens))
+        self.size += 1
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        return [normalize_token(t) for t in TOKEN_RE.findall(text or "")]
+
+    def scan_tokens(self, tokens: List[str]) -> List[Match]:
+        """
+        Find every term occurrence in an already tokenized text.
+
+        Matches are ordered by start position, shorter terms first. Walking
+        from each position stops as soon as the trie has no continuation, so
+        the work per position is bounded by the longest term.
+        """
+        matches = []
+        root = self._root
+        n = len(tokens)
+
+        for i in range(n):
+            node = root
+            j = i
+            while j < n:
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                j += 1
+                for category, term, weight in node.get(_TERMINAL, ()):
+                    matches.append(Match(i, j, category, term, weight))
+
+        return matches
+
+    def scan(self, text: str) -> Tuple[List[str], List[Match]]:
+        """Tokenize a text and find every term occurrence in it"""
+        tokens = self.tokenize(text)
+        return tokens, self.scan_tokens(tokens)
+
+    def count_distinct(self, text: str) -> Counter:
+        """Number of distinct terms of each category that occur in the text"""
+        _, matches = self.scan(text)
+        seen = {(m.category, m.term) for m in matches}
+        return Counter(category for category, _ in seen)
@@ -0,0 +1,383 @@
+"""
+Pluggable LLM providers.
+
+Every LLM call in the app (app.llm for the routes, and the Gemini tier of
+ai.sentiment) goes through the process-wide provider returned by
+get_provider(). A provider has two methods:
+
+    generate(model, prompt, timeout=None) -> str
+    stream(model, prompt) -> iterator of text chunks
+
+LLM_PROVIDER selects it:
+- gemini   google-genai SDK with GEMINI_API_KEY (default)
+- rest     Gemini-compatible REST API at LLM_BASE_URL (default if it is set),
+           e.g. tools/fake_llm_server.py
+- standin  in-process stand-in with canned outputs, a configurable latency
+           distribution (LLM_STANDIN_LATENCY_DIST fixed|uniform|lognormal,
+           LLM_STANDIN_LATENCY_MS median, LLM_STANDIN_LATENCY_SPREAD_MS) and
+           error rate (LLM_STANDIN_ERROR_RATE)
+- replay   answers from a recording made with LLM_RECORD_PATH, read from
+           LLM_REPLAY_PATH; LLM_REPLAY_LATENCY=true also replays the
+           recorded latency. Prompts that were not recorded raise
+           ReplayMiss, so callers use their fallbacks.
+
+Setting LLM_RECORD_PATH wraps the selected provider and appends every
+completed call (prompt, answer, latency) to that JSON lines file.
+
+With standin or replay, capacity tests of the AI endpoints (threads,
+deadlines, fallbacks) run without an API key or network access.
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, Iterator, List, Optional
+
+from ai.cache import content_key
+
+logger = logging.getLogger(__name__)
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL")
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "rest" if LLM_BASE_URL else "gemini").lower()
+LLM_RECORD_PATH = os.getenv("LLM_RECORD_PATH")
+LLM_REPLAY_PATH = os.getenv("LLM_REPLAY_PATH")
+LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "false").lower() == "true"
+
+LLM_STANDIN_LATENCY_DIST = os.getenv("LLM_STANDIN_LATENCY_DIST", "lognormal").lower()
+LLM_STANDIN_LATENCY_MS = float(os.getenv("LLM_STANDIN_LATENCY_MS", 800))
+LLM_STANDIN_LATENCY_SPREAD_MS = float(os.getenv("LLM_STANDIN_LATENCY_SPREAD_MS", 400))
+LLM_STANDIN_ERROR_RATE = float(os.getenv("LLM_STANDIN_ERROR_RATE", 0.0))
+
+# Threads that run google-genai calls made with a timeout, including calls
+# still running after their caller gave up on them
+GENAI_TIMEOUT_THREADS = int(os.getenv("GENAI_TIMEOUT_THREADS", 8))
+
+GOOGLE_API_URL = "https://generativelanguage.googleapis.com"
+
+# Placeholder values from sample .env files
+_PLACEHOLDER_KEYS = {"GEMINI_API_KEY", "your_gemini_api_key_here"}
+
+
+class ProviderError(RuntimeError):
+    """A provider call failed"""
+
+
+class ReplayMiss(ProviderError):
+    """The replayed recording has no answer for this prompt"""
+
+
+class GenaiProvider:
+    """
+    google-genai SDK. The pinned SDK has no per-request timeout, so a call
+    with a timeout runs on a worker thread and is abandoned (left to finish
+    in the background) when the timeout passes.
+    """
+
+    name = "gemini"
+
+    def __init__(self, api_key: str):
+        from google import genai
+        self.client = genai.Client(api_key=api_key)
+        self._calls = ThreadPoolExecutor(max_workers=GENAI_TIMEOUT_THREADS, thread_name_prefix="genai")
+
+    def _generate(self, model: str, prompt: str) -> str:
+        response = self.client.models.generate_content(model=model, contents=prompt)
+        return response.text.strip()
+
+    def generate(self, model: str, prompt: str, timeout: Optional[float] = None) -> str:
+        if timeout is None:
+            return self._generate(model, prompt)
+        future = self._calls.submit(self._generate, model, prompt)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise ProviderError(f"{model} did not answer within {timeout}s") from None
+
+    def stream(self, model: str, prompt: str) -> Iterator[str]:
+        for chunk in self.client.models.generate_content_stream(model=model, contents=prompt):
+            if chunk.text:
+                yield chunk.text
+
+
+class RestProvider:
+    """Gemini generateContent REST API at base_url"""
+
+    name = "rest"
+
+    def __init__(self, base_url: str, api_key: Optional[str] = None, timeout: float = 120):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def _request(self, model: str, method: str, prompt: str, timeout: Optional[float]):
+        url = f"{self.base_url}/v1beta/models/{model}:{method}"
+        payload = json.dumps({"contents": [{"role": "user", "parts": [{"text": prompt}]}]})
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["x-goog-api-key"] = self.api_key
+
+        req = urllib.request.Request(url, data=payload.encode("utf-8"), headers=headers, method="POST")
+        return urllib.request.urlopen(req, timeout=timeout or self.timeout)
+
+    def generate(self, model: str, prompt: str, timeout: Optional[float] = None) -> str:
+        with self._request(model, "generateContent", prompt, timeout) as resp:
+            data = json.loads(resp.read())
+        return data["candidates"][0]["content"]["parts"][0]["text"].strip()
+
+    def stream(self, model: str, prompt: str) -> Iterator[str]:
+        with self._request(model, "streamGenerateContent?alt=sse", prompt, None) as resp:
+            for line in resp:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = json.loads(line[len("data:"):])
+                parts = data["candidates"][0]["content"].get("parts", [])
+                text = "".join(part.get("text", "") for part in parts)
+                if text:
+                    yield text
+
+
+def canned_response(prompt: str) -> str:
+    """Plausible text for each kind of prompt the app sends"""
+    if "sentiment analysis assistant" in prompt:
+        negative = re.search(r"\b(tired|exhausted|stressed|sad|awful|hard)\b", prompt, re.IGNORECASE)
+        if negative:
+            return '{"sentiment": "negative", "score": -0.6, "message": "Rest up, hero - tomorrow is a new quest."}'
+        return '{"sentiment": "positive", "score": 0.6, "message": "Great work, hero - keep the momentum going!"}'
+    if "three string fields" in prompt:
+        return json.dumps({
+            "insights": "- You're doing well offline\n- Keep your streak going\n- Try one extra glass of water today",
+            "plan": "- Day 1: Walk - 20 min\n- Day 2: Squats - 3x10\n- Day 3: Stretching - 15 min\n\nTip: offline but motivated!",
+            "tips": "- Drink water with every meal\n- Add protein to breakfast\n- Snack on fruit before workouts",
+        })
+    match = re.search(r"JSON array of (\d+) strings", prompt)
+    if match:
+        return json.dumps([
+            f"Offline quest {i + 1}: the stand-in realm awaits, hero. Reach your goal before nightfall."
+            for i in range(int(match.group(1)))
+        ])
+    if "{target}" in prompt:
+        return "A fake quest awaits you, hero. Reach {target} before nightfall to claim the offline reward."
+    if "health coach" in prompt and "Current Mood" in prompt:
+        return "Steady steps, hero - this offline coach believes in your quest!"
+    if "workout plan" in prompt:
+        return "- Day 1: Walk - 20 min\n- Day 2: Squats - 3x10\n- Day 3: Stretching - 15 min\n\nTip: offline but motivated!"
+    if "nutrition" in prompt:
+        return "- Drink water with every meal\n- Add protein to breakfast\n- Snack on fruit before workouts"
+    if "quest narrative" in prompt:
+        return "The stand-in realm calls, hero. Complete today's goal to claim the offline reward."
+    return "- You're doing well offline\n- Keep your streak going\n- Try one extra glass of water today"
+
+
+class StandInProvider:
+    """Local stand-in with canned answers, sampled latency and injected errors"""
+
+    name = "standin"
+
+    def __init__(self, latency_dist: str = "lognormal", latency_ms: float = 800,
+                 spread_ms: float = 400, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency_dist = latency_dist
+        self.latency_ms = latency_ms
+        self.spread_ms = spread_ms
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample_latency_ms(self) -> float:
+        with self._lock:
+            if self.latency_dist == "fixed" or self.spread_ms <= 0:
+                return self.latency_ms
+            if self.latency_dist == "uniform":
+                return max(0.0, self._random.uniform(self.latency_ms - self.spread_ms, self.latency_ms + self.spread_ms))
+            # Lognormal with the given median; spread is roughly one standard deviation
+            sigma = max(0.01, self.spread_ms / max(self.latency_ms, 1.0))
+            return self._random.lognormvariate(0, sigma) * self.latency_ms
+
+    def _fails(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def generate(self, model: str, prompt: str, timeout: Optional[float] = None) -> str:
+        latency = self.sample_latency_ms() / 1000
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise ProviderError(f"stand-in timed out after {timeout}s")
+        time.sleep(latency)
+        if self._fails():
+            raise ProviderError("stand-in injected error")
+        return canned_response(prompt)
+
+    def stream(self, model: str, prompt: str) -> Iterator[str]:
+        words = canned_response(prompt).split(" ")
+        latency = self.sample_latency_ms() / 1000
+        if self._fails():
+            time.sleep(latency)
+            raise ProviderError("stand-in injected error")
+        for i, word in enumerate(words):
+            time.sleep(latency / len(words))
+            yield word if i == 0 else " " + word
+
+
+class RecordingProvider:
+    """Wraps a provider and appends every completed call to a JSON lines file"""
+
+    def __init__(self, inner, path: str):
+        self.inner = inner
+        self.name = f"{inner.name}+record"
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _record(self, model: str, prompt: str, text: str, started: float):
+        record = {
+            "key": content_key(model, prompt),
+            "model": model,
+            "prompt": prompt,
+            "text": text,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def generate(self, model: str, prompt: str, timeout: Optional[float] = None) -> str:
+        started = time.perf_counter()
+        text = self.inner.generate(model, prompt, timeout=timeout)
+        self._record(model, prompt, text, started)
+        return text
+
+    def stream(self, model: str, prompt: str) -> Iterator[str]:
+        started = time.perf_counter()
+        chunks = []
+        for chunk in self.inner.stream(model, prompt):
+            chunks.append(chunk)
+            yield chunk
+        self._record(model, prompt, "".join(chunks).strip(), started)
+
+
+class ReplayProvider:
+    """Answers prompts from a recording made by RecordingProvider"""
+
+    name = "replay"
+
+    def __init__(self, path: str, replay_latency: bool = False):
+        self.replay_latency = replay_latency
+        self._records: Dict[str, List[Dict]] = {}
+        self._next: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self._records.setdefault(record["key"], []).append(record)
+
+    def _lookup(self, model: str, prompt: str) -> Dict:
+        key = content_key(model, prompt)
+        with self._lock:
+            records = self._records.get(key)
+            if not records:
+                raise ReplayMiss(f"no recorded answer for {model} prompt {key[:12]}")
+            # Cycle through answers recorded for the same prompt
+            index = self._next.get(key, 0)
+            self._next[key] = index + 1
+            return records[index % len(records)]
+
+    def generate(self, model: str, prompt: str, timeout: Optional[float] = None) -> str:
+        record = self._lookup(model, prompt)
+        if self.replay_latency:
+            latency = record["latency_ms"] / 1000
+            if timeout is not None and latency > timeout:
+                time.sleep(timeout)
+                raise ProviderError(f"replay timed out after {timeout}s")
+            time.sleep(latency)
+        return record["text"]
+
+    def stream(self, model: str, prompt: str) -> Iterator[str]:
+        record = self._lookup(model, prompt)
+        words = record["text"].split(" ")
+        for i, word in enumerate(words):
+            if self.replay_latency:
+                time.sleep(record["latency_ms"] / 1000 / len(words))
+            yield word if i == 0 else " " + word
+
+
+def create_provider():
+    """Build the provider selected by LLM_PROVIDER, or None if it is not usable"""
+    provider = None
+    if LLM_PROVIDER == "standin":
+        provider = StandInProvider(
+            LLM_STANDIN_LATENCY_DIST, LLM_STANDIN_LATENCY_MS,
+            LLM_STANDIN_LATENCY_SPREAD_MS, LLM_STANDIN_ERROR_RATE
+        )
+        logger.info(f"✅ Using stand-in LLM ({LLM_STANDIN_LATENCY_DIST} {LLM_STANDIN_LATENCY_MS:g}ms, "
+                    f"error rate {LLM_STANDIN_ERROR_RATE:.0%})")
+    elif LLM_PROVIDER == "replay":
+        if not LLM_REPLAY_PATH:
+            logger.warning("⚠️ LLM_PROVIDER=replay needs LLM_REPLAY_PATH - AI features will use fallbacks")
+            return None
+        provider = ReplayProvider(LLM_REPLAY_PATH, LLM_REPLAY_LATENCY)
+        logger.info(f"✅ Replaying LLM responses from {LLM_REPLAY_PATH}")
+    elif LLM_PROVIDER == "rest":
+        base_url = LLM_BASE_URL or GOOGLE_API_URL
+        provider = RestProvider(base_url, GEMINI_API_KEY)
+        logger.info(f"✅ Using LLM server at {base_url}")
+    elif LLM_PROVIDER == "gemini":
+        if not GEMINI_API_KEY or GEMINI_API_KEY in _PLACEHOLDER_KEYS:
+            logger.warning("⚠️ GEMINI_API_KEY not set - AI features will use fallbacks")
+            return None
+        try:
+            provider = GenaiProvider(GEMINI_API_KEY)
+            logger.info("✅ Gemini API initialized successfully")
+        except ImportError:
+            logger.warning("google-genai not installed. Install with: pip install google-genai")
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to initialize Gemini: {e}")
+            return None
+    else:
+        logger.warning(f"⚠️ Unknown LLM_PROVIDER '{LLM_PROVIDER}' - AI features will use fallbacks")
+        return None
+
+    if LLM_RECORD_PATH:
+        logger.info(f"Recording LLM responses to {LLM_RECORD_PATH}")
+        provider = RecordingProvider(provider, LLM_RECORD_PATH)
+    return provider
+
+
+def provider_configured() -> bool:
+    """Whether LLM_PROVIDER has the settings it needs, without creating it"""
+    if LLM_PROVIDER == "gemini":
+        return bool(GEMINI_API_KEY) and GEMINI_API_KEY not in _PLACEHOLDER_KEYS
+    if LLM_PROVIDER == "replay":
+        return bool(LLM_REPLAY_PATH)
+    return LLM_PROVIDER in ("rest", "standin")
+
+
+_provider = None
+_provider_ready = False
+_provider_lock = threading.Lock()
+
+
+def get_provider():
+    """Return the shared provider, creating it on first use (None if unavailable)"""
+    global _provider, _provider_ready
+    if not _provider_ready:
+        with _provider_lock:
+            if not _provider_ready:
+                _provider = create_provider()
+                _provider_ready = True
+    return _provider
+
+
+def set_provider(provider):
+    """Replace the shared provider, e.g. with a stand-in in a load test script"""
+    global _provider, _provider_ready
+    with _provider_lock:
+        _provider = provider
+        _provider_ready = True
@@ -0,0 +1,191 @@
+"""
+Circuit breaker and latency counters for the sentiment fallback chain.
+
+A CircuitBreaker opens after failure_threshold consecutive failures, so
+callers skip a broken backend instead of paying for its exceptions and
+timeouts. After cooldown seconds it lets a single probe call through
+(half-open); a successful probe closes it again, a failed one re-opens it.
+
+A Bulkhead caps how many calls to a backend may be in flight at once.
+Callers wait a bounded time for a slot and are rejected after that, so a
+slow backend ties up at most `limit` threads.
+
+TierStats records how a tier is serving traffic: successes, failures,
+skips and latency (total and an exponentially weighted moving average that
+is used to decide whether a tier still fits in a call's latency budget; it
+decays while the tier is being skipped so the tier is eventually retried).
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 3, cooldown: float = 30):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go through right now"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+
+            return False
+
+    def is_open(self) -> bool:
+        """Whether calls are being refused right now (no side effects, unlike allow)"""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < self.cooldown
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "retry_in_seconds": round(retry_in, 1) if retry_in is not None else None,
+            }
+
+
+class TierStats:
+    def __init__(self, name: str, ewma_alpha: float = 0.2):
+        self.name = name
+        self.ewma_alpha = ewma_alpha
+        self.success = 0
+        self.failure = 0
+        self.skipped_open = 0
+        self.skipped_budget = 0
+        self.latency_ms_total = 0.0
+        self.latency_ms_ewma = None
+        self._lock = threading.Lock()
+
+    def record(self, ok: bool, latency_ms: float):
+        with self._lock:
+            if ok:
+                self.success += 1
+            else:
+                self.failure += 1
+            self.latency_ms_total += latency_ms
+            if self.latency_ms_ewma is None:
+                self.latency_ms_ewma = latency_ms
+            else:
+                self.latency_ms_ewma += self.ewma_alpha * (latency_ms - self.latency_ms_ewma)
+
+    def record_skip(self, reason: str):
+        with self._lock:
+            if reason == OPEN:
+                self.skipped_open += 1
+            else:
+                self.skipped_budget += 1
+                # Let the estimate decay while skipped, so one slow call
+                # (e.g. a cold model load) does not exclude a tier forever
+                if self.latency_ms_ewma is not None:
+                    self.latency_ms_ewma *= 1 - self.ewma_alpha
+
+    def expected_latency_ms(self) -> Optional[float]:
+        return self.latency_ms_ewma
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            calls = self.success + self.failure
+            return {
+                "success": self.success,
+                "failure": self.failure,
+                "skipped_open": self.skipped_open,
+                "skipped_budget": self.skipped_budget,
+                "latency_ms_avg": round(self.latency_ms_total / calls, 2) if calls else None,
+                "latency_ms_ewma": round(self.latency_ms_ewma, 2) if self.latency_ms_ewma is not None else None,
+            }
+
+
+class Bulkhead:
+    def __init__(self, name: str, limit: int = 8, max_wait: float = 0.5):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(self.limit)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.acquired = 0
+        self.rejected = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Wait up to timeout (default max_wait) seconds for a slot"""
+        with self._lock:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+
+        started = time.monotonic()
+        ok = self._slots.acquire(timeout=self.max_wait if timeout is None else max(0.0, timeout))
+        waited_ms = (time.monotonic() - started) * 1000
+
+        with self._lock:
+            self.waiting -= 1
+            self.wait_ms_total += waited_ms
+            self.wait_ms_max = max(self.wait_ms_max, waited_ms)
+            if ok:
+                self.acquired += 1
+                self.in_flight += 1
+            else:
+                self.rejected += 1
+        return ok
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            attempts = self.acquired + self.rejected
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "max_waiting": self.max_waiting,
+                "acquired": self.acquired,
+                "rejected": self.rejected,
+                "wait_ms_avg": round(self.wait_ms_total / attempts, 2) if attempts else None,
+                "wait_ms_max": round(self.wait_ms_max, 2),
+            }
@@ -11,27 +11,68 @@ Returns dict:
 }
 
 Behavior:
-- Try Transformers first (local ML model) for reliability
-- If Gemini API key exists, try Gemini as backup
+- Try Transformers first (local ML model) for reliability; the pipeline is
+  loaded once per process and reused (see get_sentiment_pipeline)
+- With SENTIMENT_BATCHING enabled, concurrent calls are micro-batched into
+  one pipeline call; analyze_sentiment_batch scores a list in one call
+- Transformers and Gemini sit behind circuit breakers, and a tier is skipped
+  when it is not expected to fit in SENTIMENT_LATENCY_BUDGET_MS
+- With SENTIMENT_INFERENCE_WORKERS > 0, inference runs in a pool of model
+  worker processes started with the app instead of on request threads
+- Model results are cached by normalized text and the model that produced
+  them (SENTIMENT_CACHE); a cached answer of a lower tier is only served
+  while every tier above it is tripped, and rule-based results are not
+  cached. Cache hits keep model_used/score but get a freshly crafted message
+- If an LLM provider is configured (Gemini API key, or see ai.providers),
+  try Gemini as backup
 - Fallback to enhanced rule-based analyzer
 - Final fallback to simple rule-based
 """
 
+import atexit
 import os
 import re
 import json
 import random
-import requests
-from typing import Dict
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Tuple
+
+from ai.cache import TTLCache, content_key
+from ai.lexicon import LexiconEngine
+from ai.providers import get_provider, provider_configured
+from ai.resilience import OPEN, CircuitBreaker, TierStats
 
 # ------------------------------------
 # Environment Variables
 # ------------------------------------
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.0")
 HF_MODEL = os.getenv("HF_MODEL", "distilbert-base-uncased-finetuned-sst-2-english")
 HF_DEVICE = os.getenv("HF_DEVICE", "cpu")
 
+# Micro-batching of transformers inference across concurrent requests
+SENTIMENT_BATCHING = os.getenv("SENTIMENT_BATCHING", "false").lower() == "true"
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", 16))
+SENTIMENT_BATCH_WAIT_MS = float(os.getenv("SENTIMENT_BATCH_WAIT_MS", 10))
+SENTIMENT_BATCH_TIMEOUT = float(os.getenv("SENTIMENT_BATCH_TIMEOUT", 10))
+
+# Out-of-process inference: number of model worker processes (0 = in-process)
+SENTIMENT_INFERENCE_WORKERS = int(os.getenv("SENTIMENT_INFERENCE_WORKERS", 0))
+SENTIMENT_INFERENCE_TIMEOUT = float(os.getenv("SENTIMENT_INFERENCE_TIMEOUT", 10))
+
+# Result cache for repeated reflections
+SENTIMENT_CACHE_SIZE = int(os.getenv("SENTIMENT_CACHE_SIZE", 4096))
+SENTIMENT_CACHE_TTL = float(os.getenv("SENTIMENT_CACHE_TTL", 600))
+
+# Fallback chain protection: breakers for the model tiers and a per-call budget
+SENTIMENT_BREAKER_THRESHOLD = int(os.getenv("SENTIMENT_BREAKER_THRESHOLD", 3))
+SENTIMENT_BREAKER_COOLDOWN = float(os.getenv("SENTIMENT_BREAKER_COOLDOWN", 30))
+SENTIMENT_LATENCY_BUDGET_MS = float(os.getenv("SENTIMENT_LATENCY_BUDGET_MS", 3000))
+
 # Multipliers for game logic
 MULTIPLIER_POS = float(os.getenv("MULTIPLIER_POS", 1.2))
 MULTIPLIER_NEU = float(os.getenv("MULTIPLIER_NEU", 1.0))
@@ -84,6 +125,23 @@ NEGATIONS = {'not', 'no', 'never', 'none', 'nothing', 'nobody',
              "weren't", "haven't", "hasn't", "hadn't", "wouldn't",
              "shouldn't", "couldn't", "mightn't", "mustn't"}
 
+# Phrases that adjust the final score
+POSITIVE_PHRASES = ["not bad", "not too bad", "could be worse"]
+NEGATIVE_PHRASES = ["not great", "not good", "not happy"]
+NEUTRAL_PHRASES = ["so so", "meh", "okay", "alright"]
+
+# All lexicons compiled into one automaton, scanned once per text
+SENTIMENT_LEXICON = LexiconEngine({
+    "positive": POSITIVE_WORDS,
+    "negative": NEGATIVE_WORDS,
+    "intensity": INTENSITY_MODIFIERS,
+    "negation": {word: 0.0 for word in NEGATIONS},
+    "phrase_positive": {phrase: 0.3 for phrase in POSITIVE_PHRASES},
+    "phrase_negative": {phrase: -0.3 for phrase in NEGATIVE_PHRASES},
+    "phrase_neutral": {phrase: 0.0 for phrase in NEUTRAL_PHRASES},
+})
+_WORD_CATEGORIES = {"positive", "negative", "intensity", "negation"}
+
 # ------------------------------------
 # Helper utilities
 # ------------------------------------
@@ -138,49 +196,368 @@ def craft_enhanced_message(sentiment: str, score: float, original_text: str = ""
         return random.choice(neutral_messages)
 
 # ------------------------------------
-# TRANSFORMERS ANALYZER (Primary)
+# RESULT CACHE
+# ------------------------------------
+# Shared by the facade and the activity logging path. Entries hold only
+# model_used/sentiment/score; messages are re-crafted on every hit.
+SENTIMENT_CACHE = TTLCache(max_size=SENTIMENT_CACHE_SIZE, ttl=SENTIMENT_CACHE_TTL)
+
+# Cacheable tiers, in chain order, and the model_used their results carry.
+# Keying by the producing model means a model change never serves stale
+# results, and an outage's fallback answers never stand in for the model's.
+CACHED_TIER_MODELS = {
+    "transformers": f"transformers:{HF_MODEL}",
+    "gemini": f"gemini:{GEMINI_MODEL}",
+}
+
+
+def normalize_text(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+def sentiment_cache_key(text: str, model_id: str) -> str:
+    return content_key(model_id, normalize_text(text))
+
+
+def get_cache_metrics() -> Dict:
+    return SENTIMENT_CACHE.stats()
+
+# ------------------------------------
+# TRANSFORMERS MODEL REGISTRY
 # ------------------------------------
-def analyze_sentiment_transformers(text: str) -> Dict:
+# The pipeline is loaded once per worker process and reused across calls.
+_pipeline = None
+_pipeline_error = None
+_pipeline_lock = threading.Lock()
+
+_model_metrics = {
+    "model": HF_MODEL,
+    "loaded": False,
+    "load_time_ms": None,
+    "inference_count": 0,
+    "inference_items": 0,
+    "inference_time_ms_total": 0.0,
+    "inference_time_ms_last": None,
+}
+_metrics_lock = threading.Lock()
+
+
+def _resolve_device() -> int:
+    if HF_DEVICE == "cpu":
+        return -1
     try:
-        from transformers import pipeline
+        return int(HF_DEVICE)
+    except ValueError:
+        return -1
 
-        device = -1
-        if HF_DEVICE != "cpu":
-            try:
-                device = int(HF_DEVICE)
-            except:
-                device = -1
+
+def get_sentiment_pipeline():
+    """Return the process-wide sentiment pipeline, loading it on first use"""
+    global _pipeline, _pipeline_error
+
+    if _pipeline is not None:
+        return _pipeline
+    if _pipeline_error is not None:
+        raise _pipeline_error
+
+    with _pipeline_lock:
+        # Another thread may have finished loading while we waited
+        if _pipeline is not None:
+            return _pipeline
+        if _pipeline_error is not None:
+            raise _pipeline_error
+
+        try:
+            from transformers import pipeline
+        except ImportError:
+            # A missing library will not appear at runtime, so remember it
+            _pipeline_error = RuntimeError("Transformers library not installed")
+            raise _pipeline_error
+
+        device = _resolve_device()
+        started = time.perf_counter()
 
         # Try to load the specified model, fallback to default
         try:
             pipe = pipeline("sentiment-analysis", model=HF_MODEL, device=device)
-        except:
+        except Exception:
             pipe = pipeline("sentiment-analysis", device=device)
-            
-        result = pipe(text[:512])[0]
-
-        label = result["label"].lower()
-        raw_score = float(result["score"])
-
-        # Enhanced sentiment classification
-        if "positive" in label:
-            score = raw_score
-            sentiment = "positive" if score > 0.2 else "neutral"
-        elif "negative" in label:
-            score = -raw_score
-            sentiment = "negative" if score < -0.2 else "neutral"
-        elif "neutral" in label:
-            score = 0.0
-            sentiment = "neutral"
-        elif "5 stars" in label or "4 stars" in label:
-            score = raw_score
-            sentiment = "positive"
-        elif "1 star" in label or "2 stars" in label:
-            score = -raw_score
-            sentiment = "negative"
+
+        load_time_ms = (time.perf_counter() - started) * 1000
+        with _metrics_lock:
+            _model_metrics["loaded"] = True
+            _model_metrics["load_time_ms"] = round(load_time_ms, 2)
+
+        print(f"Loaded sentiment model {HF_MODEL} in {load_time_ms:.0f} ms")
+        _pipeline = pipe
+        return _pipeline
+
+
+def warm_up_sentiment_model() -> bool:
+    """Load the pipeline and run one inference so the first request is fast"""
+    try:
+        pool = _inference_pool
+        if pool is not None:
+            # The model lives in the worker processes, not in this one; warm
+            # all of them so no request waits for a cold worker
+            futures = [pool.submit(_warm_up_pool_worker) for _ in range(_inference_pool_workers)]
+            pids = {future.result(timeout=POOL_WARMUP_TIMEOUT) for future in futures}
+            if len(pids) != _inference_pool_workers:
+                raise RuntimeError(f"warmed {len(pids)} of {_inference_pool_workers} pool workers")
+        else:
+            get_sentiment_pipeline()("warm up")
+        return True
+    except BrokenProcessPool as e:
+        print("Sentiment model warm-up failed, running inference in-process:", e)
+        stop_inference_pool()
+        return False
+    except Exception as e:
+        print("Sentiment model warm-up failed:", e)
+        return False
+
+
+def _record_inference(elapsed_ms: float, items: int = 1):
+    with _metrics_lock:
+        _model_metrics["inference_count"] += 1
+        _model_metrics["inference_items"] += items
+        _model_metrics["inference_time_ms_total"] += elapsed_ms
+        _model_metrics["inference_time_ms_last"] = round(elapsed_ms, 2)
+
+
+def get_model_metrics() -> Dict:
+    """Snapshot of model load and inference timings for this process"""
+    with _metrics_lock:
+        metrics = dict(_model_metrics)
+    count = metrics["inference_count"]
+    metrics["inference_time_ms_avg"] = (
+        round(metrics["inference_time_ms_total"] / count, 2) if count else None
+    )
+    metrics["inference_time_ms_total"] = round(metrics["inference_time_ms_total"], 2)
+    metrics["inference_workers"] = _inference_pool_workers
+    return metrics
+
+# ------------------------------------
+# OUT-OF-PROCESS INFERENCE POOL
+# ------------------------------------
+# Keeps CPU-heavy inference off the request threads. Each worker process
+# loads its own copy of the model. The pool belongs to the process that
+# starts it, so every web worker (gunicorn worker, reloader child) starts its
+# own: a deployment runs web workers x SENTIMENT_INFERENCE_WORKERS model
+# processes, and memory grows with that product. With several web workers,
+# keep SENTIMENT_INFERENCE_WORKERS small (usually 1).
+_inference_pool = None
+_inference_pool_workers = 0
+_inference_pool_barrier = None
+_inference_pool_lock = threading.Lock()
+POOL_WARMUP_TIMEOUT = 120
+
+
+def _pool_worker_init(barrier=None):
+    global _inference_pool_barrier
+    _inference_pool_barrier = barrier
+    get_sentiment_pipeline()
+
+
+def _warm_up_pool_worker() -> int:
+    """Run one inference, then wait until every pool worker has done the same"""
+    _infer_transformers_local(["warm up"])
+    # A worker blocked here takes no other task, so each of the N warm-up
+    # tasks lands on a different worker
+    _inference_pool_barrier.wait(POOL_WARMUP_TIMEOUT)
+    return os.getpid()
+
+
+def start_inference_pool(workers: int = SENTIMENT_INFERENCE_WORKERS) -> bool:
+    """Start this process's model worker processes; returns False if workers < 1"""
+    global _inference_pool, _inference_pool_workers
+    if workers < 1:
+        return False
+    with _inference_pool_lock:
+        if _inference_pool is None:
+            # spawn: never fork a process that may hold model or thread state
+            context = multiprocessing.get_context("spawn")
+            _inference_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=context,
+                initializer=_pool_worker_init,
+                # Synchronization primitives reach the workers only by inheritance
+                initargs=(context.Barrier(workers),),
+            )
+            _inference_pool_workers = workers
+            atexit.register(stop_inference_pool)
+    return True
+
+
+def stop_inference_pool():
+    global _inference_pool, _inference_pool_workers
+    with _inference_pool_lock:
+        if _inference_pool is not None:
+            _inference_pool.shutdown(wait=False, cancel_futures=True)
+            _inference_pool = None
+            _inference_pool_workers = 0
+
+# ------------------------------------
+# TRANSFORMERS ANALYZER (Primary)
+# ------------------------------------
+def _classify_label(label: str, raw_score: float) -> Tuple[str, float]:
+    """Map a pipeline label/score pair to (sentiment, signed score)"""
+    label = label.lower()
+
+    # Enhanced sentiment classification
+    if "positive" in label:
+        score = raw_score
+        sentiment = "positive" if score > 0.2 else "neutral"
+    elif "negative" in label:
+        score = -raw_score
+        sentiment = "negative" if score < -0.2 else "neutral"
+    elif "neutral" in label:
+        score = 0.0
+        sentiment = "neutral"
+    elif "5 stars" in label or "4 stars" in label:
+        score = raw_score
+        sentiment = "positive"
+    elif "1 star" in label or "2 stars" in label:
+        score = -raw_score
+        sentiment = "negative"
+    else:
+        score = 0.0
+        sentiment = "neutral"
+
+    return sentiment, score
+
+
+def _infer_transformers(texts: List[str], timeout: float = SENTIMENT_INFERENCE_TIMEOUT) -> List[Tuple[str, float]]:
+    """Run one pipeline call over a list of texts, in the pool if one is running"""
+    pool = _inference_pool
+    if pool is None:
+        return _infer_transformers_local(texts)
+
+    started = time.perf_counter()
+    try:
+        results = pool.submit(_infer_transformers_local, texts).result(timeout=timeout)
+    except BrokenProcessPool:
+        # A worker died (e.g. the model failed to load); infer in-process from now on
+        print("Sentiment inference pool broke, running inference in-process")
+        stop_inference_pool()
+        raise
+    _record_inference((time.perf_counter() - started) * 1000, len(texts))
+    return results
+
+
+def _infer_transformers_local(texts: List[str]) -> List[Tuple[str, float]]:
+    """Run one pipeline call over a list of texts in this process"""
+    pipe = get_sentiment_pipeline()
+
+    started = time.perf_counter()
+    results = pipe([t[:512] for t in texts], batch_size=len(texts))
+    _record_inference((time.perf_counter() - started) * 1000, len(texts))
+
+    return [_classify_label(r["label"], float(r["score"])) for r in results]
+
+
+class SentimentBatcher:
+    """
+    Collects texts submitted from concurrent requests and scores them together.
+
+    A single worker thread waits for the first text, then keeps collecting
+    until it has max_batch_size texts or max_wait_ms has passed, and runs one
+    batched inference call. Each caller gets its result through a Future;
+    a caller that gives up cancels it, and cancelled texts are dropped
+    without taking a place in a batch.
+    """
+
+    def __init__(self, run_batch: Callable[[List[str]], List], max_batch_size: int = 16,
+                 max_wait_ms: float = 10):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((text, future))
+        return future
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="sentiment-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _collect(self) -> List:
+        """Wait for live texts and mark them running; callers can no longer cancel them"""
+        batch = []
+        while not batch:
+            entry = self._queue.get()
+            if entry[1].set_running_or_notify_cancel():
+                batch.append(entry)
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            # Skip callers that timed out while waiting in the queue
+            if entry[1].set_running_or_notify_cancel():
+                batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            live = self._collect()
+            try:
+                results = self.run_batch([t for t, _ in live])
+                for (_, future), result in zip(live, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in live:
+                    future.set_exception(e)
+            self.batches += 1
+            self.items += len(live)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_sentiment_batcher() -> SentimentBatcher:
+    """Return the process-wide batcher for transformers inference"""
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = SentimentBatcher(
+                    _infer_transformers,
+                    max_batch_size=SENTIMENT_BATCH_SIZE,
+                    max_wait_ms=SENTIMENT_BATCH_WAIT_MS,
+                )
+    return _batcher
+
+
+def analyze_sentiment_transformers(text: str, timeout: float = SENTIMENT_BATCH_TIMEOUT) -> Dict:
+    try:
+        if SENTIMENT_BATCHING:
+            future = get_sentiment_batcher().submit(text)
+            try:
+                sentiment, score = future.result(timeout=timeout)
+            except FutureTimeoutError:
+                # Still queued: drop it so it is not scored for nobody
+                future.cancel()
+                raise
         else:
-            score = 0.0
-            sentiment = "neutral"
+            sentiment, score = _infer_transformers([text], timeout=timeout)[0]
 
         return {
             "model_used": f"transformers:{HF_MODEL}",
@@ -189,22 +566,24 @@ def analyze_sentiment_transformers(text: str) -> Dict:
             "message": craft_enhanced_message(sentiment, score, text)
         }
 
-    except ImportError:
-        raise RuntimeError("Transformers library not installed")
+    except RuntimeError:
+        raise
     except Exception as e:
         raise RuntimeError(f"Transformers error: {e}")
 
 # ------------------------------------
 # GEMINI ANALYZER (Backup)
 # ------------------------------------
-def analyze_sentiment_gemini(text: str) -> Dict:
+def analyze_sentiment_gemini(text: str, timeout: float = 12) -> Dict:
     """
-    Uses Google Gemini (AI Studio key starting with AI...) to analyze sentiment.
+    Uses Google Gemini (AI Studio key starting with AI...) to analyze sentiment,
+    through the shared LLM provider.
     Returns:
       { model_used, sentiment, score, message }
     """
-    if not GEMINI_API_KEY:
-        raise RuntimeError("GEMINI_API_KEY not set")
+    provider = get_provider()
+    if provider is None:
+        raise RuntimeError("No LLM provider configured")
 
     system_instruction = (
         "You are a sentiment analysis assistant. Given the user's short text, return EXACTLY one JSON object "
@@ -217,28 +596,9 @@ def analyze_sentiment_gemini(text: str) -> Dict:
 
     user_prompt = f"Text: '''{text}'''\n\nReturn EXACT JSON."
 
-    # Gemini REST endpoint
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
-
-    payload = {
-        "contents": [
-            {"role": "system", "parts": [{"text": system_instruction}]},
-            {"role": "user", "parts": [{"text": user_prompt}]}
-        ]
-    }
-
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {GEMINI_API_KEY}"
-    }
-
     try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=12)
-        resp.raise_for_status()
-        data = resp.json()
-
-        # Extract the model response text
-        raw_text = data["candidates"][0]["content"]["parts"][0]["text"]
+        # Gemini, or whichever provider LLM_PROVIDER selects (see ai.providers)
+        raw_text = provider.generate(GEMINI_MODEL, f"{system_instruction}\n\n{user_prompt}", timeout=timeout)
 
         # Extract JSON substring
         m = re.search(r"(\{.*\})", raw_text, flags=re.DOTALL)
@@ -266,40 +626,41 @@ def analyze_sentiment_gemini(text: str) -> Dict:
 def analyze_sentiment_enhanced_rulebased(text: str) -> Dict:
     """Enhanced rule-based sentiment with intensity modifiers and phrases"""
     
-    words = re.findall(r"\b[\w']+\b", text.lower())
+    tokens, matches = SENTIMENT_LEXICON.scan(text)
+    word_count = len(tokens)
+    
+    # Longest word-level term starting at each token, plus which phrases occur
+    word_terms = {}
+    phrases = set()
+    for m in matches:
+        if m.category in _WORD_CATEGORIES:
+            word_terms[m.start] = m
+        else:
+            phrases.add(m.category)
+    
     score = 0.0
     intensity = 1.0
     negate_next = False
-    word_count = 0
     
-    for i, word in enumerate(words):
-        clean_word = re.sub(r'[^\w]', '', word)
+    i = 0
+    while i < word_count:
+        term = word_terms.get(i)
         
-        if not clean_word:
-            continue
-            
-        word_count += 1
-        
-        # Check for intensity modifiers
-        if clean_word in INTENSITY_MODIFIERS:
-            intensity = INTENSITY_MODIFIERS[clean_word]
+        # Check for intensity modifiers (may span several tokens)
+        if term is not None and term.category == "intensity":
+            intensity = term.weight
+            i = term.end
             continue
         
         # Check for negations
-        if clean_word in NEGATIONS:
+        if term is not None and term.category == "negation":
             negate_next = True
+            i = term.end
             continue
         
-        # Check positive words
-        if clean_word in POSITIVE_WORDS:
-            word_score = POSITIVE_WORDS[clean_word] * intensity
-            if negate_next:
-                word_score = -word_score * 0.7
-            score += word_score
-        
-        # Check negative words
-        elif clean_word in NEGATIVE_WORDS:
-            word_score = NEGATIVE_WORDS[clean_word] * intensity
+        # Check positive and negative words
+        if term is not None:
+            word_score = term.weight * intensity
             if negate_next:
                 word_score = -word_score * 0.7
             score += word_score
@@ -307,14 +668,14 @@ def analyze_sentiment_enhanced_rulebased(text: str) -> Dict:
         # Reset modifiers
         intensity = 1.0
         negate_next = False
+        i += 1
     
     # Check for common phrases
-    text_lower = text.lower()
-    if any(phrase in text_lower for phrase in ["not bad", "not too bad", "could be worse"]):
+    if "phrase_positive" in phrases:
         score += 0.3
-    if any(phrase in text_lower for phrase in ["not great", "not good", "not happy"]):
+    if "phrase_negative" in phrases:
         score -= 0.3
-    if any(phrase in text_lower for phrase in ["so so", "meh", "okay", "alright"]):
+    if "phrase_neutral" in phrases:
         score = max(-0.1, min(0.1, score))
     
     # Normalize score
@@ -371,6 +732,133 @@ def analyze_sentiment_rulebased(text: str) -> Dict:
 # ------------------------------------
 # MAIN FACADE
 # ------------------------------------
+def _with_multiplier(res: Dict) -> Dict:
+    sentiment = res["sentiment"]
+    return {
+        "model_used": res["model_used"],
+        "sentiment": sentiment,
+        "score": float(res["score"]),
+        "multiplier": pick_multiplier(sentiment),
+        "message": res["message"]
+    }
+
+def _from_cache(key: str, text: str):
+    cached = SENTIMENT_CACHE.get(key)
+    if cached is None:
+        return None
+    return _with_multiplier({
+        **cached,
+        "message": craft_enhanced_message(cached["sentiment"], cached["score"], text)
+    })
+
+def _cache_lookup(text: str):
+    """
+    Cached result of the best tier the chain would try now: a lower tier's
+    answer is only used while the tiers above it have an open breaker.
+    """
+    for name in _model_tiers():
+        cached = _from_cache(sentiment_cache_key(text, CACHED_TIER_MODELS[name]), text)
+        if cached is not None:
+            return cached
+        if not _BREAKERS[name].is_open():
+            return None
+    return None
+
+def _store_in_cache(text: str, res: Dict) -> Dict:
+    """Cache a model tier's result under that model; other results pass through"""
+    if res["model_used"] in CACHED_TIER_MODELS.values():
+        SENTIMENT_CACHE.set(sentiment_cache_key(text, res["model_used"]), {
+            "model_used": res["model_used"],
+            "sentiment": res["sentiment"],
+            "score": res["score"]
+        })
+    return res
+
+# Model tiers are guarded by a breaker; rule-based tiers always run
+_BREAKERS = {
+    name: CircuitBreaker(name, SENTIMENT_BREAKER_THRESHOLD, SENTIMENT_BREAKER_COOLDOWN)
+    for name in ("transformers", "gemini")
+}
+_TIER_STATS = {
+    name: TierStats(name)
+    for name in ("transformers", "gemini", "enhanced-rule-based", "simple-rule-based")
+}
+
+def _guarded_call(name: str, call: Callable, deadline: float, final: bool = False):
+    """
+    Run a tier's call, or skip it when its breaker is open or it is not
+    expected to finish within what is left of the latency budget. Model
+    tiers get the remaining budget as call(timeout=...). Returns the call's
+    result, or None to move on to the next tier. Errors from the final tier
+    are re-raised since there is nothing left to try.
+    """
+    stats = _TIER_STATS[name]
+    breaker = _BREAKERS.get(name)
+
+    if breaker is not None:
+        remaining = deadline - time.monotonic()
+        expected_ms = stats.expected_latency_ms()
+        if remaining <= 0 or (expected_ms is not None and expected_ms / 1000 > remaining):
+            stats.record_skip("budget")
+            return None
+        if not breaker.allow():
+            stats.record_skip(OPEN)
+            return None
+
+    started = time.perf_counter()
+    try:
+        if breaker is not None:
+            res = call(timeout=max(0.1, deadline - time.monotonic()))
+        else:
+            res = call()
+    except Exception as e:
+        stats.record(False, (time.perf_counter() - started) * 1000)
+        if breaker is not None:
+            breaker.record_failure()
+        if final:
+            raise
+        print(f"{name} failed:", e)
+        return None
+
+    stats.record(True, (time.perf_counter() - started) * 1000)
+    if breaker is not None:
+        breaker.record_success()
+    return res
+
+def _run_tier(name: str, analyze: Callable, text: str, deadline: float, final: bool = False):
+    """One tier of the chain for one text; the facade result or None"""
+    res = _guarded_call(name, lambda **kwargs: analyze(text, **kwargs), deadline, final)
+    return _with_multiplier(res) if res is not None else None
+
+def _model_tiers() -> List[str]:
+    """Model tiers of the chain, in order"""
+    return ["transformers", "gemini"] if provider_configured() else ["transformers"]
+
+def _analyze_uncached(text: str) -> Dict:
+    deadline = time.monotonic() + SENTIMENT_LATENCY_BUDGET_MS / 1000
+
+    tiers = [("transformers", analyze_sentiment_transformers)]       # 1) Primary - most reliable
+    if provider_configured():
+        tiers.append(("gemini", analyze_sentiment_gemini))           # 2) If an LLM is configured
+    tiers.append(("enhanced-rule-based", analyze_sentiment_enhanced_rulebased))  # 3)
+
+    for name, analyze in tiers:
+        res = _run_tier(name, analyze, text, deadline)
+        if res is not None:
+            return res
+
+    # 4) Simple rule-based fallback
+    return _run_tier("simple-rule-based", analyze_sentiment_rulebased, text, deadline, final=True)
+
+def get_tier_metrics() -> Dict:
+    """Per-tier counters and breaker states of the fallback chain"""
+    metrics = {}
+    for name, stats in _TIER_STATS.items():
+        metrics[name] = stats.snapshot()
+        if name in _BREAKERS:
+            metrics[name]["breaker"] = _BREAKERS[name].snapshot()
+    return metrics
+
 def analyze_sentiment(text: str) -> Dict:
     text = (text or "").strip()
 
@@ -385,63 +873,48 @@ def analyze_sentiment(text: str) -> Dict:
             "message": craft_enhanced_message(sentiment, score, "")
         }
 
-    # 1) Transformers (Primary - most reliable)
-    try:
-        res = analyze_sentiment_transformers(text)
-        sentiment = res["sentiment"]
-        score = float(res["score"])
-        return {
-            "model_used": res["model_used"],
-            "sentiment": sentiment,
-            "score": score,
-            "multiplier": pick_multiplier(sentiment),
-            "message": res["message"]
-        }
-    except Exception as e:
-        print("Transformers failed:", e)
+    cached = _cache_lookup(text)
+    if cached is not None:
+        return cached
 
-    # 2) Gemini (if API key exists)
-    if GEMINI_API_KEY:
-        try:
-            res = analyze_sentiment_gemini(text)
-            sentiment = res["sentiment"]
-            score = float(res["score"])
-            return {
-                "model_used": res["model_used"],
+    return _store_in_cache(text, _analyze_uncached(text))
+
+def analyze_sentiment_batch(texts: List[str]) -> List[Dict]:
+    """
+    Analyze many texts at once. Transformers scores all non-empty texts in a
+    single batched call, behind the same breaker and latency budget as a
+    single call; anything it cannot score goes through the normal fallback
+    chain one by one. Results are returned in input order.
+    """
+    cleaned = [(t or "").strip() for t in texts]
+    results = [None] * len(cleaned)
+    pending = []
+
+    for i, text in enumerate(cleaned):
+        if text:
+            results[i] = _cache_lookup(text)
+            if results[i] is None:
+                pending.append(i)
+
+    if pending:
+        deadline = time.monotonic() + SENTIMENT_LATENCY_BUDGET_MS / 1000
+        scored = _guarded_call(
+            "transformers",
+            lambda timeout: _infer_transformers([cleaned[i] for i in pending], timeout=timeout),
+            deadline
+        )
+        for i, (sentiment, score) in zip(pending, scored or []):
+            results[i] = _store_in_cache(cleaned[i], _with_multiplier({
+                "model_used": CACHED_TIER_MODELS["transformers"],
                 "sentiment": sentiment,
                 "score": score,
-                "multiplier": pick_multiplier(sentiment),
-                "message": res["message"]
-            }
-        except Exception as e:
-            print("Gemini failed:", e)
+                "message": craft_enhanced_message(sentiment, score, cleaned[i])
+            }))
 
-    # 3) Enhanced rule-based
-    try:
-        res = analyze_sentiment_enhanced_rulebased(text)
-        sentiment = res["sentiment"]
-        score = float(res["score"])
-        return {
-            "model_used": res["model_used"],
-            "sentiment": sentiment,
-            "score": score,
-            "multiplier": pick_multiplier(sentiment),
-            "message": res["message"]
-        }
-    except Exception as e:
-        print("Enhanced rule-based failed:", e)
-
-    # 4) Simple rule-based fallback
-    res = analyze_sentiment_rulebased(text)
-    sentiment = res["sentiment"]
-    score = float(res["score"])
-    return {
-        "model_used": "simple-rule-based",
-        "sentiment": sentiment,
-        "score": score,
-        "multiplier": pick_multiplier(sentiment),
-        "message": res["message"]
-    }
+    return [
+        res if res is not None else analyze_sentiment(text)
+        for res, text in zip(results, cleaned)
+    ]
 
 # Standalone test
 if __name__ == "__main__":
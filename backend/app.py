@@ -1,12 +1,21 @@
 import os
 import logging
+import threading
 from flask import Flask, jsonify
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager
+from flask_jwt_extended import JWTManager, jwt_required
 from dotenv import load_dotenv
+from werkzeug.serving import is_running_from_reloader
 
 from app.config import config
-from app.database import init_db
+from app.database import init_db, db_instance
+from app.sentiment_jobs import start_sentiment_workers, get_sentiment_job_metrics
+from app.write_behind import start_write_behind, get_write_behind_metrics
+from app.llm import get_llm_metrics
+from ai.sentiment import (
+    warm_up_sentiment_model, start_inference_pool, get_model_metrics,
+    get_cache_metrics, get_tier_metrics, SENTIMENT_INFERENCE_WORKERS
+)
 
 # Import route blueprints
 from app.routes.auth_routes import auth_bp
@@ -15,7 +24,7 @@ from app.routes.quest_routes import quest_bp
 from app.routes.boss_routes import boss_bp
 from app.routes.activity_routes import activity_bp
 from app.routes.guild_routes import guild_bp
-from app.routes.ai_routes import ai_bp
+from app.routes.ai_routes import ai_bp, NARRATIVE_POOL, prefill_coaching_pools, get_coaching_metrics
 from app.routes.calendar_routes import calendar_bp
 from app.routes.leaderboard_routes import leaderboard_bp
 
@@ -29,6 +38,51 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+_background_started = False
+_background_lock = threading.Lock()
+
+
+def start_background_services(app):
+    """
+    Start the inference pool, model warm-up, write-behind buffer and
+    sentiment job workers, once per serving process. Not part of create_app:
+    importing this module (e.g. a spawned inference worker re-importing it,
+    or a reloader parent) must not start processes or threads.
+    """
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+    
+    db_connected = app.config['DB_CONNECTED']
+    
+    # Optionally run model inference in separate worker processes
+    if start_inference_pool(SENTIMENT_INFERENCE_WORKERS):
+        logger.info(f"✅ Sentiment inference pool started with {SENTIMENT_INFERENCE_WORKERS} workers "
+                    f"in web worker {os.getpid()}")
+    
+    # Optionally load the sentiment model before serving requests
+    if app.config['SENTIMENT_WARMUP']:
+        if warm_up_sentiment_model():
+            logger.info("✅ Sentiment model warmed up")
+        else:
+            logger.warning("⚠️ Sentiment model warm-up failed, will load on first use")
+    
+    # Coalesce XP and daily stats increments before writing them
+    if app.config['WRITE_BEHIND_ENABLED'] and db_connected:
+        start_write_behind(db_instance)
+    
+    # Background scoring of reflections logged in async mode
+    if app.config['ACTIVITY_SENTIMENT_ASYNC'] and db_connected:
+        start_sentiment_workers(
+            db_instance,
+            app.config['SENTIMENT_JOB_WORKERS'],
+            app.config['SENTIMENT_JOB_LEASE_SECONDS'],
+            app.config['SENTIMENT_JOB_POLL_INTERVAL']
+        )
+
+
 def create_app(config_name='development'):
     """Application factory pattern"""
     
@@ -53,9 +107,31 @@ def create_app(config_name='development'):
         db_connected = init_db(app)
         if not db_connected:
             logger.warning(" Running without database connection")
-        
+    app.config['DB_CONNECTED'] = db_connected
+    
+    # In lazy startup mode build indexes once the first request has been served
+    if app.config['LAZY_STARTUP'] and db_connected:
+        @app.after_request
+        def build_indexes_after_first_request(response):
+            response.call_on_close(db_instance.create_indexes_in_background)
+            return response
+    
+    # Servers that only import the app (e.g. gunicorn) start the background
+    # services with the first request; `python app.py` starts them before serving
+    @app.before_request
+    def start_background_services_on_first_request():
+        start_background_services(app)
+    
+    # Optionally pre-generate coaching messages once this worker serves its
+    # first request (a reloader parent never does); otherwise pools fill on first use
+    if app.config['COACHING_PREFILL']:
+        @app.after_request
+        def prefill_coaching_after_first_request(response):
+            response.call_on_close(prefill_coaching_pools)
+            return response
+    
     # Import recommendations blueprint
-    from app.routes.recommendations_routes import recommendations_bp
+    from app.routes.recommendations_routes import recommendations_bp, RECOMMENDATION_CACHE
     
     # Register blueprints
     app.register_blueprint(auth_bp)
@@ -93,6 +169,23 @@ def create_app(config_name='development'):
             'database': 'connected'
         })
     
+    # Runtime metrics, only when enabled and for authenticated callers
+    if app.config['METRICS_ENABLED']:
+        @app.route('/metrics')
+        @jwt_required()
+        def metrics():
+            return jsonify({
+                'sentiment_model': get_model_metrics(),
+                'sentiment_cache': get_cache_metrics(),
+                'sentiment_tiers': get_tier_metrics(),
+                'sentiment_jobs': get_sentiment_job_metrics(),
+                'write_behind': get_write_behind_metrics(),
+                'narrative_pool': NARRATIVE_POOL.stats(),
+                'coaching': get_coaching_metrics(),
+                'llm': get_llm_metrics(),
+                'recommendation_cache': RECOMMENDATION_CACHE.stats()
+            })
+    
     # Error handlers
     @app.errorhandler(404)
     def not_found(error):
@@ -128,12 +221,18 @@ def create_app(config_name='development'):
     
     return app
 
-# Create app instance
-app = create_app(os.getenv('FLASK_ENV', 'development'))
+# Create app instance. Spawned inference workers re-import this file as
+# __mp_main__; they only need ai.sentiment, not a database connection.
+if __name__ != '__mp_main__':
+    app = create_app(os.getenv('FLASK_ENV', 'development'))
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     
+    # The reloader's parent process only watches files; the child serves
+    if is_running_from_reloader():
+        start_background_services(app)
+    
     logger.info(f"""
     ╔════════════════════════════════════════╗
     ║      HEALTHQUEST API SERVER            ║
@@ -0,0 +1,124 @@
+"""
+Streaming export of a user's complete history.
+
+Activities, daily stats and quest progress are read with cursors of
+EXPORT_BATCH_SIZE documents and turned into NDJSON lines or CSV rows one
+document at a time. Output is yielded in chunks of about EXPORT_CHUNK_BYTES,
+optionally gzip-compressed as it goes. Only one batch and one chunk are held
+in memory at a time, whatever the size of the history.
+
+Every record has a type ('activity', 'daily_stat' or 'quest_progress'), an
+id and a date (the activity timestamp or the day), plus that type's fields.
+CSV rows share one header; fields a type does not have are left empty and
+nested values are JSON-encoded.
+"""
+
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 500))
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# (record type, collection, date field, exported fields)
+EXPORT_SOURCES = (
+    ('activity', 'activities', 'timestamp',
+     ('reflection', 'sentiment', 'multiplier', 'xp_earned', 'activities', 'mood', 'category')),
+    ('daily_stat', 'daily_stats', 'date',
+     ('activities_logged', 'xp_gained', 'quests_completed', 'activity_entries', 'activity_totals')),
+    ('quest_progress', 'quest_progress', 'date', ('completed_quests',)),
+)
+
+CSV_COLUMNS = ('type', 'id', 'date') + tuple(dict.fromkeys(
+    field for _, _, _, fields in EXPORT_SOURCES for field in fields
+))
+
+
+def export_records(db, user_id, batch_size=EXPORT_BATCH_SIZE):
+    """Yield the user's records, oldest first within each type"""
+    for record_type, collection, date_field, fields in EXPORT_SOURCES:
+        projection = {field: 1 for field in (date_field, *fields)}
+        cursor = (db.get_collection(collection)
+                  .find({'user_id': user_id}, projection)
+                  .sort([(date_field, 1), ('_id', 1)])
+                  .batch_size(batch_size))
+        try:
+            for doc in cursor:
+                record = {'type': record_type, 'id': str(doc['_id']), 'date': doc.get(date_field)}
+                for field in fields:
+                    if field in doc:
+                        record[field] = doc[field]
+                yield record
+        finally:
+            cursor.close()
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record, default=_json_default) + '\n'
+
+
+def csv_lines(records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(row):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+        return buffer.getvalue()
+
+    yield line(CSV_COLUMNS)
+    for record in records:
+        row = []
+        for column in CSV_COLUMNS:
+            value = record.get(column)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            elif isinstance(value, (dict, list)):
+                value = json.dumps(value, default=_json_default)
+            row.append('' if value is None else value)
+        yield line(row)
+
+
+def chunked(lines, chunk_bytes=EXPORT_CHUNK_BYTES):
+    """Join lines into encoded chunks of about chunk_bytes"""
+    parts = []
+    size = 0
+    for text in lines:
+        data = text.encode('utf-8')
+        parts.append(data)
+        size += len(data)
+        if size >= chunk_bytes:
+            yield b''.join(parts)
+            parts = []
+            size = 0
+    if parts:
+        yield b''.join(parts)
+
+
+def gzipped(chunks):
+    """Compress a stream of chunks into one gzip member on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(db, user_id, export_format='ndjson', gzip=False, batch_size=EXPORT_BATCH_SIZE):
+    """Byte chunks of the user's export in the given format"""
+    records = export_records(db, user_id, batch_size)
+    lines = csv_lines(records) if export_format == 'csv' else ndjson_lines(records)
+    chunks = chunked(lines)
+    return gzipped(chunks) if gzip else chunks
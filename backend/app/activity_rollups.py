@@ -0,0 +1,219 @@
+"""
+Per-user activity summaries computed in MongoDB.
+
+The recommendation prompts need averages of the tracked activities (steps,
+meditation, water, sleep) over the last 7 and 30 days. Rather than loading
+every activity into Python, log_activity adds each entry's values to that
+day's daily_stats document (activity_totals.* and activity_entries), and
+summaries are a single $group over at most 30 of those day documents, no
+matter how many entries a user logs.
+
+Users get activity_rollups_since when they register or first log after this
+was introduced. A window that starts before it still has activities that
+were never rolled up, so it is aggregated from the activities collection
+instead (also server-side). rebuild_activity_rollups backfills the day
+totals for an existing user.
+
+Both the fallback aggregation and the rebuild group activities by day with
+$dateTrunc, which needs MongoDB 5.0 or later.
+
+Backfill every user whose rollups do not cover their whole history, or one
+user, from the backend directory:
+    python -m app.activity_rollups --rebuild
+    python -m app.activity_rollups --rebuild --user <user id>
+"""
+
+import argparse
+import logging
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from app.config import Config
+from app.daily_stats import day_start
+
+logger = logging.getLogger(__name__)
+
+# Tracked activity keys (as sent by the activity logger) -> summary names
+TRACKED_ACTIVITIES = {
+    'steps': 'steps',
+    'meditation': 'meditation',
+    'water': 'water',
+    'sleep': 'sleep'
+}
+
+SUMMARY_WINDOWS = (7, 30)
+
+
+def activities_error(activities):
+    """Why an activity's activities field cannot be stored, or None"""
+    if not isinstance(activities, dict):
+        return 'activities must be an object'
+    for key, value in activities.items():
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+            return f'activities.{key} must be a non-negative number'
+    return None
+
+
+def rollup_increments(activities):
+    """$inc fields that add one activity entry to its day's totals"""
+    increments = {'activity_entries': 1}
+    for key in TRACKED_ACTIVITIES:
+        value = activities.get(key)
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0:
+            increments[f'activity_totals.{key}'] = value
+    return increments
+
+
+def _window_group(windows, date_field, now):
+    """$group stage with entry count, distinct days and per-activity sums for each window"""
+    group = {'_id': None}
+    for days in windows:
+        start = day_start(now) - timedelta(days=days - 1)
+        in_window = {'$gte': [f'${date_field}', start]}
+        group[f'entries_{days}'] = {'$sum': {'$cond': [in_window, '$entries', 0]}}
+        group[f'days_{days}'] = {
+            '$sum': {'$cond': [{'$and': [in_window, {'$gt': ['$entries', 0]}]}, 1, 0]}
+        }
+        for key in TRACKED_ACTIVITIES:
+            group[f'{key}_{days}'] = {'$sum': {'$cond': [in_window, f'${key}', 0]}}
+    return group
+
+
+def _rollup_pipeline(user_id, windows, now):
+    start = day_start(now) - timedelta(days=max(windows) - 1)
+    project = {'date': 1, 'entries': {'$ifNull': ['$activity_entries', 0]}}
+    for key in TRACKED_ACTIVITIES:
+        project[key] = {'$ifNull': [f'$activity_totals.{key}', 0]}
+    return [
+        {'$match': {'user_id': user_id, 'date': {'$gte': start}}},
+        {'$project': project},
+        {'$group': _window_group(windows, 'date', now)}
+    ]
+
+
+def _activities_pipeline(user_id, windows, now):
+    start = day_start(now) - timedelta(days=max(windows) - 1)
+    per_day = {
+        '_id': {'$dateTrunc': {'date': '$timestamp', 'unit': 'day'}},
+        'entries': {'$sum': 1}
+    }
+    for key in TRACKED_ACTIVITIES:
+        per_day[key] = {'$sum': {'$ifNull': [f'$activities.{key}', 0]}}
+    return [
+        {'$match': {'user_id': user_id, 'timestamp': {'$gte': start}}},
+        {'$group': per_day},
+        {'$group': _window_group(windows, '_id', now)}
+    ]
+
+
+def _format_windows(row, windows):
+    summaries = {}
+    for days in windows:
+        entries = row.get(f'entries_{days}', 0) if row else 0
+        summary = {'days_logged': row.get(f'days_{days}', 0) if row else 0, 'entries': entries}
+        for key, name in TRACKED_ACTIVITIES.items():
+            total = row.get(f'{key}_{days}', 0) if row else 0
+            summary[f'avg_{name}'] = total / entries if entries else 0
+        summary['avg_steps'] = int(summary['avg_steps'])
+        summary['avg_meditation'] = int(summary['avg_meditation'])
+        summary['avg_water'] = int(summary['avg_water'])
+        summary['avg_sleep'] = round(summary['avg_sleep'], 1)
+        summaries[days] = summary
+    return summaries
+
+
+def summarize_activity(db, user, windows=SUMMARY_WINDOWS):
+    """
+    Return {days: summary} for each window, where a summary has days_logged,
+    entries and per-entry averages of the tracked activities.
+    """
+    now = datetime.utcnow()
+    oldest = day_start(now) - timedelta(days=max(windows) - 1)
+    since = user.get('activity_rollups_since')
+
+    if since is not None and since <= oldest:
+        rows = list(db.daily_stats.aggregate(_rollup_pipeline(user['_id'], windows, now)))
+    else:
+        rows = list(db.activities.aggregate(_activities_pipeline(user['_id'], windows, now)))
+
+    return _format_windows(rows[0] if rows else None, windows)
+
+
+def rebuild_activity_rollups(db, user):
+    """
+    Recompute a user's day totals from their activities and mark the rollups
+    complete. Maintenance task for users who logged before rollups existed;
+    entries logged while it runs may be counted twice or not at all.
+    """
+    per_day = {
+        '_id': {'$dateTrunc': {'date': '$timestamp', 'unit': 'day'}},
+        'entries': {'$sum': 1}
+    }
+    for key in TRACKED_ACTIVITIES:
+        per_day[key] = {'$sum': {'$ifNull': [f'$activities.{key}', 0]}}
+
+    operations = []
+    for day in db.activities.aggregate([{'$match': {'user_id': user['_id']}}, {'$group': per_day}]):
+        totals = {f'activity_totals.{key}': day[key] for key in TRACKED_ACTIVITIES}
+        totals['activity_entries'] = day['entries']
+        operations.append(UpdateOne(
+            {'user_id': user['_id'], 'date': day['_id']},
+            {'$set': totals, '$setOnInsert': {'activities_logged': day['entries'], 'xp_gained': 0, 'quests_completed': 0}},
+            upsert=True
+        ))
+
+    if operations:
+        db.daily_stats.bulk_write(operations, ordered=False)
+
+    db.users.update_one(
+        {'_id': user['_id']},
+        {'$set': {'activity_rollups_since': user.get('created_at') or datetime(1970, 1, 1)}}
+    )
+    logger.info(f"Rebuilt activity rollups for {len(operations)} days of user {user['_id']}")
+    return len(operations)
+
+
+def users_needing_rebuild(db):
+    """Users whose activity_rollups_since is missing or later than their registration"""
+    return db.users.find(
+        {'$expr': {'$ne': ['$activity_rollups_since', {'$ifNull': ['$created_at', datetime(1970, 1, 1)]}]}},
+        {'created_at': 1}
+    )
+
+
+def main():
+    from app.database import db_instance
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rebuild', action='store_true', help='backfill the day totals from the activities')
+    parser.add_argument('--user', help='only rebuild this user id')
+    parser.add_argument('--mongo-uri', default=Config.MONGO_URI)
+    args = parser.parse_args()
+
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    if not db_instance.connect(args.mongo_uri):
+        raise SystemExit("Could not connect to MongoDB")
+
+    if args.user:
+        user = db_instance.users.find_one({'_id': ObjectId(args.user)}, {'created_at': 1})
+        if not user:
+            raise SystemExit(f"User {args.user} not found")
+        users = [user]
+    else:
+        users = users_needing_rebuild(db_instance)
+
+    rebuilt = days = 0
+    for user in users:
+        days += rebuild_activity_rollups(db_instance, user)
+        rebuilt += 1
+    print(f"Rebuilt activity rollups for {rebuilt} users ({days} days)")
+
+
+if __name__ == '__main__':
+    main()
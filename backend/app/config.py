@@ -31,6 +31,38 @@ class Config:
     DAILY_QUEST_COUNT = 5
     QUEST_TYPES = ['steps', 'meditation', 'water', 'sleep', 'exercise']
     
+    # Startup Configuration
+    # Skip the MongoDB ping and build indexes in the background after the first
+    # request, so new workers start serving sooner
+    LAZY_STARTUP = os.getenv('LAZY_STARTUP', 'false').lower() == 'true'
+    
+    # Generate the coaching message pools for every band (27 bands x
+    # COACHING_POOL_SIZE LLM calls) after the first request each worker serves.
+    # Off by default: the pools then fill per band on first use
+    COACHING_PREFILL = os.getenv('COACHING_PREFILL', 'false').lower() == 'true'
+    
+    # Serve runtime metrics at /metrics (requires a JWT); off by default
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+    
+    # Sentiment Configuration
+    # Load the transformers model while the app boots instead of on the first reflection
+    SENTIMENT_WARMUP = os.getenv('SENTIMENT_WARMUP', 'false').lower() == 'true'
+    # Log activities immediately and score reflections in background workers
+    ACTIVITY_SENTIMENT_ASYNC = os.getenv('ACTIVITY_SENTIMENT_ASYNC', 'false').lower() == 'true'
+    SENTIMENT_JOB_WORKERS = int(os.getenv('SENTIMENT_JOB_WORKERS', 2))
+    SENTIMENT_JOB_LEASE_SECONDS = int(os.getenv('SENTIMENT_JOB_LEASE_SECONDS', 60))
+    SENTIMENT_JOB_POLL_INTERVAL = float(os.getenv('SENTIMENT_JOB_POLL_INTERVAL', 1.0))
+    # Finished jobs are deleted this long after they finish
+    SENTIMENT_JOB_RETENTION_DAYS = int(os.getenv('SENTIMENT_JOB_RETENTION_DAYS', 7))
+    
+    # Write-behind Configuration
+    # Coalesce XP and daily stats increments in memory and flush them in bulk
+    WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', 'false').lower() == 'true'
+    WRITE_BEHIND_WINDOW_MS = int(os.getenv('WRITE_BEHIND_WINDOW_MS', 250))
+    WRITE_BEHIND_MAX_PENDING = int(os.getenv('WRITE_BEHIND_MAX_PENDING', 10000))
+    # Updates that could not be written are kept here and replayed
+    WRITE_BEHIND_SPILL_PATH = os.getenv('WRITE_BEHIND_SPILL_PATH', 'write_behind_spill.jsonl')
+    
     @staticmethod
     def init_app(app):
         pass
@@ -0,0 +1,134 @@
+"""
+Pools of pre-generated AI content, refilled in the background.
+
+Each key (e.g. activity type and level band) has its own queue of ready
+items. Requests take an item in O(1) and never wait for the generator; when
+a pool runs low a background thread tops it up by calling generate(key).
+An empty pool simply returns None so the caller can use its template
+fallback.
+
+With rotate=True items are not consumed: pop returns the next item in turn
+and moves it to the back, so a full pool keeps serving variety without
+calling the generator again.
+"""
+
+import logging
+import threading
+from collections import defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+
+class ContentPool:
+    def __init__(self, generate, target_size=5, name='content', retry_delay=30, rotate=False):
+        self.generate = generate
+        self.target_size = max(1, target_size)
+        self.name = name
+        self.retry_delay = retry_delay
+        self.rotate = rotate
+        self._pools = defaultdict(deque)
+        self._pending = deque()
+        self._scheduled = set()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._worker = None
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.failures = 0
+
+    def pop(self, key):
+        """Take a ready item for key, or None if the pool is empty"""
+        with self._lock:
+            pool = self._pools[key]
+            if not pool:
+                item = None
+            elif self.rotate:
+                item = pool[0]
+                pool.rotate(-1)
+            else:
+                item = pool.popleft()
+            if item is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            low = len(pool) < self.target_size
+        if low:
+            self.schedule_refill(key)
+        return item
+
+    def prefill(self, keys):
+        """Ask the background thread to fill the pools for these keys"""
+        for key in keys:
+            self.schedule_refill(key)
+
+    def schedule_refill(self, key):
+        with self._lock:
+            if key in self._scheduled:
+                return
+            self._scheduled.add(key)
+            self._pending.append(key)
+            self._ensure_worker()
+        self._wake.set()
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            self._worker = threading.Thread(
+                target=self._run, name=f"{self.name}-refill", daemon=True
+            )
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            with self._lock:
+                key = self._pending.popleft() if self._pending else None
+                if key is None:
+                    self._wake.clear()
+                    continue
+            self._refill(key)
+
+    def _refill(self, key):
+        while True:
+            with self._lock:
+                if len(self._pools[key]) >= self.target_size:
+                    self._scheduled.discard(key)
+                    return
+            try:
+                item = self.generate(key)
+            except Exception as e:
+                logger.warning(f"{self.name} pool refill failed for {key}: {e}")
+                item = None
+
+            if item is None:
+                with self._lock:
+                    self.failures += 1
+                # Leave the key scheduled and retry later instead of hammering the generator
+                timer = threading.Timer(self.retry_delay, self._retry, args=(key,))
+                timer.daemon = True
+                timer.start()
+                return
+
+            with self._lock:
+                self._pools[key].append(item)
+                self.generated += 1
+
+    def _retry(self, key):
+        with self._lock:
+            self._pending.append(key)
+        self._wake.set()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'target_size': self.target_size,
+                'rotate': self.rotate,
+                'ready_items': sum(len(p) for p in self._pools.values()),
+                'keys': len(self._pools),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'generated': self.generated,
+                'failures': self.failures
+            }
@@ -0,0 +1,152 @@
+"""
+Atomic writes to the per-user daily_stats documents.
+
+There is one document per (user_id, date), where date is the UTC day start.
+Every writer adds to it with a single update_one(..., upsert=True): $inc for
+the counters being changed and $setOnInsert for the remaining counters, so
+the first write of the day creates the document and concurrent writers never
+read-then-insert their way into duplicate days. The unique (user_id, date)
+index created in Database._create_indexes backs this up. An upsert that
+loses the race to insert the day fails on that index and is retried once,
+as an update of the document that now exists.
+
+While the write-behind buffer runs (WRITE_BEHIND_ENABLED), increments are
+buffered and merged there instead, with the same retry on flush. Callers
+that record the increment as applied pass confirm=True, which writes it
+before returning.
+
+Deployments that raced before the index existed may hold duplicate day
+documents, which makes the index build fail. Merge them first, from the
+backend directory:
+    python -m app.daily_stats --merge-duplicates
+"""
+
+import argparse
+import logging
+from datetime import datetime
+
+from pymongo import DeleteMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from app.config import Config
+from app.write_behind import WRITE_BEHIND, confirmed_update
+
+logger = logging.getLogger(__name__)
+
+# Counters every day document starts with
+DAILY_COUNTERS = ('activities_logged', 'xp_gained', 'quests_completed')
+
+
+def day_start(moment=None):
+    return (moment or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def daily_stats_update(increments):
+    """$inc the given counters, starting the other counters at 0 on insert"""
+    return {
+        '$inc': increments,
+        '$setOnInsert': {field: 0 for field in DAILY_COUNTERS if field not in increments}
+    }
+
+
+def daily_stats_operation(user_id, date, increments):
+    """UpdateOne for bulk_write; date must already be a day start"""
+    return UpdateOne({'user_id': user_id, 'date': date}, daily_stats_update(increments), upsert=True)
+
+
+def increment_daily_stats(db, user_id, increments, moment=None, confirm=False):
+    """Add increments to the user's day document in one round trip (or buffered, unless confirm)"""
+    query = {'user_id': user_id, 'date': day_start(moment)}
+    update = daily_stats_update(increments)
+    if WRITE_BEHIND.running:
+        if confirm:
+            confirmed_update(db, 'daily_stats', query, update, upsert=True)
+        else:
+            WRITE_BEHIND.update('daily_stats', query, update, upsert=True)
+        return
+    try:
+        db.daily_stats.update_one(query, update, upsert=True)
+    except DuplicateKeyError:
+        # Two upserts raced to insert the day; the document exists now
+        db.daily_stats.update_one(query, update, upsert=True)
+
+
+def increment_daily_stats_by_day(db, user_id, day_deltas, confirm=False):
+    """Add {day start: increments} to the user's day documents in one bulk_write (or buffered, unless confirm)"""
+    if WRITE_BEHIND.running:
+        for day, increments in sorted(day_deltas.items()):
+            query = {'user_id': user_id, 'date': day}
+            if confirm:
+                confirmed_update(db, 'daily_stats', query, daily_stats_update(increments), upsert=True)
+            else:
+                WRITE_BEHIND.update('daily_stats', query, daily_stats_update(increments), upsert=True)
+        return
+    operations = [daily_stats_operation(user_id, day, increments) for day, increments in sorted(day_deltas.items())]
+    if not operations:
+        return
+    try:
+        db.daily_stats.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        if any(error.get('code') != 11000 for error in errors):
+            raise
+        # Upserts that raced another insert of the same day; the documents exist now
+        db.daily_stats.bulk_write([operations[error['index']] for error in errors], ordered=False)
+
+
+def merge_duplicate_days(db):
+    """Fold duplicate (user_id, date) documents into the oldest one"""
+    merged = 0
+    duplicates = db.daily_stats.aggregate([
+        {'$group': {'_id': {'user_id': '$user_id', 'date': '$date'}, 'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}}
+    ], allowDiskUse=True)
+
+    for group in duplicates:
+        keep, *extra = sorted(group['ids'])
+        increments = {}
+        for doc in db.daily_stats.find({'_id': {'$in': extra}}):
+            for field, value in _numeric_fields(doc):
+                increments[field] = increments.get(field, 0) + value
+        operations = [DeleteMany({'_id': {'$in': extra}})]
+        if increments:
+            operations.insert(0, UpdateOne({'_id': keep}, {'$inc': increments}))
+        db.daily_stats.bulk_write(operations)
+        merged += len(extra)
+
+    logger.info(f"Merged {merged} duplicate daily_stats documents")
+    return merged
+
+
+def _numeric_fields(doc, prefix=''):
+    """Yield (dotted path, value) for the counters in a day document"""
+    for key, value in doc.items():
+        if key in ('_id', 'user_id', 'date'):
+            continue
+        if isinstance(value, dict):
+            yield from _numeric_fields(value, f'{prefix}{key}.')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f'{prefix}{key}', value
+
+
+def main():
+    from app.database import db_instance
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--merge-duplicates', action='store_true', help='merge duplicate day documents')
+    parser.add_argument('--mongo-uri', default=Config.MONGO_URI)
+    args = parser.parse_args()
+
+    if not args.merge_duplicates:
+        parser.print_help()
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    if not db_instance.connect(args.mongo_uri):
+        raise SystemExit("Could not connect to MongoDB")
+    print(f"Merged {merge_duplicate_days(db_instance)} duplicate daily_stats documents; "
+          "the unique index is built on the next API start")
+
+
+if __name__ == '__main__':
+    main()
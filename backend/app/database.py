@@ -1,7 +1,9 @@
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
 from flask import current_app, g
+from app.config import Config
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -11,18 +13,29 @@ class Database:
     def __init__(self):
         self.client = None
         self.db = None
+        self._index_thread = None
+        self._index_lock = threading.Lock()
     
-    def connect(self, uri):
-        """Connect to MongoDB"""
+    def connect(self, uri, lazy=False):
+        """
+        Connect to MongoDB. With lazy=True the server is not pinged and
+        indexes are not built; the driver connects on the first query and
+        create_indexes_in_background builds the indexes later.
+        """
         try:
             self.client = MongoClient(uri, serverSelectionTimeoutMS=5000)
-            # Test connection
-            self.client.admin.command('ping')
             
             # Extract database name from URI
             db_name = uri.split('/')[-1].split('?')[0]
             self.db = self.client[db_name]
             
+            if lazy:
+                logger.info(f"MongoDB client created for {db_name}, connecting on first use")
+                return True
+            
+            # Test connection
+            self.client.admin.command('ping')
+            
             logger.info(f"Connected to MongoDB: {db_name}")
             self._create_indexes()
             return True
@@ -43,6 +56,11 @@ class Database:
             
             # Activities collection indexes
             self.db.activities.create_index([("user_id", 1), ("timestamp", -1)])
+            self.db.activities.create_index(
+                [("user_id", 1), ("idempotency_key", 1)],
+                unique=True,
+                partialFilterExpression={"idempotency_key": {"$type": "string"}}
+            )
             
             # Boss collection indexes
             self.db.bosses.create_index("is_active")
@@ -53,14 +71,35 @@ class Database:
             # Activity logs collection indexes
             self.db.activity_logs.create_index([("user_id", 1), ("timestamp", -1)])
             
+            # Sentiment jobs collection indexes
+            self.db.sentiment_jobs.create_index([("status", 1), ("available_at", 1), ("created_at", 1)])
+            self.db.sentiment_jobs.create_index("activity_id", unique=True)
+            self.db.sentiment_jobs.create_index(
+                "finished_at", expireAfterSeconds=Config.SENTIMENT_JOB_RETENTION_DAYS * 86400
+            )
+            
             # Guilds collection indexes
             self.db.guilds.create_index("owner_id")
             self.db.guilds.create_index("name", unique=True)
             
+            # Daily stats collection indexes (one document per user and day);
+            # last, since duplicate days left by older versions make it fail
+            self.db.daily_stats.create_index([("user_id", 1), ("date", 1)], unique=True)
+            
             logger.info("Database indexes created")
         except Exception as e:
             logger.warning(f"Index creation warning: {str(e)}")
     
+    def create_indexes_in_background(self):
+        """Build the indexes on a daemon thread (once)"""
+        with self._index_lock:
+            if self._index_thread is not None or self.db is None:
+                return
+            self._index_thread = threading.Thread(
+                target=self._create_indexes, name='mongo-indexes', daemon=True
+            )
+            self._index_thread.start()
+    
     def get_collection(self, collection_name):
         """Get a specific collection"""
         if self.db is None:
@@ -102,6 +141,16 @@ class Database:
         """Daily stats collection"""
         return self.get_collection('daily_stats')
     
+    @property
+    def sentiment_jobs(self):
+        """Background sentiment scoring jobs collection"""
+        return self.get_collection('sentiment_jobs')
+    
+    @property
+    def difficulty_state(self):
+        """Per-user adaptive difficulty state collection"""
+        return self.get_collection('difficulty_state')
+    
     @property
     def guilds(self):
         """Guilds collection"""
@@ -119,7 +168,7 @@ def get_db():
 def init_db(app):
     """Initialize database with Flask app"""
     with app.app_context():
-        success = db_instance.connect(app.config['MONGO_URI'])
+        success = db_instance.connect(app.config['MONGO_URI'], lazy=app.config['LAZY_STARTUP'])
         if not success:
             logger.error("Failed to connect to MongoDB. Check your connection string.")
         return success
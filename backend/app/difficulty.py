@@ -0,0 +1,189 @@
+"""
+Per-user adaptive difficulty state.
+
+Each user has one small difficulty_state document holding a ring buffer of
+the last RING_DAYS days, one slot per day (slot = day ordinal % RING_DAYS).
+A slot records the day it belongs to, how many quests were completed that
+day and the best activity check-in of the day (fraction of tracked
+activities done). Quest completions and activity logs update their day's
+slot with a single upsert, resetting a slot left over from an older day,
+so the adapt-difficulty endpoint only reads one document.
+
+recompute_difficulty_states rebuilds the documents of all users from the
+activities and daily_stats collections, e.g. after changing these rules.
+
+Run the maintenance job from the backend directory:
+    python -m app.difficulty --recompute
+"""
+
+import argparse
+import logging
+from datetime import datetime, timedelta
+
+from pymongo import ReplaceOne, UpdateOne
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+RING_DAYS = 7
+
+# Activities the logger offers; a check-in's completion is the fraction done
+TRACKED_TASKS = ('steps', 'meditation', 'water', 'sleep', 'healthy_meal')
+
+
+def day_ordinal(moment=None):
+    return (moment or datetime.utcnow()).date().toordinal()
+
+
+def checkin_completion(activities):
+    """Fraction of tracked activities done in one check-in"""
+    activities = activities or {}
+    done = sum(
+        1 for task in TRACKED_TASKS
+        if isinstance(activities.get(task), (int, float)) and activities.get(task) > 0
+    )
+    return done / len(TRACKED_TASKS)
+
+
+def _slot_update(day, changes):
+    """Pipeline update that resets the day's slot if stale, then applies changes"""
+    slot = f'slots.{day % RING_DAYS}'
+    return [
+        {'$set': {slot: {'$cond': [
+            {'$eq': [f'${slot}.day', day]},
+            f'${slot}',
+            {'day': day, 'quests_completed': 0, 'best_checkin': 0}
+        ]}}},
+        {'$set': {**{f'{slot}.{field}': expr(f'${slot}.{field}') for field, expr in changes.items()},
+                  'updated_at': '$$NOW'}}
+    ]
+
+
+def record_quest_completion(db, user_id, moment=None):
+    """Count a completed quest in today's slot"""
+    day = day_ordinal(moment)
+    db.difficulty_state.update_one(
+        {'_id': user_id},
+        _slot_update(day, {'quests_completed': lambda current: {'$add': [current, 1]}}),
+        upsert=True
+    )
+
+
+def record_activity_checkin(db, user_id, activities, moment=None):
+    """Keep the best check-in of the day in today's slot"""
+    day = day_ordinal(moment)
+    completion = checkin_completion(activities)
+    db.difficulty_state.update_one(
+        {'_id': user_id},
+        _slot_update(day, {'best_checkin': lambda current: {'$max': [current, completion]}}),
+        upsert=True
+    )
+
+
+def record_activity_checkins(db, user_id, checkins):
+    """Bulk variant of record_activity_checkin for [(activities, moment)]"""
+    today = day_ordinal()
+    best = {}
+    for activities, moment in checkins:
+        day = day_ordinal(moment)
+        # Days that already left the ring buffer do not affect difficulty
+        if today - RING_DAYS < day <= today:
+            best[day] = max(best.get(day, 0), checkin_completion(activities))
+
+    operations = [
+        UpdateOne(
+            {'_id': user_id},
+            _slot_update(day, {'best_checkin': lambda current, c=completion: {'$max': [current, c]}}),
+            upsert=True
+        )
+        for day, completion in sorted(best.items())
+    ]
+    if operations:
+        db.difficulty_state.bulk_write(operations)
+
+
+def completion_history(state, today=None):
+    """Completion rates of the last RING_DAYS days with activity, newest first"""
+    today = today if today is not None else day_ordinal()
+    slots = [
+        slot for slot in (state or {}).get('slots', {}).values()
+        if today - RING_DAYS < slot.get('day', 0) <= today
+    ]
+    slots.sort(key=lambda slot: slot['day'], reverse=True)
+    return [
+        max(slot.get('best_checkin', 0), min(1.0, slot.get('quests_completed', 0) / Config.DAILY_QUEST_COUNT))
+        for slot in slots
+    ]
+
+
+def get_completion_history(db, user_id):
+    return completion_history(db.difficulty_state.find_one({'_id': user_id}))
+
+
+def recompute_difficulty_states(db, batch_size=500):
+    """Rebuild every user's ring buffer from activities and daily_stats"""
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = today - timedelta(days=RING_DAYS - 1)
+    states = {}
+
+    def slot_for(user_id, date):
+        day = date.date().toordinal()
+        slots = states.setdefault(user_id, {})
+        return slots.setdefault(str(day % RING_DAYS), {'day': day, 'quests_completed': 0, 'best_checkin': 0})
+
+    done_count = {'$add': [
+        {'$cond': [{'$gt': [{'$ifNull': [f'$activities.{task}', 0]}, 0]}, 1, 0]}
+        for task in TRACKED_TASKS
+    ]}
+    checkins = db.activities.aggregate([
+        {'$match': {'timestamp': {'$gte': start}}},
+        {'$group': {
+            '_id': {'user_id': '$user_id', 'day': {'$dateTrunc': {'date': '$timestamp', 'unit': 'day'}}},
+            'best': {'$max': done_count}
+        }}
+    ])
+    for row in checkins:
+        slot = slot_for(row['_id']['user_id'], row['_id']['day'])
+        slot['best_checkin'] = row['best'] / len(TRACKED_TASKS)
+
+    for stat in db.daily_stats.find(
+        {'date': {'$gte': start}, 'quests_completed': {'$gt': 0}},
+        {'user_id': 1, 'date': 1, 'quests_completed': 1}
+    ):
+        slot_for(stat['user_id'], stat['date'])['quests_completed'] = stat['quests_completed']
+
+    operations = [
+        ReplaceOne({'_id': user_id}, {'slots': slots, 'updated_at': datetime.utcnow()}, upsert=True)
+        for user_id, slots in states.items()
+    ]
+    for i in range(0, len(operations), batch_size):
+        db.difficulty_state.bulk_write(operations[i:i + batch_size], ordered=False)
+
+    # Users without activity in the window start from a clean state
+    db.difficulty_state.delete_many({'_id': {'$nin': list(states)}})
+
+    logger.info(f"Recomputed difficulty state for {len(states)} users")
+    return len(states)
+
+
+def main():
+    from app.database import db_instance
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--recompute', action='store_true', help='rebuild the state of all users')
+    parser.add_argument('--mongo-uri', default=Config.MONGO_URI)
+    args = parser.parse_args()
+
+    if not args.recompute:
+        parser.print_help()
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    if not db_instance.connect(args.mongo_uri):
+        raise SystemExit("Could not connect to MongoDB")
+    print(f"Recomputed difficulty state for {recompute_difficulty_states(db_instance)} users")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""
+Shared LLM access with deadline-bounded calls.
+
+Every outbound LLM call from the routes goes through generate_text. The
+call runs on a background thread and the request waits at most the
+endpoint's deadline. When the deadline passes the endpoint's template
+fallback is returned and the real call is left to finish; its result warms
+a cache so the next identical prompt is answered instantly.
+
+All outbound calls share a bulkhead of LLM_MAX_CONCURRENT slots per
+process. A request that cannot get a slot within LLM_SLOT_WAIT seconds gets
+its fallback right away, so a saturated LLM cannot tie up every worker
+thread. A slot is held until the call itself finishes, even after the
+request gave up on it.
+
+stream_text is the streaming counterpart: it yields text chunks as the
+model produces them, or the fallback as a single chunk when the first chunk
+does not arrive within the deadline.
+
+A fallback used because of a deadline, an error or a full bulkhead is
+transient: the next call may get a real answer. Such fallbacks are counted
+per thread (transient_fallbacks) so callers can avoid caching them.
+
+Calls go to the provider from ai.providers (Gemini SDK, a Gemini-compatible
+REST server, an offline stand-in or a replayed recording; see LLM_PROVIDER).
+It is only created on first use, so importing the app stays fast.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from ai.cache import TTLCache, content_key
+from ai.providers import get_provider
+from ai.resilience import Bulkhead
+
+logger = logging.getLogger(__name__)
+
+# Seconds a request may wait for the LLM before using its fallback
+LLM_DEFAULT_DEADLINE = float(os.getenv('LLM_DEFAULT_DEADLINE', 6))
+LLM_DEADLINES = {
+    'narrative': float(os.getenv('LLM_DEADLINE_NARRATIVE', 5)),
+    'narrative_pool': float(os.getenv('LLM_DEADLINE_NARRATIVE_POOL', 30)),
+    'narrative_batch': float(os.getenv('LLM_DEADLINE_NARRATIVE_BATCH', 8)),
+    'coaching': float(os.getenv('LLM_DEADLINE_COACHING', 4)),
+    'coaching_pool': float(os.getenv('LLM_DEADLINE_COACHING_POOL', 30)),
+    'health_insights': float(os.getenv('LLM_DEADLINE_HEALTH_INSIGHTS', 6)),
+    'workout_plan': float(os.getenv('LLM_DEADLINE_WORKOUT_PLAN', 6)),
+    'nutrition_tips': float(os.getenv('LLM_DEADLINE_NUTRITION_TIPS', 6)),
+    'bundle': float(os.getenv('LLM_DEADLINE_BUNDLE', 10)),
+}
+
+# Threads that run LLM calls, including ones that outlived their deadline
+LLM_BACKGROUND_WORKERS = int(os.getenv('LLM_BACKGROUND_WORKERS', 8))
+LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', 600))
+
+# Seconds a stream may go quiet between chunks before it is cut off
+LLM_STREAM_IDLE_TIMEOUT = float(os.getenv('LLM_STREAM_IDLE_TIMEOUT', 15))
+
+# Calls allowed in flight at once, and seconds a request waits for a free slot
+LLM_MAX_CONCURRENT = int(os.getenv('LLM_MAX_CONCURRENT', LLM_BACKGROUND_WORKERS))
+LLM_SLOT_WAIT = float(os.getenv('LLM_SLOT_WAIT', 0.5))
+
+_executor = ThreadPoolExecutor(max_workers=LLM_BACKGROUND_WORKERS, thread_name_prefix='llm')
+_bulkhead = Bulkhead('llm', LLM_MAX_CONCURRENT, LLM_SLOT_WAIT)
+_late_results = TTLCache(max_size=1024, ttl=LLM_CACHE_TTL)
+_transient = threading.local()
+_stats_lock = threading.Lock()
+_stats = {
+    'calls': 0, 'completed': 0, 'deadline_exceeded': 0, 'errors': 0, 'late_results_served': 0,
+    'streams': 0, 'streams_interrupted': 0
+}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def llm_available():
+    return get_provider() is not None
+
+
+def transient_fallbacks():
+    """Number of transient fallbacks returned on this thread so far"""
+    return getattr(_transient, 'count', 0)
+
+
+def _transient_fallback(fallback):
+    _transient.count = transient_fallbacks() + 1
+    return fallback()
+
+
+def _call(model, prompt):
+    return get_provider().generate(model, prompt)
+
+
+def _keep_late_result(key, endpoint):
+    def done(future):
+        if future.exception() is None:
+            _late_results.set(key, future.result())
+        else:
+            logger.warning(f"Late LLM call for {endpoint} failed: {future.exception()}")
+    return done
+
+
+def generate_text(prompt, model, endpoint, fallback):
+    """
+    Return the LLM's answer to prompt, or fallback() if the LLM is not
+    configured, fails, or does not answer within the endpoint's deadline.
+    """
+    if get_provider() is None:
+        return fallback()
+
+    # A call that missed its deadline earlier may have finished since
+    key = content_key(model, prompt)
+    late = _late_results.get(key)
+    if late is not None:
+        _late_results.delete(key)
+        _count('late_results_served')
+        return late
+
+    # Wait briefly for a slot; when the LLM is saturated use the fallback
+    deadline = LLM_DEADLINES.get(endpoint, LLM_DEFAULT_DEADLINE)
+    started = time.monotonic()
+    if not _bulkhead.acquire(min(LLM_SLOT_WAIT, deadline)):
+        logger.warning(f"No free LLM slot for {endpoint}, using fallback")
+        return _transient_fallback(fallback)
+
+    _count('calls')
+    try:
+        future = _executor.submit(_call, model, prompt)
+    except Exception:
+        _bulkhead.release()
+        raise
+    future.add_done_callback(lambda _: _bulkhead.release())
+
+    try:
+        text = future.result(timeout=max(0.0, deadline - (time.monotonic() - started)))
+    except FutureTimeout:
+        _count('deadline_exceeded')
+        logger.warning(f"LLM call for {endpoint} exceeded {deadline}s deadline, using fallback")
+        future.add_done_callback(_keep_late_result(key, endpoint))
+        return _transient_fallback(fallback)
+    except Exception as e:
+        _count('errors')
+        logger.error(f"LLM call for {endpoint} failed: {e}")
+        return _transient_fallback(fallback)
+
+    _count('completed')
+    return text
+
+
+def _stream_call(model, prompt, chunks, cancelled):
+    try:
+        for chunk in get_provider().stream(model, prompt):
+            if cancelled.is_set():
+                return
+            chunks.put(('chunk', chunk))
+        chunks.put(('done', None))
+    except Exception as e:
+        chunks.put(('error', e))
+
+
+def stream_text(prompt, model, endpoint, fallback, on_complete=None):
+    """
+    Yield the LLM's answer to prompt in chunks as it is generated. Falls back
+    to fallback() as a single chunk under the same conditions as
+    generate_text. on_complete(text) is called with the full text once the
+    answer has been sent completely, not for cut-off streams or transient
+    fallbacks.
+    """
+    def use_fallback(transient=True):
+        text = _transient_fallback(fallback) if transient else fallback()
+        yield text
+        if on_complete and not transient:
+            on_complete(text)
+
+    if get_provider() is None:
+        yield from use_fallback(transient=False)
+        return
+
+    key = content_key(model, prompt)
+    late = _late_results.get(key)
+    if late is not None:
+        _late_results.delete(key)
+        _count('late_results_served')
+        yield late
+        if on_complete:
+            on_complete(late)
+        return
+
+    deadline = LLM_DEADLINES.get(endpoint, LLM_DEFAULT_DEADLINE)
+    started = time.monotonic()
+    if not _bulkhead.acquire(min(LLM_SLOT_WAIT, deadline)):
+        logger.warning(f"No free LLM slot for {endpoint}, using fallback")
+        yield from use_fallback()
+        return
+
+    _count('streams')
+    chunks = queue.Queue()
+    cancelled = threading.Event()
+    try:
+        future = _executor.submit(_stream_call, model, prompt, chunks, cancelled)
+    except Exception:
+        _bulkhead.release()
+        raise
+    future.add_done_callback(lambda _: _bulkhead.release())
+
+    parts = []
+    timeout = max(0.0, deadline - (time.monotonic() - started))
+    try:
+        while True:
+            try:
+                kind, value = chunks.get(timeout=timeout)
+            except queue.Empty:
+                kind, value = 'timeout', None
+
+            if kind == 'chunk':
+                parts.append(value)
+                yield value
+                timeout = LLM_STREAM_IDLE_TIMEOUT
+                continue
+
+            if kind == 'done':
+                _count('completed')
+                if on_complete:
+                    on_complete(''.join(parts).strip())
+                return
+
+            if parts:
+                # Part of the answer is already out, so just end the stream
+                _count('streams_interrupted')
+                logger.warning(f"LLM stream for {endpoint} interrupted: {value or 'idle timeout'}")
+                return
+
+            if kind == 'timeout':
+                _count('deadline_exceeded')
+                logger.warning(f"LLM stream for {endpoint} sent nothing within {deadline}s, using fallback")
+            else:
+                _count('errors')
+                logger.error(f"LLM stream for {endpoint} failed: {value}")
+            yield from use_fallback()
+            return
+    finally:
+        # Stop reading the model's stream if we stopped relaying it
+        cancelled.set()
+
+
+def get_llm_metrics():
+    with _stats_lock:
+        metrics = dict(_stats)
+    metrics['available'] = llm_available()
+    metrics['provider'] = get_provider().name if llm_available() else None
+    metrics['late_results_cached'] = len(_late_results)
+    metrics['bulkhead'] = _bulkhead.snapshot()
+    return metrics
@@ -8,6 +8,7 @@ class User:
     def create(username, email, password, gender='M'):
         """Create a new user"""
         hashed_pw = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        now = datetime.utcnow()
         
         return {
             'username': username,
@@ -28,8 +29,10 @@ class User:
             'quests_completed': 0,
             'current_streak': 0,
             'longest_streak': 0,
-            'created_at': datetime.utcnow(),
-            'last_login': datetime.utcnow()
+            'created_at': now,
+            'last_login': now,
+            # Every activity of a new user is included in the daily_stats rollups
+            'activity_rollups_since': now
         }
     
     @staticmethod
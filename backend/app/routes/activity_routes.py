@@ -1,9 +1,22 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.database import get_db
 from bson import ObjectId
-from datetime import datetime
+from bson.errors import InvalidId
+from datetime import datetime, timedelta, timezone
+from pymongo.errors import BulkWriteError
+from ai.sentiment import SENTIMENT_CACHE, sentiment_cache_key
+from app.activity_export import export_stream
+from app.activity_rollups import activities_error, rollup_increments
+from app.daily_stats import day_start, increment_daily_stats, increment_daily_stats_by_day
+from app.difficulty import record_activity_checkin, record_activity_checkins
+from app.write_behind import buffered_update, confirmed_update, flush_pending_writes
+from app.sentiment_jobs import (
+    enqueue_sentiment_job, enqueue_sentiment_jobs, PROVISIONAL_SENTIMENT, PROVISIONAL_MULTIPLIER
+)
+import base64
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
@@ -13,8 +26,18 @@ activity_bp = Blueprint('activity', __name__, url_prefix='/api/activity')
 POSITIVE_KEYWORDS = ['great', 'good', 'amazing', 'excellent', 'happy', 'motivated', 'energized', 'accomplished', 'proud', 'fantastic', 'wonderful', 'awesome', 'perfect', 'love', 'best']
 NEGATIVE_KEYWORDS = ['tired', 'bad', 'difficult', 'hard', 'exhausted', 'stressed', 'overwhelmed', 'frustrated', 'sad', 'terrible', 'awful', 'worst', 'hate', 'painful']
 
+# Cache namespace for keyword results, kept apart from the model-backed entries
+KEYWORD_MODEL_ID = 'activity-keywords'
+
 def analyze_sentiment(text):
     """Simple sentiment analysis based on keywords"""
+    key = sentiment_cache_key(text, KEYWORD_MODEL_ID)
+    cached = SENTIMENT_CACHE.get(key)
+    if cached is not None:
+        return cached['sentiment'], cached['multiplier']
+    
+    # Substring matching on purpose: "loved" counts as "love" and "hardly" as
+    # "hard", and for lists this short it is faster than a LexiconEngine scan
     text_lower = text.lower()
     
     positive_count = sum(1 for word in POSITIVE_KEYWORDS if word in text_lower)
@@ -37,6 +60,12 @@ def analyze_sentiment(text):
         sentiment = 'neutral'
         multiplier = 1.0
     
+    SENTIMENT_CACHE.set(key, {
+        'model_used': KEYWORD_MODEL_ID,
+        'sentiment': sentiment,
+        'score': positive_ratio,
+        'multiplier': multiplier
+    })
     return sentiment, multiplier
 
 
@@ -54,6 +83,11 @@ def log_activity():
         if not reflection or len(reflection.strip()) < 5:
             return jsonify({'error': 'Reflection must be at least 5 characters'}), 400
         
+        activities = data.get('activities', {})
+        error = activities_error(activities)
+        if error:
+            return jsonify({'error': error}), 400
+        
         # Get user
         user = None
         if ObjectId.is_valid(current_user_id):
@@ -64,8 +98,12 @@ def log_activity():
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Analyze sentiment
-        sentiment, multiplier = analyze_sentiment(reflection)
+        # Analyze sentiment now, or score it in the background and settle XP later
+        score_async = current_app.config['ACTIVITY_SENTIMENT_ASYNC']
+        if score_async:
+            sentiment, multiplier = PROVISIONAL_SENTIMENT, PROVISIONAL_MULTIPLIER
+        else:
+            sentiment, multiplier = analyze_sentiment(reflection)
         
         # Log activity (without distance tracking)
         activity_log = {
@@ -73,9 +111,10 @@ def log_activity():
             'reflection': reflection,
             'sentiment': sentiment,
             'multiplier': multiplier,
+            'sentiment_status': 'pending' if score_async else 'scored',
             'category': data.get('category', 'general'),
             'mood': data.get('mood', 3),
-            'activities': data.get('activities', {}),
+            'activities': activities,
             'timestamp': datetime.utcnow()
         }
         
@@ -84,42 +123,32 @@ def log_activity():
         # Calculate XP earned (base 10 XP * multiplier)
         xp_earned = int(10 * multiplier)
         
-        # Add XP to user
-        db.users.update_one(
+        # Add XP to user; bumping activity_version invalidates cached recommendations
+        buffered_update(
+            db, 'users',
             {'_id': user['_id']},
             {
                 '$inc': {
                     'current_xp': xp_earned,
-                    'total_xp': xp_earned
-                }
+                    'total_xp': xp_earned,
+                    'activity_version': 1
+                },
+                '$min': {'activity_rollups_since': activity_log['timestamp']}
             }
         )
         
-        # Update daily stats (without distance tracking)
-        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        daily_stat = db.daily_stats.find_one({
-            'user_id': user['_id'],
-            'date': today
+        # Update daily stats, including the day's activity totals used for summaries
+        increment_daily_stats(db, user['_id'], {
+            'activities_logged': 1,
+            'xp_gained': xp_earned,
+            **rollup_increments(activity_log['activities'])
         })
         
-        if daily_stat:
-            db.daily_stats.update_one(
-                {'_id': daily_stat['_id']},
-                {
-                    '$inc': {
-                        'activities_logged': 1,
-                        'xp_gained': xp_earned
-                    }
-                }
-            )
-        else:
-            db.daily_stats.insert_one({
-                'user_id': user['_id'],
-                'date': today,
-                'activities_logged': 1,
-                'xp_gained': xp_earned,
-                'quests_completed': 0
-            })
+        record_activity_checkin(db, user['_id'], activity_log['activities'], activity_log['timestamp'])
+        
+        # Enqueued last, so the worker never settles XP before it was credited
+        if score_async and not enqueue_sentiment_job(db, activity_log, xp_earned):
+            activity_log['sentiment_status'] = 'provisional'
         
         # Generate AI response based on sentiment
         responses = {
@@ -146,6 +175,7 @@ def log_activity():
         return jsonify({
             'success': True,
             'sentiment': sentiment,
+            'sentimentStatus': activity_log['sentiment_status'],
             'multiplier': multiplier,
             'xpEarned': xp_earned,
             'response': ai_response,
@@ -157,10 +187,277 @@ def log_activity():
         return jsonify({'error': 'Failed to log activity'}), 500
 
 
+# Most entries accepted by one offline-sync batch
+ACTIVITY_BATCH_MAX = int(os.getenv('ACTIVITY_BATCH_MAX', 500))
+
+# Client timestamps may run this far ahead of the server clock
+CLIENT_CLOCK_SKEW = timedelta(minutes=5)
+
+# Totals a synced activity still has to be added to, in the order they are applied
+ACTIVITY_TOTALS = ('xp', 'daily_stats')
+
+
+def parse_iso_timestamp(value):
+    """Parse an ISO 8601 timestamp as naive UTC; None if missing or invalid"""
+    if not isinstance(value, str):
+        return None
+    try:
+        timestamp = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def parse_client_timestamp(value, now):
+    """Parse a client timestamp as naive UTC; None if missing, invalid or in the future"""
+    timestamp = parse_iso_timestamp(value)
+    if timestamp is None or timestamp > now + CLIENT_CLOCK_SKEW:
+        return None
+    return timestamp
+
+
+def apply_activity_totals(db, user_id, logs, now):
+    """
+    Add synced activities to the user's XP and to daily_stats. Each stored
+    activity lists the totals it still has to be added to in pending_totals,
+    and a step removes itself from there once written, so when a later step
+    fails, resending the batch finishes only what is left. The writes are
+    confirmed (not left in the write-behind buffer) before a step is removed.
+    """
+    xp_logs = [log for log in logs if 'xp' in log.get('pending_totals', ())]
+    if xp_logs:
+        xp = sum(int(10 * log['multiplier']) for log in xp_logs)
+        # Bumping activity_version invalidates cached recommendations
+        confirmed_update(
+            db, 'users',
+            {'_id': user_id},
+            {
+                '$inc': {'current_xp': xp, 'total_xp': xp, 'activity_version': 1},
+                '$min': {'activity_rollups_since': now}
+            }
+        )
+        db.activities.update_many({'_id': {'$in': [log['_id'] for log in xp_logs]}},
+                                  {'$pull': {'pending_totals': 'xp'}})
+    
+    stats_logs = [log for log in logs if 'daily_stats' in log.get('pending_totals', ())]
+    if stats_logs:
+        day_deltas = {}
+        for log in stats_logs:
+            delta = day_deltas.setdefault(day_start(log['timestamp']), {'activities_logged': 0, 'xp_gained': 0})
+            delta['activities_logged'] += 1
+            delta['xp_gained'] += int(10 * log['multiplier'])
+            for field, value in rollup_increments(log['activities']).items():
+                delta[field] = delta.get(field, 0) + value
+        increment_daily_stats_by_day(db, user_id, day_deltas, confirm=True)
+        db.activities.update_many({'_id': {'$in': [log['_id'] for log in stats_logs]}},
+                                  {'$pull': {'pending_totals': 'daily_stats'}})
+
+
+@activity_bp.route('/log/batch', methods=['POST'])
+@jwt_required()
+def log_activity_batch():
+    """
+    Log a batch of activities queued by an offline client.
+    
+    Body: {"entries": [{"reflection", "activities", "mood", "category",
+    "timestamp" (ISO 8601, when it was logged), "idempotency_key"}, ...]}.
+    Entries whose idempotency_key was already logged are skipped, so a
+    client can safely resend a batch after a lost response; if an earlier
+    attempt stored them but failed before adding their XP or daily stats,
+    the resend adds what is missing.
+    """
+    try:
+        db = get_db()
+        current_user_id = get_jwt_identity()
+        data = request.get_json() or {}
+        entries = data.get('entries')
+        
+        if not isinstance(entries, list) or not entries:
+            return jsonify({'error': 'entries must be a non-empty list'}), 400
+        if len(entries) > ACTIVITY_BATCH_MAX:
+            return jsonify({'error': f'At most {ACTIVITY_BATCH_MAX} entries per batch'}), 400
+        
+        # Get user
+        user = None
+        if ObjectId.is_valid(current_user_id):
+            user = db.users.find_one({'_id': ObjectId(current_user_id)})
+        else:
+            user = db.users.find_one({'username': current_user_id})
+        
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        now = datetime.utcnow()
+        score_async = current_app.config['ACTIVITY_SENTIMENT_ASYNC']
+        
+        # Validate entries and drop repeats of an idempotency key within the batch
+        rejected = []
+        valid = []
+        seen_keys = set()
+        duplicates = set()
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                rejected.append({'index': index, 'error': 'Entry must be an object'})
+                continue
+            reflection = entry.get('reflection', '')
+            key = entry.get('idempotency_key')
+            timestamp = parse_client_timestamp(entry.get('timestamp'), now) if 'timestamp' in entry else now
+            error = activities_error(entry.get('activities') or {})
+            if not isinstance(reflection, str) or len(reflection.strip()) < 5:
+                rejected.append({'index': index, 'error': 'Reflection must be at least 5 characters'})
+            elif key is not None and not isinstance(key, str):
+                rejected.append({'index': index, 'error': 'idempotency_key must be a string'})
+            elif timestamp is None:
+                rejected.append({'index': index, 'error': 'Invalid timestamp'})
+            elif error:
+                rejected.append({'index': index, 'error': error})
+            elif key is not None and key in seen_keys:
+                duplicates.add(key)
+            else:
+                if key is not None:
+                    seen_keys.add(key)
+                valid.append((entry, reflection, key, timestamp))
+        
+        # Skip entries that an earlier sync already stored, but finish any
+        # totals that sync failed to add
+        stored = set()
+        unfinished = []
+        if seen_keys:
+            for doc in db.activities.find(
+                {'user_id': user['_id'], 'idempotency_key': {'$in': list(seen_keys)}},
+                {'idempotency_key': 1, 'pending_totals': 1, 'multiplier': 1, 'activities': 1,
+                 'timestamp': 1, 'reflection': 1, 'user_id': 1, 'sentiment_status': 1}
+            ):
+                stored.add(doc['idempotency_key'])
+                if doc.get('pending_totals'):
+                    # Stored before activities were validated; count it without them
+                    if activities_error(doc.get('activities')):
+                        doc['activities'] = {}
+                    unfinished.append(doc)
+            duplicates.update(stored)
+        
+        new_entries = [item for item in valid if item[2] not in stored]
+        if score_async:
+            scores = [(PROVISIONAL_SENTIMENT, PROVISIONAL_MULTIPLIER)] * len(new_entries)
+        else:
+            scores = [analyze_sentiment(reflection) for _, reflection, _, _ in new_entries]
+        
+        activity_logs = []
+        for (entry, reflection, key, timestamp), (sentiment, multiplier) in zip(new_entries, scores):
+            activity_log = {
+                'user_id': user['_id'],
+                'reflection': reflection,
+                'sentiment': sentiment,
+                'multiplier': multiplier,
+                'sentiment_status': 'pending' if score_async else 'scored',
+                'category': entry.get('category', 'general'),
+                'mood': entry.get('mood', 3),
+                'activities': entry.get('activities') or {},
+                'timestamp': timestamp,
+                'received_at': now,
+                'pending_totals': list(ACTIVITY_TOTALS)
+            }
+            if key is not None:
+                activity_log['idempotency_key'] = key
+            activity_logs.append(activity_log)
+        
+        # One insert for the batch; a concurrent sync of the same keys loses on the unique index
+        inserted = activity_logs
+        if activity_logs:
+            try:
+                db.activities.insert_many(activity_logs, ordered=False)
+            except BulkWriteError as e:
+                failed = {error['index'] for error in e.details.get('writeErrors', []) if error.get('code') == 11000}
+                if len(failed) != len(e.details.get('writeErrors', [])):
+                    raise
+                duplicates.update(activity_logs[i].get('idempotency_key') for i in failed)
+                inserted = [log for i, log in enumerate(activity_logs) if i not in failed]
+        
+        # Calculate XP earned (base 10 XP * multiplier)
+        results = []
+        total_xp = 0
+        for activity_log in inserted:
+            xp_earned = int(10 * activity_log['multiplier'])
+            total_xp += xp_earned
+            results.append({
+                'id': str(activity_log['_id']),
+                'idempotencyKey': activity_log.get('idempotency_key'),
+                'sentiment': activity_log['sentiment'],
+                'multiplier': activity_log['multiplier'],
+                'xpEarned': xp_earned,
+                'timestamp': activity_log['timestamp'].isoformat()
+            })
+        
+        sentiment_status = 'pending' if score_async else 'scored'
+        completed = inserted + unfinished
+        if completed:
+            # One XP update and one upsert per day touched by the batch
+            apply_activity_totals(db, user['_id'], completed, now)
+            
+            record_activity_checkins(
+                db, user['_id'], [(log['activities'], log['timestamp']) for log in completed]
+            )
+            
+            # Enqueued last, so the worker never settles XP before it was credited
+            pending = [log for log in completed if log['sentiment_status'] == 'pending']
+            if pending and not enqueue_sentiment_jobs(db, pending, int(10 * PROVISIONAL_MULTIPLIER)):
+                sentiment_status = 'provisional'
+        
+        logger.info(f"Synced {len(inserted)} activities for user {user['_id']} "
+                    f"({len(duplicates)} duplicates, {len(unfinished)} finished, {len(rejected)} rejected)")
+        
+        return jsonify({
+            'success': True,
+            'accepted': len(inserted),
+            'xpEarned': total_xp,
+            'sentimentStatus': sentiment_status,
+            'results': results,
+            'duplicates': sorted(duplicates),
+            'rejected': rejected
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error logging activity batch: {str(e)}")
+        return jsonify({'error': 'Failed to log activity batch'}), 500
+
+
+# Export formats and their content types
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+# Largest page the history endpoint returns
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', 100))
+
+# Fields the history response uses
+HISTORY_PROJECTION = {'reflection': 1, 'sentiment': 1, 'multiplier': 1, 'timestamp': 1}
+
+
+def encode_history_cursor(log):
+    """Opaque cursor pointing just past a history entry"""
+    position = f"{log['timestamp'].isoformat()}|{log['_id']}"
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+
+def decode_history_cursor(cursor):
+    """(timestamp, _id) from a history cursor; None if it is not one"""
+    try:
+        position = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, log_id = position.split('|')
+        return datetime.fromisoformat(timestamp), ObjectId(log_id)
+    except (ValueError, TypeError, InvalidId):
+        return None
+
+
 @activity_bp.route('/history', methods=['GET'])
 @jwt_required()
 def get_activity_history():
-    """Get user's activity log history"""
+    """
+    Get user's activity log history, newest first.
+    
+    Query: limit (page size, at most HISTORY_MAX_PAGE_SIZE), cursor (the
+    next_cursor of the previous page), from/to (ISO 8601, to is exclusive).
+    """
     try:
         db = get_db()
         current_user_id = get_jwt_identity()
@@ -175,26 +472,103 @@ def get_activity_history():
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Get activity logs (last 30 days)
-        limit = request.args.get('limit', 50, type=int)
+        page_size = min(max(request.args.get('limit', 50, type=int), 1), HISTORY_MAX_PAGE_SIZE)
+        query = {'user_id': user['_id']}
+        
+        # Optional date range, served by the (user_id, timestamp) index
+        timestamp_range = {}
+        for param, operator in (('from', '$gte'), ('to', '$lt')):
+            if request.args.get(param):
+                bound = parse_iso_timestamp(request.args[param])
+                if bound is None:
+                    return jsonify({'error': f'Invalid {param} date'}), 400
+                timestamp_range[operator] = bound
+        if timestamp_range:
+            query['timestamp'] = timestamp_range
         
-        logs = list(db.activities.find(
-            {'user_id': user['_id']}
-        ).sort('timestamp', -1).limit(limit))
+        # Continue after the last entry of the previous page
+        if request.args.get('cursor'):
+            position = decode_history_cursor(request.args['cursor'])
+            if position is None:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            timestamp, log_id = position
+            query['$or'] = [
+                {'timestamp': {'$lt': timestamp}},
+                {'timestamp': timestamp, '_id': {'$lt': log_id}}
+            ]
+        
+        # One extra entry tells whether there is another page
+        logs = list(db.activities.find(query, HISTORY_PROJECTION)
+                    .sort([('timestamp', -1), ('_id', -1)])
+                    .limit(page_size + 1))
+        next_cursor = None
+        if len(logs) > page_size:
+            logs = logs[:page_size]
+            next_cursor = encode_history_cursor(logs[-1])
         
         # Format logs
-        formatted_logs = []
-        for log in logs:
-            formatted_logs.append({
-                'id': str(log['_id']),
-                'reflection': log['reflection'],
-                'sentiment': log['sentiment'],
-                'multiplier': log['multiplier'],
-                'timestamp': log['timestamp'].isoformat()
-            })
+        formatted_logs = [{
+            'id': str(log['_id']),
+            'reflection': log['reflection'],
+            'sentiment': log['sentiment'],
+            'multiplier': log['multiplier'],
+            'timestamp': log['timestamp'].isoformat()
+        } for log in logs]
         
-        return jsonify({'logs': formatted_logs}), 200
+        return jsonify({'logs': formatted_logs, 'next_cursor': next_cursor}), 200
         
     except Exception as e:
         logger.error(f"Error fetching activity history: {str(e)}")
-        return jsonify({'error': 'Failed to fetch activity history'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Failed to fetch activity history'}), 500
+
+
+@activity_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_activity():
+    """
+    Stream the user's complete history of activities, daily stats and quest
+    progress. Query: format (ndjson or csv). The body is gzip-compressed on
+    the fly when the client accepts it.
+    """
+    try:
+        db = get_db()
+        current_user_id = get_jwt_identity()
+        
+        # Get user
+        user = None
+        if ObjectId.is_valid(current_user_id):
+            user = db.users.find_one({'_id': ObjectId(current_user_id)})
+        else:
+            user = db.users.find_one({'username': current_user_id})
+        
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+        
+        # Daily stats still in the write-behind buffer belong in the export
+        flush_pending_writes(user['_id'])
+        
+        compress = 'gzip' in request.headers.get('Accept-Encoding', '')
+        filename = f"healthquest-{user['username']}-{datetime.utcnow():%Y%m%d}.{export_format}"
+        headers = {
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Vary': 'Accept-Encoding',
+            'X-Accel-Buffering': 'no'
+        }
+        if compress:
+            headers['Content-Encoding'] = 'gzip'
+        
+        logger.info(f"Exporting {export_format} history for user {user['_id']}")
+        return Response(
+            export_stream(db, user['_id'], export_format, gzip=compress),
+            mimetype=EXPORT_FORMATS[export_format],
+            headers=headers
+        )
+        
+    except Exception as e:
+        logger.error(f"Error exporting activity history: {str(e)}")
+        return jsonify({'error': 'Failed to export activity history'}), 500
+
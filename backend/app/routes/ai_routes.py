@@ -2,37 +2,23 @@ from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.database import get_db
 from bson import ObjectId
+from ai.cache import TTLCache, content_key
+from ai.sentiment import normalize_text
+from app.content_pool import ContentPool
+from app.difficulty import get_completion_history
+from app.llm import generate_text, llm_available, transient_fallbacks
+import itertools
+import json
 import logging
 import os
 import random
-
-try:
-    from google import genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
-    logging.warning("google-genai not installed. Install with: pip install google-genai")
+import re
+import threading
 
 logger = logging.getLogger(__name__)
 
 ai_bp = Blueprint('ai', __name__, url_prefix='/api/ai')
 
-# Initialize Gemini if available
-if GEMINI_AVAILABLE:
-    GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-    if GEMINI_API_KEY and GEMINI_API_KEY != 'GEMINI_API_KEY':
-        try:
-            gemini_client = genai.Client(api_key=GEMINI_API_KEY)
-            logger.info("✅ Gemini API initialized successfully")
-        except Exception as e:
-            logger.warning(f"Failed to initialize Gemini: {e}")
-            gemini_client = None
-    else:
-        gemini_client = None
-        logger.warning("⚠️ GEMINI_API_KEY not set in .env file")
-else:
-    gemini_client = None
-
 # Quest narrative templates for fallback
 QUEST_NARRATIVES = {
     'movement': [
@@ -67,6 +53,27 @@ QUEST_NARRATIVES = {
     ]
 }
 
+# Goal units per quest activity type
+QUEST_UNITS = {
+    'movement': 'steps',
+    'meditation': 'minutes',
+    'nutrition': 'meals',
+    'hydration': 'glasses',
+    'sleep': 'hours'
+}
+
+# Base quest goals per activity type at difficulty 1.0
+QUEST_BASE_TARGETS = {
+    'movement': 5000,
+    'meditation': 10,
+    'nutrition': 3,
+    'hydration': 8,
+    'sleep': 7
+}
+
+# Most quests a single batch request may create
+MAX_QUEST_BATCH = int(os.getenv('MAX_QUEST_BATCH', 10))
+
 # Coaching messages based on sentiment
 COACHING_MESSAGES = {
     'positive': [
@@ -92,78 +99,149 @@ COACHING_MESSAGES = {
     ]
 }
 
-def generate_narrative_with_gemini(activity_type, target, user_level=1, user_stats=None):
-    """Generate quest narrative using Gemini AI"""
-    if not gemini_client:
-        return generate_narrative_fallback(activity_type, target, user_level)
+def generate_narrative_fallback(activity_type, target, user_level=1):
+    """Fallback narrative generation using templates"""
+    if activity_type not in QUEST_NARRATIVES:
+        activity_type = 'movement'
     
-    try:
-        prompt = f"""You are a fantasy RPG dungeon master creating an engaging quest for a health app.
+    templates = QUEST_NARRATIVES[activity_type]
+    template = random.choice(templates)
+    
+    return template.format(target=target)
+
+def get_level_band(user_level):
+    """Coarse level band used to share pre-generated content between users"""
+    if user_level <= 5:
+        return 'novice'
+    elif user_level <= 15:
+        return 'adept'
+    return 'veteran'
+
+
+def generate_narrative_template_with_gemini(key):
+    """Generate a pool narrative with a {target} placeholder for the goal"""
+    activity_type, level_band = key
+    unit = QUEST_UNITS.get(activity_type, 'steps')
+    
+    prompt = f"""You are a fantasy RPG dungeon master creating an engaging quest for a health app.
 
 Character Details:
-- Level: {user_level}
+- Experience: {level_band} adventurer
 - Activity Type: {activity_type}
-- Goal: {target} {'steps' if activity_type == 'movement' else 'minutes' if activity_type == 'meditation' else 'glasses' if activity_type == 'hydration' else 'meals' if activity_type == 'nutrition' else 'hours'}
+- Goal unit: {unit}
 
 Create a short, motivational quest narrative (2-3 sentences, max 60 words) that:
 1. Uses fantasy/RPG themes (warriors, temples, ancient paths, magical rewards)
 2. Makes the activity sound like an epic adventure
 3. Encourages the player to complete the goal
-4. Matches the activity type theme
+4. Writes the goal as the literal placeholder {{target}} followed by the unit, exactly once
 
-Examples for inspiration:
-- Movement: "The ancient forest path beckons your warrior spirit..."
-- Meditation: "The Temple of Tranquility calls to your weary mind..."
-- Nutrition: "The Feast Hall of Heroes awaits your arrival..."
+Example: "The ancient forest path beckons. Take {{target}} {unit} to unlock its secrets."
 
 Write ONLY the quest narrative, no extra commentary."""
 
-        response = gemini_client.models.generate_content(
-            model='gemini-1.5-flash',
-            contents=prompt
-        )
-        narrative = response.text.strip()
-        
-        # Validate length
-        if len(narrative.split()) > 70:
-            narrative = ' '.join(narrative.split()[:60]) + '...'
-        
-        logger.info(f"✨ Generated Gemini narrative for {activity_type}")
-        return narrative
-        
-    except Exception as e:
-        logger.error(f"Gemini narrative generation failed: {e}")
-        return generate_narrative_fallback(activity_type, target, user_level)
-
-def generate_narrative_fallback(activity_type, target, user_level=1):
-    """Fallback narrative generation using templates"""
-    if activity_type not in QUEST_NARRATIVES:
-        activity_type = 'movement'
-    
-    templates = QUEST_NARRATIVES[activity_type]
-    template = random.choice(templates)
+    template = generate_text(prompt, 'gemini-1.5-flash', 'narrative_pool', lambda: None)
     
-    return template.format(target=target)
+    # Reject anything we cannot safely fill in later
+    if template is None or template.count('{target}') != 1 or len(template.split()) > 70:
+        return None
+    return template
+
+
+NARRATIVE_POOL = ContentPool(
+    generate_narrative_template_with_gemini,
+    target_size=int(os.getenv('NARRATIVE_POOL_SIZE', 5)),
+    name='narratives'
+)
+
 
 # Keep old function for backwards compatibility
 def generate_narrative(activity_type, target, user_level=1):
-    """Generate quest narrative (uses Gemini if available)"""
-    return generate_narrative_with_gemini(activity_type, target, user_level)
+    """Generate quest narrative from the pre-generated pool, templates when it is empty"""
+    if llm_available():
+        if activity_type not in QUEST_NARRATIVES:
+            activity_type = 'movement'
+        template = NARRATIVE_POOL.pop((activity_type, get_level_band(user_level)))
+        if template:
+            return template.replace('{target}', str(target))
+    
+    return generate_narrative_fallback(activity_type, target, user_level)
+
+
+def generate_narratives_batch(quest_specs, user_level=1):
+    """
+    Narratives for several (activity_type, target) pairs at once.
+    
+    Uses pooled narratives first, then a single LLM call for the rest, and
+    templates for anything still missing.
+    """
+    narratives = [None] * len(quest_specs)
+    
+    if llm_available():
+        band = get_level_band(user_level)
+        for i, (activity_type, target) in enumerate(quest_specs):
+            pool_type = activity_type if activity_type in QUEST_NARRATIVES else 'movement'
+            template = NARRATIVE_POOL.pop((pool_type, band))
+            if template:
+                narratives[i] = template.replace('{target}', str(target))
+        
+        missing = [i for i, narrative in enumerate(narratives) if narrative is None]
+        if missing:
+            quest_lines = '\n'.join(
+                f"{n}. {quest_specs[i][0]}: {quest_specs[i][1]} {QUEST_UNITS.get(quest_specs[i][0], 'steps')}"
+                for n, i in enumerate(missing, 1)
+            )
+            prompt = f"""You are a fantasy RPG dungeon master creating engaging quests for a health app.
+
+Character Level: {user_level}
+
+Quests:
+{quest_lines}
+
+For EACH quest, write a short, motivational quest narrative (2-3 sentences, max 60 words) that uses
+fantasy/RPG themes, makes the activity sound like an epic adventure, mentions the goal and matches
+the activity type.
+
+Respond with ONLY a JSON array of {len(missing)} strings, one narrative per quest in the same order."""
+            
+            text = generate_text(prompt, 'gemini-1.5-flash', 'narrative_batch', lambda: None)
+            for i, narrative in zip(missing, parse_narrative_batch(text)):
+                if narrative and len(narrative.split()) <= 70:
+                    narratives[i] = narrative
+    
+    return [
+        narrative or generate_narrative_fallback(activity_type, target, user_level)
+        for narrative, (activity_type, target) in zip(narratives, quest_specs)
+    ]
+
+
+def parse_narrative_batch(text):
+    """List of narratives from a batch response, [] if it cannot be parsed"""
+    match = re.search(r'\[.*\]', text or '', re.DOTALL)
+    if not match:
+        return []
+    try:
+        items = json.loads(match.group(0))
+    except ValueError:
+        logger.warning("Could not parse batch narrative response")
+        return []
+    if not isinstance(items, list):
+        return []
+    return [item.strip() if isinstance(item, str) else None for item in items]
 
 
 def get_coaching_message_with_gemini(sentiment, reflection_text=None, user_stats=None):
     """Get AI coaching message using Gemini"""
-    if not gemini_client or not reflection_text:
+    if not llm_available() or not reflection_text:
         return get_coaching_message_fallback(sentiment)
     
-    try:
-        mood_context = {
-            'positive': 'The user is feeling great and motivated',
-            'negative': 'The user is struggling or feeling down',
-            'neutral': 'The user has a neutral, balanced mood'
-        }
-        
-        prompt = f"""You are an empathetic health coach for a gamified wellness RPG app.
+    mood_context = {
+        'positive': 'The user is feeling great and motivated',
+        'negative': 'The user is struggling or feeling down',
+        'neutral': 'The user has a neutral, balanced mood'
+    }
+    
+    prompt = f"""You are an empathetic health coach for a gamified wellness RPG app.
 
 User Context:
 - Current Mood: {mood_context.get(sentiment, 'neutral')}
@@ -177,22 +255,137 @@ Provide a SHORT motivational message (1-2 sentences, max 30 words) that:
 
 Write ONLY the coaching message, nothing else."""
 
-        response = gemini_client.models.generate_content(
-            model='gemini-1.5-flash',
-            contents=prompt
-        )
-        message = response.text.strip()
-        
-        # Validate length
-        if len(message.split()) > 35:
-            message = ' '.join(message.split()[:30]) + '!'
-        
-        logger.info(f"✨ Generated Gemini coaching for {sentiment} sentiment")
+    message = generate_text(
+        prompt, 'gemini-1.5-flash', 'coaching',
+        lambda: get_coaching_message_fallback(sentiment)
+    )
+    
+    # Validate length
+    if len(message.split()) > 35:
+        message = ' '.join(message.split()[:30]) + '!'
+    
+    return message
+
+def get_streak_band(streak):
+    """Coarse streak band used to share coaching messages between users"""
+    if streak <= 0:
+        return 'none'
+    elif streak < 7:
+        return 'building'
+    return 'blazing'
+
+
+def generate_coaching_for_band(key):
+    """Generate a pooled coaching message for a (sentiment, level band, streak band)"""
+    sentiment, level_band, streak_band = key
+    
+    mood_context = {
+        'positive': 'The user is feeling great and motivated',
+        'negative': 'The user is struggling or feeling down',
+        'neutral': 'The user has a neutral, balanced mood'
+    }
+    streak_context = {
+        'none': 'has no active streak yet',
+        'building': 'is building a streak of a few days',
+        'blazing': 'is on a streak of a week or more'
+    }
+    
+    prompt = f"""You are an empathetic health coach for a gamified wellness RPG app.
+
+User Context:
+- Current Mood: {mood_context.get(sentiment, 'neutral')}
+- Experience: {level_band} adventurer who {streak_context.get(streak_band, 'has no active streak yet')}
+
+Provide a SHORT motivational message (1-2 sentences, max 30 words) that:
+1. Acknowledges their current state
+2. Provides encouragement or advice
+3. Uses light RPG/fantasy language (hero, warrior, quest)
+4. Is warm and supportive
+
+Write ONLY the coaching message, nothing else."""
+
+    message = generate_text(prompt, 'gemini-1.5-flash', 'coaching_pool', lambda: None)
+    if message is None or len(message.split()) > 35:
+        return None
+    return message
+
+
+# Pre-generated coaching messages per band, rotated for variety
+COACHING_POOL = ContentPool(
+    generate_coaching_for_band,
+    target_size=int(os.getenv('COACHING_POOL_SIZE', 8)),
+    name='coaching',
+    rotate=True
+)
+
+# Coaching messages per (sentiment, level band, streak band, reflection text)
+COACHING_CACHE = TTLCache(
+    max_size=int(os.getenv('COACHING_CACHE_SIZE', 4096)),
+    ttl=float(os.getenv('COACHING_CACHE_TTL', 3600))
+)
+
+_coaching_stats_lock = threading.Lock()
+_coaching_stats = {'requests': 0, 'cache_hits': 0, 'pool_hits': 0, 'llm_calls': 0, 'templates': 0}
+
+
+def _count_coaching(source):
+    with _coaching_stats_lock:
+        _coaching_stats['requests'] += 1
+        _coaching_stats[source] += 1
+
+
+_coaching_prefilled = threading.Event()
+
+
+def prefill_coaching_pools():
+    """Start generating the coaching pools for every band in the background (once per process)"""
+    if llm_available() and not _coaching_prefilled.is_set():
+        _coaching_prefilled.set()
+        COACHING_POOL.prefill(itertools.product(
+            COACHING_MESSAGES, ('novice', 'adept', 'veteran'), ('none', 'building', 'blazing')
+        ))
+
+
+def get_coaching_message_cached(sentiment, reflection_text, user_stats, level_band, streak_band):
+    """
+    Coaching message for a reflection: from the cache, else the band's
+    pre-generated pool, else a personal Gemini message (or template).
+    """
+    key = content_key(sentiment, level_band, streak_band, normalize_text(reflection_text))
+    message = COACHING_CACHE.get(key)
+    if message is not None:
+        _count_coaching('cache_hits')
         return message
-        
-    except Exception as e:
-        logger.error(f"Gemini coaching generation failed: {e}")
-        return get_coaching_message_fallback(sentiment)
+    
+    if llm_available():
+        message = COACHING_POOL.pop((sentiment, level_band, streak_band))
+        if message is not None:
+            _count_coaching('pool_hits')
+        else:
+            fallbacks = transient_fallbacks()
+            message = get_coaching_message_with_gemini(sentiment, reflection_text, user_stats)
+            if transient_fallbacks() != fallbacks:
+                # The LLM timed out, failed or was saturated; try it again next time
+                _count_coaching('templates')
+                return message
+            _count_coaching('llm_calls' if reflection_text else 'templates')
+    else:
+        _count_coaching('templates')
+        message = get_coaching_message_fallback(sentiment)
+    
+    COACHING_CACHE.set(key, message)
+    return message
+
+
+def get_coaching_metrics():
+    with _coaching_stats_lock:
+        metrics = dict(_coaching_stats)
+    requests = metrics['requests']
+    metrics['llm_free_fraction'] = round(1 - metrics['llm_calls'] / requests, 4) if requests else None
+    metrics['pool'] = COACHING_POOL.stats()
+    metrics['cache'] = COACHING_CACHE.stats()
+    return metrics
+
 
 def get_coaching_message_fallback(sentiment):
     """Fallback coaching message using templates"""
@@ -299,10 +492,13 @@ def get_coaching():
             else:
                 sentiment = 'neutral'
         
-        # Use Gemini for personalized coaching if reflection provided
+        # Coaching for a reflection comes from the cache or pool, Gemini only on a miss
         if reflection_text:
-            message = get_coaching_message_with_gemini(sentiment, reflection_text, user_stats)
+            level_band = get_level_band(user.get('level', 1) if user else 1)
+            streak_band = get_streak_band(user.get('current_streak', 0) if user else 0)
+            message = get_coaching_message_cached(sentiment, reflection_text, user_stats, level_band, streak_band)
         else:
+            _count_coaching('templates')
             message = get_coaching_message_fallback(sentiment)
         
         return jsonify({
@@ -324,21 +520,8 @@ def adapt_quest_difficulty():
         db = get_db()
         current_user_id = get_jwt_identity()
         
-        # Get recent quest completion history
-        recent_activities = list(
-            db.activity_logs.find({'user_id': ObjectId(current_user_id)})
-            .sort('date', -1)
-            .limit(7)
-        )
-        
-        # Calculate completion rates
-        completion_history = []
-        for activity in recent_activities:
-            # Count completed tasks vs total tasks
-            total_tasks = len(activity.get('activities', {}))
-            completed_tasks = sum(1 for v in activity.get('activities', {}).values() if v > 0)
-            completion_rate = completed_tasks / total_tasks if total_tasks > 0 else 0
-            completion_history.append(completion_rate)
+        # Recent daily completion rates, kept up to date on every quest and check-in
+        completion_history = get_completion_history(db, ObjectId(current_user_id))
         
         difficulty = adapt_difficulty(completion_history)
         
@@ -379,55 +562,19 @@ def generate_personalized_quest():
         difficulty = data.get('difficulty', 1.0)
         activity_type = data.get('activity_type', 'movement')
         
-        # Base targets
-        base_targets = {
-            'movement': 5000,
-            'meditation': 10,
-            'nutrition': 3,
-            'hydration': 8,
-            'sleep': 7
-        }
-        
-        target = int(base_targets.get(activity_type, 5000) * difficulty)
+        target = get_quest_target(activity_type, difficulty)
         narrative = generate_narrative(activity_type, target, user.get('level', 1))
         
-        # Calculate rewards
-        base_xp = 50
-        xp_reward = int(base_xp * difficulty * 1.5)
-        
-        quest = {
-            'user_id': ObjectId(current_user_id),
-            'type': 'daily',
-            'status': 'active',
-            'title': f"{activity_type.title()} Challenge",
-            'narrative': narrative,
-            'activity_type': activity_type,
-            'target': target,
-            'progress': 0,
-            'difficulty': difficulty,
-            'rewards': {
-                'xp': xp_reward,
-                'gold': int(xp_reward * 0.2)
-            },
-            'created_at': datetime.utcnow()
-        }
+        quest = build_quest(user['_id'], activity_type, difficulty, target, narrative)
         
         result = db.quests.insert_one(quest)
-        quest['_id'] = str(result.inserted_id)
+        quest['_id'] = result.inserted_id
         
         logger.info(f"AI-generated quest created for user {current_user_id}")
         
         return jsonify({
             'success': True,
-            'quest': {
-                '_id': quest['_id'],
-                'title': quest['title'],
-                'narrative': quest['narrative'],
-                'activity_type': quest['activity_type'],
-                'target': quest['target'],
-                'difficulty': quest['difficulty'],
-                'rewards': quest['rewards']
-            }
+            'quest': format_quest(quest)
         }), 201
         
     except Exception as e:
@@ -435,4 +582,109 @@ def generate_personalized_quest():
         return jsonify({'error': 'Failed to generate quest'}), 500
 
 
+@ai_bp.route('/generate-quests', methods=['POST'])
+@jwt_required()
+def generate_personalized_quests():
+    """
+    Generate several personalized quests in one call.
+    
+    Body: {"quests": [{"activity_type": ..., "difficulty": ...}, ...]} or
+    {"full_daily_set": true} for one quest of every activity type at the
+    user's adaptive difficulty (or the given "difficulty").
+    """
+    try:
+        db = get_db()
+        current_user_id = get_jwt_identity()
+        data = request.get_json() or {}
+        
+        user = db.users.find_one({'_id': ObjectId(current_user_id)})
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if data.get('full_daily_set'):
+            difficulty = data.get('difficulty')
+            if difficulty is None:
+                difficulty = adapt_difficulty(get_completion_history(db, user['_id']))
+            specs = [(activity_type, difficulty) for activity_type in QUEST_BASE_TARGETS]
+        else:
+            specs = [
+                (item.get('activity_type', 'movement'), item.get('difficulty', 1.0))
+                for item in data.get('quests', [])
+                if isinstance(item, dict)
+            ]
+        
+        if not specs:
+            return jsonify({'error': 'Provide quests or full_daily_set'}), 400
+        if len(specs) > MAX_QUEST_BATCH:
+            return jsonify({'error': f'At most {MAX_QUEST_BATCH} quests per request'}), 400
+        if not all(isinstance(difficulty, (int, float)) and difficulty > 0 for _, difficulty in specs):
+            return jsonify({'error': 'Difficulty must be a positive number'}), 400
+        
+        targets = [get_quest_target(activity_type, difficulty) for activity_type, difficulty in specs]
+        narratives = generate_narratives_batch(
+            [(activity_type, target) for (activity_type, _), target in zip(specs, targets)],
+            user.get('level', 1)
+        )
+        
+        quests = [
+            build_quest(user['_id'], activity_type, difficulty, target, narrative)
+            for (activity_type, difficulty), target, narrative in zip(specs, targets, narratives)
+        ]
+        
+        result = db.quests.insert_many(quests)
+        for quest, inserted_id in zip(quests, result.inserted_ids):
+            quest['_id'] = inserted_id
+        
+        logger.info(f"{len(quests)} AI-generated quests created for user {current_user_id}")
+        
+        return jsonify({
+            'success': True,
+            'quests': [format_quest(quest) for quest in quests]
+        }), 201
+        
+    except Exception as e:
+        logger.error(f"Error generating quests: {str(e)}")
+        return jsonify({'error': 'Failed to generate quests'}), 500
+
+
+def get_quest_target(activity_type, difficulty):
+    return int(QUEST_BASE_TARGETS.get(activity_type, 5000) * difficulty)
+
+
+def build_quest(user_id, activity_type, difficulty, target, narrative):
+    """Quest document for a generated quest"""
+    # Calculate rewards
+    base_xp = 50
+    xp_reward = int(base_xp * difficulty * 1.5)
+    
+    return {
+        'user_id': user_id,
+        'type': 'daily',
+        'status': 'active',
+        'title': f"{activity_type.title()} Challenge",
+        'narrative': narrative,
+        'activity_type': activity_type,
+        'target': target,
+        'progress': 0,
+        'difficulty': difficulty,
+        'rewards': {
+            'xp': xp_reward,
+            'gold': int(xp_reward * 0.2)
+        },
+        'created_at': datetime.utcnow()
+    }
+
+
+def format_quest(quest):
+    return {
+        '_id': str(quest['_id']),
+        'title': quest['title'],
+        'narrative': quest['narrative'],
+        'activity_type': quest['activity_type'],
+        'target': quest['target'],
+        'difficulty': quest['difficulty'],
+        'rewards': quest['rewards']
+    }
+
+
 from datetime import datetime
@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.database import get_db
+from app.write_behind import flush_pending_writes
 from bson import ObjectId
 from datetime import datetime, timedelta
 import logging
@@ -169,7 +170,8 @@ def get_today_stats(user_id):
         
         total_steps = sum(activity.get('steps', 0) for activity in activities)
         
-        # Get today's stats
+        # Get today's stats, including increments still in the write-behind buffer
+        flush_pending_writes(user['_id'])
         daily_stat = db.daily_stats.find_one({
             'user_id': user['_id'],
             'date': today
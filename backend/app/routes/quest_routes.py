@@ -1,6 +1,9 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.database import get_db
+from app.write_behind import flush_pending_writes
+from app.daily_stats import increment_daily_stats
+from app.difficulty import record_quest_completion
 from bson import ObjectId
 from datetime import datetime
 import logging
@@ -127,6 +130,10 @@ def complete_quest(quest_id):
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
+        # Buffered XP increments must land before the XP is read
+        if flush_pending_writes(user['_id']):
+            user = db.users.find_one({'_id': user['_id']})
+        
         # Find the quest
         quest = next((q for q in DEFAULT_QUESTS if q['id'] == quest_id), None)
         if not quest:
@@ -205,31 +212,12 @@ def complete_quest(quest_id):
         )
         
         # Update daily stats
-        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        daily_stat = db.daily_stats.find_one({
-            'user_id': user['_id'],
-            'date': today_start
+        increment_daily_stats(db, user['_id'], {
+            'quests_completed': 1,
+            'xp_gained': quest['xpReward']
         })
         
-        if daily_stat:
-            db.daily_stats.update_one(
-                {'_id': daily_stat['_id']},
-                {
-                    '$inc': {
-                        'quests_completed': 1,
-                        'xp_gained': quest['xpReward']
-                    }
-                }
-            )
-        else:
-            db.daily_stats.insert_one({
-                'user_id': user['_id'],
-                'date': today_start,
-                'quests_completed': 1,
-                'xp_gained': quest['xpReward'],
-                'steps': 0,
-                'activities_logged': 0
-            })
+        record_quest_completion(db, user['_id'])
         
         return jsonify({
             'success': True,
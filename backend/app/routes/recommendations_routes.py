@@ -3,69 +3,115 @@ AI-powered health recommendations using Gemini API
 Provides personalized insights, workout plans, nutrition advice, and sleep optimization
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
-from datetime import datetime, timedelta
+import json
 import os
+import re
 import logging
 
-# Import Gemini with fallback
-try:
-    from google import genai
-    GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-    if GEMINI_API_KEY and GEMINI_API_KEY != 'your_gemini_api_key_here':
-        gemini_client = genai.Client(api_key=GEMINI_API_KEY)
-        GEMINI_AVAILABLE = True
-        logging.info("✅ Gemini API initialized for recommendations")
-    else:
-        gemini_client = None
-        GEMINI_AVAILABLE = False
-        logging.warning("⚠️ Gemini API key not configured - recommendations will use fallback")
-except ImportError:
-    gemini_client = None
-    GEMINI_AVAILABLE = False
-    logging.warning("⚠️ google-genai not installed - recommendations will use fallback")
-
 from app.database import get_db
+from app.activity_rollups import summarize_activity
+from app.llm import generate_text, stream_text, llm_available, transient_fallbacks
+from ai.cache import TTLCache, content_key
 
 recommendations_bp = Blueprint('recommendations', __name__, url_prefix='/api/recommendations')
 logger = logging.getLogger(__name__)
 
+# Generated recommendations per user. Entries are keyed by the user's
+# activity_version, which log_activity bumps, so new activity invalidates them.
+# Answers that fell back to a template because the LLM was slow, failing or
+# saturated are not cached, so the next request tries the LLM again.
+RECOMMENDATION_CACHE = TTLCache(
+    max_size=int(os.getenv('RECOMMENDATION_CACHE_SIZE', 4096)),
+    ttl=float(os.getenv('RECOMMENDATION_CACHE_MAX_AGE', 900))
+)
+
+
+def find_user(user_id):
+    """Fetch the user document for a JWT identity"""
+    return get_db().users.find_one({'_id': ObjectId(user_id)})
+
+
+def recommendation_cache_key(user, endpoint, goal):
+    return content_key(str(user['_id']), endpoint, goal or '', str(user.get('activity_version', 0)))
 
-def get_user_activity_summary(user_id, days=7):
+
+def get_cached_recommendation(user, endpoint, goal, build):
+    """Return (result, cached) for this user/endpoint/goal at the current activity version"""
+    key = recommendation_cache_key(user, endpoint, goal)
+    result = RECOMMENDATION_CACHE.get(key)
+    if result is not None:
+        return result, True
+    
+    fallbacks = transient_fallbacks()
+    result = build()
+    if transient_fallbacks() == fallbacks:
+        RECOMMENDATION_CACHE.set(key, result)
+    return result, False
+
+
+def sse_event(data, event=None):
+    """Format one server-sent event with a JSON payload"""
+    message = f"event: {event}\n" if event else ''
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+def stream_recommendation(user, endpoint, goal, text_field, model, build, done):
+    """
+    Relay a recommendation as server-sent events: 'data' events carrying
+    text chunks, then a 'done' event with done(result) as payload. A cached
+    recommendation is sent as a single chunk. Otherwise build() returns
+    (result, prompt, fallback), and the streamed text is cached with result
+    for the JSON endpoint once complete (stream_text does not complete
+    transient fallbacks, so those are not cached).
+    """
+    key = recommendation_cache_key(user, endpoint, goal)
+    cached = RECOMMENDATION_CACHE.get(key)
+    if cached is None:
+        result, prompt, fallback = build()
+    else:
+        result = cached
+    
+    def store(text):
+        RECOMMENDATION_CACHE.set(key, {**result, text_field: text})
+    
+    def events():
+        if cached is not None:
+            yield sse_event({'text': cached[text_field]})
+        elif not llm_available():
+            text = fallback()
+            store(text)
+            yield sse_event({'text': text})
+        else:
+            for chunk in stream_text(prompt, model, endpoint.replace('-', '_'), fallback, on_complete=store):
+                yield sse_event({'text': chunk})
+        yield sse_event({**done(result), 'ai_powered': llm_available(), 'cached': cached is not None}, event='done')
+    
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+# Sections returned by the bundle prompt, mapped to their response keys
+BUNDLE_SECTIONS = ('insights', 'plan', 'tips')
+JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+
+def get_user_activity_summary(user_id, days=7, user=None):
     """Get user's recent activity data for analysis"""
     db = get_db()
     
     # Get user data
-    user = db.users.find_one({'_id': ObjectId(user_id)})
+    if user is None:
+        user = db.users.find_one({'_id': ObjectId(user_id)})
     if not user:
         return None
     
-    # Get recent activities
-    start_date = datetime.utcnow() - timedelta(days=days)
-    activities = list(db.activities.find({
-        'user_id': user_id,
-        'timestamp': {'$gte': start_date}
-    }).sort('timestamp', -1))
-    
-    # Calculate averages
-    avg_steps = 0
-    avg_meditation = 0
-    avg_water = 0
-    avg_sleep = 0
-    
-    if activities:
-        total_steps = sum(a.get('steps', 0) for a in activities)
-        total_meditation = sum(a.get('meditation_minutes', 0) for a in activities)
-        total_water = sum(a.get('water_glasses', 0) for a in activities)
-        total_sleep = sum(a.get('sleep_hours', 0) for a in activities)
-        
-        count = len(activities)
-        avg_steps = total_steps / count
-        avg_meditation = total_meditation / count
-        avg_water = total_water / count
-        avg_sleep = total_sleep / count
+    # Averages are computed by MongoDB, from day rollups where available
+    windows = summarize_activity(db, user, windows=tuple(sorted({days, 30})))
     
     return {
         'user': {
@@ -75,26 +121,17 @@ def get_user_activity_summary(user_id, days=7):
             'health': user.get('health', 100),
             'stamina': user.get('stamina', 100)
         },
-        'activities': {
-            'days_logged': len(activities),
-            'avg_steps': int(avg_steps),
-            'avg_meditation': int(avg_meditation),
-            'avg_water': int(avg_water),
-            'avg_sleep': round(avg_sleep, 1)
-        }
+        'activities': windows[days],
+        'activities_30d': windows[30]
     }
 
 
-def generate_health_insights_with_gemini(user_summary):
-    """Generate personalized health insights using Gemini"""
-    if not gemini_client:
-        return generate_health_insights_fallback(user_summary)
+def build_health_insights_prompt(user_summary):
+    """Prompt for personalized health insights"""
+    user_data = user_summary['user']
+    activity_data = user_summary['activities']
     
-    try:
-        user_data = user_summary['user']
-        activity_data = user_summary['activities']
-        
-        prompt = f"""You are a professional health coach analyzing a user's wellness data.
+    return f"""You are a professional health coach analyzing a user's wellness data.
 
 User Profile:
 - Level: {user_data['level']} (shows long-term engagement)
@@ -115,18 +152,16 @@ Provide 3-4 SHORT, actionable insights (bullet points):
 
 Keep each point under 20 words. Be warm and supportive."""
 
-        response = gemini_client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=prompt
-        )
-        insights = response.text.strip()
-        
-        logger.info(f"✨ Generated Gemini health insights for user")
-        return insights
-        
-    except Exception as e:
-        logger.error(f"Gemini insight generation failed: {e}")
+
+def generate_health_insights_with_gemini(user_summary):
+    """Generate personalized health insights using Gemini"""
+    if not llm_available():
         return generate_health_insights_fallback(user_summary)
+    
+    return generate_text(
+        build_health_insights_prompt(user_summary), 'gemini-2.5-flash', 'health_insights',
+        lambda: generate_health_insights_fallback(user_summary)
+    )
 
 
 def generate_health_insights_fallback(user_summary):
@@ -160,16 +195,12 @@ def generate_health_insights_fallback(user_summary):
     return '\n'.join(insights)
 
 
-def generate_workout_plan_with_gemini(user_summary, goal='general'):
-    """Generate personalized workout recommendations using Gemini"""
-    if not gemini_client:
-        return generate_workout_plan_fallback(user_summary, goal)
+def build_workout_plan_prompt(user_summary, goal='general'):
+    """Prompt for a personalized workout plan"""
+    user_data = user_summary['user']
+    activity_data = user_summary['activities']
     
-    try:
-        user_data = user_summary['user']
-        activity_data = user_summary['activities']
-        
-        prompt = f"""You are a certified fitness trainer creating a workout plan for a gamified health app user.
+    return f"""You are a certified fitness trainer creating a workout plan for a gamified health app user.
 
 User Profile:
 - Fitness Level: {user_data['level']} (beginner=1-5, intermediate=6-15, advanced=16+)
@@ -190,18 +221,16 @@ Requirements:
 
 Keep total response under 100 words."""
 
-        response = gemini_client.models.generate_content(
-            model='gemini-1.5-flash',
-            contents=prompt
-        )
-        plan = response.text.strip()
-        
-        logger.info(f"✨ Generated Gemini workout plan for {goal} goal")
-        return plan
-        
-    except Exception as e:
-        logger.error(f"Gemini workout generation failed: {e}")
+
+def generate_workout_plan_with_gemini(user_summary, goal='general'):
+    """Generate personalized workout recommendations using Gemini"""
+    if not llm_available():
         return generate_workout_plan_fallback(user_summary, goal)
+    
+    return generate_text(
+        build_workout_plan_prompt(user_summary, goal), 'gemini-1.5-flash', 'workout_plan',
+        lambda: generate_workout_plan_fallback(user_summary, goal)
+    )
 
 
 def generate_workout_plan_fallback(user_summary, goal='general'):
@@ -231,6 +260,46 @@ def generate_workout_plan_fallback(user_summary, goal='general'):
 🔥 You're unstoppable, warrior!"""
 
 
+def generate_nutrition_tips_with_gemini(user_summary):
+    """Generate personalized nutrition tips using Gemini"""
+    if not llm_available():
+        return generate_nutrition_tips_fallback(user_summary)
+    
+    activity_data = user_summary['activities']
+    user_data = user_summary['user']
+    
+    prompt = f"""You are a registered dietitian providing nutrition advice for a health app user.
+
+User Profile:
+- Activity Level: {activity_data['avg_steps']} daily steps
+- Water Intake: {activity_data['avg_water']} glasses/day
+- Fitness Level: Level {user_data['level']}
+
+Provide 4-5 SHORT nutrition tips (bullet points):
+1. Comment on their hydration (water intake)
+2. Suggest protein intake based on activity level
+3. Recommend pre/post workout snacks
+4. Give ONE easy meal idea
+5. Add a fun nutrition fact
+
+Keep each tip under 20 words. Be encouraging!"""
+
+    return generate_text(
+        prompt, 'gemini-2.5-flash', 'nutrition_tips',
+        lambda: generate_nutrition_tips_fallback(user_summary)
+    )
+
+
+def generate_nutrition_tips_fallback(user_summary):
+    """Fallback nutrition tips"""
+    return """**Nutrition Basics:**
+- Aim for 8 glasses of water daily to stay hydrated
+- Include protein in every meal (eggs, chicken, beans, tofu)
+- Pre-workout: banana + almond butter for quick energy
+- Post-workout: protein shake or Greek yogurt within 30 mins
+- Quick meal: Grilled chicken + quinoa + steamed veggies"""
+
+
 @recommendations_bp.route('/health-insights', methods=['GET'])
 @jwt_required()
 def get_health_insights():
@@ -238,19 +307,28 @@ def get_health_insights():
     try:
         current_user_id = get_jwt_identity()
         
-        # Get user activity summary
-        summary = get_user_activity_summary(current_user_id, days=7)
-        if not summary:
+        user = find_user(current_user_id)
+        if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Generate insights using Gemini or fallback
-        insights = generate_health_insights_with_gemini(summary)
+        def build():
+            # Get user activity summary
+            summary = get_user_activity_summary(current_user_id, days=7, user=user)
+            
+            # Generate insights using Gemini or fallback
+            return {
+                'insights': generate_health_insights_with_gemini(summary),
+                'summary': summary
+            }
+        
+        result, cached = get_cached_recommendation(user, 'health-insights', None, build)
         
         return jsonify({
             'success': True,
-            'insights': insights,
-            'summary': summary,
-            'ai_powered': GEMINI_AVAILABLE
+            'insights': result['insights'],
+            'summary': result['summary'],
+            'ai_powered': llm_available(),
+            'cached': cached
         }), 200
         
     except Exception as e:
@@ -258,6 +336,35 @@ def get_health_insights():
         return jsonify({'error': 'Failed to generate insights'}), 500
 
 
+@recommendations_bp.route('/health-insights/stream', methods=['GET'])
+@jwt_required()
+def stream_health_insights():
+    """Stream personalized health insights as server-sent events"""
+    try:
+        current_user_id = get_jwt_identity()
+        
+        user = find_user(current_user_id)
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        def build():
+            summary = get_user_activity_summary(current_user_id, days=7, user=user)
+            return (
+                {'summary': summary},
+                build_health_insights_prompt(summary),
+                lambda: generate_health_insights_fallback(summary)
+            )
+        
+        return stream_recommendation(
+            user, 'health-insights', None, 'insights', 'gemini-2.5-flash', build,
+            lambda result: {'summary': result['summary']}
+        )
+        
+    except Exception as e:
+        logger.error(f"Error streaming health insights: {str(e)}")
+        return jsonify({'error': 'Failed to generate insights'}), 500
+
+
 @recommendations_bp.route('/workout-plan', methods=['POST'])
 @jwt_required()
 def get_workout_plan():
@@ -267,20 +374,29 @@ def get_workout_plan():
         data = request.get_json()
         goal = data.get('goal', 'general')  # general, weight_loss, strength, endurance
         
-        # Get user activity summary
-        summary = get_user_activity_summary(current_user_id, days=7)
-        if not summary:
+        user = find_user(current_user_id)
+        if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Generate workout plan using Gemini or fallback
-        plan = generate_workout_plan_with_gemini(summary, goal)
+        def build():
+            # Get user activity summary
+            summary = get_user_activity_summary(current_user_id, days=7, user=user)
+            
+            # Generate workout plan using Gemini or fallback
+            return {
+                'plan': generate_workout_plan_with_gemini(summary, goal),
+                'user_level': summary['user']['level']
+            }
+        
+        result, cached = get_cached_recommendation(user, 'workout-plan', goal, build)
         
         return jsonify({
             'success': True,
-            'plan': plan,
+            'plan': result['plan'],
             'goal': goal,
-            'user_level': summary['user']['level'],
-            'ai_powered': GEMINI_AVAILABLE
+            'user_level': result['user_level'],
+            'ai_powered': llm_available(),
+            'cached': cached
         }), 200
         
     except Exception as e:
@@ -288,6 +404,36 @@ def get_workout_plan():
         return jsonify({'error': 'Failed to generate workout plan'}), 500
 
 
+@recommendations_bp.route('/workout-plan/stream', methods=['GET'])
+@jwt_required()
+def stream_workout_plan():
+    """Stream personalized workout recommendations as server-sent events"""
+    try:
+        current_user_id = get_jwt_identity()
+        goal = request.args.get('goal', 'general')  # general, weight_loss, strength, endurance
+        
+        user = find_user(current_user_id)
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        def build():
+            summary = get_user_activity_summary(current_user_id, days=7, user=user)
+            return (
+                {'user_level': summary['user']['level']},
+                build_workout_plan_prompt(summary, goal),
+                lambda: generate_workout_plan_fallback(summary, goal)
+            )
+        
+        return stream_recommendation(
+            user, 'workout-plan', goal, 'plan', 'gemini-1.5-flash', build,
+            lambda result: {'goal': goal, 'user_level': result['user_level']}
+        )
+        
+    except Exception as e:
+        logger.error(f"Error streaming workout plan: {str(e)}")
+        return jsonify({'error': 'Failed to generate workout plan'}), 500
+
+
 @recommendations_bp.route('/nutrition-tips', methods=['GET'])
 @jwt_required()
 def get_nutrition_tips():
@@ -295,51 +441,152 @@ def get_nutrition_tips():
     try:
         current_user_id = get_jwt_identity()
         
-        # Get user activity summary
-        summary = get_user_activity_summary(current_user_id, days=7)
-        if not summary:
+        user = find_user(current_user_id)
+        if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        if gemini_client:
-            activity_data = summary['activities']
-            user_data = summary['user']
-            
-            prompt = f"""You are a registered dietitian providing nutrition advice for a health app user.
+        def build():
+            # Get user activity summary
+            summary = get_user_activity_summary(current_user_id, days=7, user=user)
+            return {'tips': generate_nutrition_tips_with_gemini(summary)}
+        
+        result, cached = get_cached_recommendation(user, 'nutrition-tips', None, build)
+        
+        return jsonify({
+            'success': True,
+            'tips': result['tips'],
+            'ai_powered': llm_available(),
+            'cached': cached
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error generating nutrition tips: {str(e)}")
+        return jsonify({'error': 'Failed to generate nutrition tips'}), 500
+
+
+
+def generate_bundle_with_gemini(user_summary, goal='general'):
+    """
+    Generate insights, workout plan and nutrition tips with a single prompt.
+    
+    Returns (sections, fallback_sections): any section the model leaves out
+    or garbles is filled from its template fallback and listed in
+    fallback_sections.
+    """
+    fallbacks = {
+        'insights': lambda: generate_health_insights_fallback(user_summary),
+        'plan': lambda: generate_workout_plan_fallback(user_summary, goal),
+        'tips': lambda: generate_nutrition_tips_fallback(user_summary)
+    }
+    
+    sections = {}
+    if llm_available():
+        user_data = user_summary['user']
+        activity_data = user_summary['activities']
+        
+        prompt = f"""You are a health coach, certified fitness trainer and registered dietitian for a gamified health app user.
 
 User Profile:
-- Activity Level: {activity_data['avg_steps']} daily steps
-- Water Intake: {activity_data['avg_water']} glasses/day
-- Fitness Level: Level {user_data['level']}
+- Level: {user_data['level']} (beginner=1-5, intermediate=6-15, advanced=16+)
+- Current Streak: {user_data['streak']} days
+- Health: {user_data['health']}% | Stamina: {user_data['stamina']}%
+- Workout Goal: {goal}
 
-Provide 4-5 SHORT nutrition tips (bullet points):
-1. Comment on their hydration (water intake)
-2. Suggest protein intake based on activity level
-3. Recommend pre/post workout snacks
-4. Give ONE easy meal idea
-5. Add a fun nutrition fact
+Recent Activity ({activity_data['days_logged']} days):
+- Daily Steps: {activity_data['avg_steps']} avg
+- Meditation: {activity_data['avg_meditation']} min/day avg
+- Water Intake: {activity_data['avg_water']} glasses/day avg
+- Sleep: {activity_data['avg_sleep']} hours/night avg
 
-Keep each tip under 20 words. Be encouraging!"""
+Respond with ONLY a JSON object with these three string fields:
+- "insights": 3-4 short, actionable health insights as bullet points (celebrate a strength, one area to improve, one next step), each under 20 words
+- "plan": a 3-day bodyweight workout plan as bullet points (Day 1-3, 10-30 minutes each, matched to their level and goal) plus ONE motivational tip, under 100 words
+- "tips": 4-5 short nutrition tips as bullet points (hydration, protein for their activity level, pre/post workout snack, one easy meal idea, a fun fact), each under 20 words
 
-            response = gemini_client.models.generate_content(
-                model='gemini-2.5-flash',
-                contents=prompt
-            )
-            tips = response.text.strip()
-        else:
-            # Fallback tips
-            tips = """**Nutrition Basics:**
-- Aim for 8 glasses of water daily to stay hydrated
-- Include protein in every meal (eggs, chicken, beans, tofu)
-- Pre-workout: banana + almond butter for quick energy
-- Post-workout: protein shake or Greek yogurt within 30 mins
-- Quick meal: Grilled chicken + quinoa + steamed veggies"""
+Be warm and supportive. Do not wrap the JSON in markdown."""
+        
+        text = generate_text(prompt, 'gemini-2.5-flash', 'bundle', lambda: None)
+        if text:
+            sections = parse_bundle_response(text)
+    
+    fallback_sections = []
+    for name in BUNDLE_SECTIONS:
+        if not sections.get(name):
+            sections[name] = fallbacks[name]()
+            fallback_sections.append(name)
+    
+    return sections, fallback_sections
+
+
+def parse_bundle_response(text):
+    """
+    Pull the bundle sections out of a model response.
+    
+    Tolerates markdown fences and chatter around the JSON object, and list
+    values (joined into bullet lines). Returns only the sections that came
+    back as usable text, so the caller can fall back for the rest.
+    """
+    match = JSON_OBJECT_RE.search(text)
+    if not match:
+        logger.warning("Bundle response contained no JSON object")
+        return {}
+    
+    try:
+        data = json.loads(match.group(0))
+    except ValueError as e:
+        logger.warning(f"Could not parse bundle response: {e}")
+        return {}
+    
+    if not isinstance(data, dict):
+        return {}
+    
+    sections = {}
+    for name in BUNDLE_SECTIONS:
+        value = data.get(name)
+        if isinstance(value, list):
+            value = '\n'.join(f"- {item}" for item in value if isinstance(item, str) and item.strip())
+        if isinstance(value, str) and value.strip():
+            sections[name] = value.strip()
+    return sections
+
+
+@recommendations_bp.route('/bundle', methods=['GET'])
+@jwt_required()
+def get_recommendation_bundle():
+    """Get health insights, workout plan and nutrition tips in one call"""
+    try:
+        current_user_id = get_jwt_identity()
+        goal = request.args.get('goal', 'general')
+        
+        user = find_user(current_user_id)
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        def build():
+            # One activity summary and one prompt for all three sections
+            summary = get_user_activity_summary(current_user_id, days=7, user=user)
+            sections, fallback_sections = generate_bundle_with_gemini(summary, goal)
+            return {
+                'sections': sections,
+                'fallback_sections': fallback_sections,
+                'summary': summary
+            }
+        
+        result, cached = get_cached_recommendation(user, 'bundle', goal, build)
         
         return jsonify({
             'success': True,
-            'tips': tips,
-            'ai_powered': GEMINI_AVAILABLE
+            'insights': result['sections']['insights'],
+            'summary': result['summary'],
+            'plan': result['sections']['plan'],
+            'goal': goal,
+            'user_level': result['summary']['user']['level'],
+            'tips': result['sections']['tips'],
+            'fallback_sections': result['fallback_sections'],
+            'ai_powered': llm_available(),
+            'cached': cached
         }), 200
         
     except Exception as e:
-        logger.error(f"Error generating nutrition tips: {str(e)}")
-        return jsonify({'error': 'Failed to generate nutrition tips'}), 500
+        logger.error(f"Error generating recommendation bundle: {str(e)}")
+        return jsonify({'error': 'Failed to generate recommendations'}), 500
@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.database import get_db
+from app.write_behind import flush_pending_writes
 from bson import ObjectId
 import logging
 
@@ -28,6 +29,10 @@ def get_user(user_id):
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
+        # Buffered XP increments must land before the XP is read
+        if flush_pending_writes(user['_id']):
+            user = db.users.find_one({'_id': user['_id']})
+        
         # Calculate XP for next level
         next_level_xp = user.get('level', 1) * 100
         xp_percentage = (user.get('current_xp', 0) / next_level_xp) * 100 if next_level_xp > 0 else 0
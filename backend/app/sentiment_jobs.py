@@ -0,0 +1,259 @@
+"""
+Background sentiment enrichment for logged activities.
+
+When ACTIVITY_SENTIMENT_ASYNC is enabled, log_activity stores the activity
+right away with a provisional multiplier and sentiment_status 'pending', and
+enqueues a job in the sentiment_jobs collection. Worker threads claim jobs
+with a lease, score the reflection with the full sentiment chain and apply
+the XP difference to the user and daily stats.
+
+Synchronous logging keeps the cheap keyword scorer in activity_routes, so
+the full chain (and its latency) only runs in the background.
+
+Jobs live in Mongo, so work survives restarts: a job whose lease expired
+(e.g. the worker died mid-way) is claimed again. The update that moves the
+activity from 'pending' to 'scored' records the XP difference and lists the
+documents it still has to be credited to in xp_pending. settle_activity_xp
+writes each one through the confirmed write path and only then removes it
+from xp_pending, so a retried job finishes what is left. A crash between a
+write and its removal credits that one document again on retry, the same
+at-least-once window as the batch sync's pending_totals.
+
+If the job cannot be enqueued, the activity is marked 'provisional': it
+keeps the provisional XP and is never left pending without a job. Finished
+jobs are removed by a TTL index after SENTIMENT_JOB_RETENTION_DAYS.
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from ai.sentiment import analyze_sentiment
+from app.daily_stats import increment_daily_stats
+from app.write_behind import confirmed_update
+
+logger = logging.getLogger(__name__)
+
+BASE_XP = 10
+PROVISIONAL_SENTIMENT = 'neutral'
+PROVISIONAL_MULTIPLIER = 1.0
+MAX_ATTEMPTS = 5
+
+# Documents an activity's XP difference is credited to
+XP_TARGETS = ('users', 'daily_stats')
+
+
+def score_reflection(reflection):
+    """Score a reflection with the sentiment chain; (sentiment, multiplier, result)"""
+    result = analyze_sentiment(reflection)
+    return result['sentiment'], result['multiplier'], result
+
+
+def _job_document(activity_log, provisional_xp, now):
+    return {
+        'activity_id': activity_log['_id'],
+        'user_id': activity_log['user_id'],
+        'reflection': activity_log['reflection'],
+        'date': activity_log['timestamp'].replace(hour=0, minute=0, second=0, microsecond=0),
+        'provisional_xp': provisional_xp,
+        'status': 'pending',
+        'attempts': 0,
+        'created_at': now,
+        'available_at': now
+    }
+
+
+def enqueue_sentiment_job(db, activity_log, provisional_xp):
+    """Record a scoring job for an activity that was stored as pending"""
+    return enqueue_sentiment_jobs(db, [activity_log], provisional_xp)
+
+
+def enqueue_sentiment_jobs(db, activity_logs, provisional_xp):
+    """
+    Record scoring jobs for pending activities with one insert. If that
+    fails, the activities keep their provisional XP and are marked
+    'provisional' instead of staying pending without a job.
+    """
+    if not activity_logs:
+        return True
+    now = datetime.utcnow()
+    try:
+        db.sentiment_jobs.insert_many([_job_document(log, provisional_xp, now) for log in activity_logs])
+    except PyMongoError as e:
+        logger.error(f"Failed to enqueue {len(activity_logs)} sentiment jobs: {e}")
+        try:
+            db.activities.update_many(
+                {'_id': {'$in': [log['_id'] for log in activity_logs]}, 'sentiment_status': 'pending'},
+                {'$set': {'sentiment_status': 'provisional'}}
+            )
+        except PyMongoError as e:
+            logger.error(f"Failed to mark activities provisional: {e}")
+        return False
+    if _workers is not None:
+        _workers.wake()
+    return True
+
+
+def claim_job(db, lease_seconds):
+    """Atomically take the oldest runnable job, or one whose lease expired"""
+    now = datetime.utcnow()
+    return db.sentiment_jobs.find_one_and_update(
+        {
+            '$or': [
+                {'status': 'pending', 'available_at': {'$lte': now}},
+                {'status': 'processing', 'lease_expires_at': {'$lt': now}}
+            ]
+        },
+        {
+            '$set': {'status': 'processing', 'lease_expires_at': now + timedelta(seconds=lease_seconds)},
+            '$inc': {'attempts': 1}
+        },
+        sort=[('created_at', 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def process_job(db, job):
+    """Score a job's reflection and settle the XP difference"""
+    sentiment, multiplier, result = score_reflection(job['reflection'])
+    xp_earned = int(BASE_XP * multiplier)
+
+    # Only the pending -> scored transition records the XP difference
+    db.activities.update_one(
+        {'_id': job['activity_id'], 'sentiment_status': 'pending'},
+        {'$set': {
+            'sentiment': sentiment,
+            'multiplier': multiplier,
+            'sentiment_score': result['score'],
+            'sentiment_model': result['model_used'],
+            'sentiment_status': 'scored',
+            'xp_earned': xp_earned,
+            'xp_delta': xp_earned - job['provisional_xp'],
+            'xp_pending': list(XP_TARGETS),
+            'scored_at': datetime.utcnow()
+        }}
+    )
+
+    # Also finishes an activity a previous attempt scored but did not settle
+    activity = db.activities.find_one(
+        {'_id': job['activity_id'], 'xp_pending.0': {'$exists': True}},
+        {'user_id': 1, 'timestamp': 1, 'xp_delta': 1, 'xp_pending': 1}
+    )
+    if activity is not None:
+        settle_activity_xp(db, activity)
+
+    db.sentiment_jobs.update_one(
+        {'_id': job['_id']},
+        {'$set': {'status': 'done', 'finished_at': datetime.utcnow()}}
+    )
+
+
+def settle_activity_xp(db, activity):
+    """Credit an activity's XP difference to each document still in xp_pending"""
+    xp_delta = activity.get('xp_delta', 0)
+    pending = activity.get('xp_pending', ())
+
+    if 'users' in pending:
+        if xp_delta:
+            confirmed_update(db, 'users', {'_id': activity['user_id']},
+                             {'$inc': {'current_xp': xp_delta, 'total_xp': xp_delta}})
+        db.activities.update_one({'_id': activity['_id']}, {'$pull': {'xp_pending': 'users'}})
+
+    if 'daily_stats' in pending:
+        if xp_delta:
+            increment_daily_stats(db, activity['user_id'], {'xp_gained': xp_delta},
+                                  moment=activity['timestamp'], confirm=True)
+        db.activities.update_one({'_id': activity['_id']}, {'$pull': {'xp_pending': 'daily_stats'}})
+
+
+def fail_job(db, job, error):
+    """Put a job back with a backoff, or give up after MAX_ATTEMPTS"""
+    if job['attempts'] >= MAX_ATTEMPTS:
+        update = {'status': 'failed', 'error': str(error), 'finished_at': datetime.utcnow()}
+    else:
+        backoff = timedelta(seconds=2 ** job['attempts'])
+        update = {'status': 'pending', 'error': str(error), 'available_at': datetime.utcnow() + backoff}
+    db.sentiment_jobs.update_one({'_id': job['_id']}, {'$set': update})
+
+
+class SentimentJobWorkers:
+    """Pool of threads that drain the sentiment_jobs collection"""
+
+    def __init__(self, db, workers=2, lease_seconds=60, poll_interval=1.0):
+        self.db = db
+        self.workers = max(1, workers)
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"sentiment-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = claim_job(self.db, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Failed to claim sentiment job: {e}")
+                job = None
+
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+
+            try:
+                process_job(self.db, job)
+                with self._lock:
+                    self.processed += 1
+            except Exception as e:
+                logger.error(f"Sentiment job {job['_id']} failed: {e}")
+                with self._lock:
+                    self.failed += 1
+                try:
+                    fail_job(self.db, job, e)
+                except Exception as e:
+                    logger.error(f"Failed to reschedule sentiment job {job['_id']}: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'processed': self.processed,
+                'failed': self.failed
+            }
+
+
+_workers = None
+
+
+def start_sentiment_workers(db, workers, lease_seconds, poll_interval):
+    """Start the process-wide worker pool (once)"""
+    global _workers
+    if _workers is None:
+        _workers = SentimentJobWorkers(db, workers, lease_seconds, poll_interval)
+        _workers.start()
+        logger.info(f"✅ Started {workers} sentiment job workers")
+    return _workers
+
+
+def get_sentiment_job_metrics():
+    return _workers.stats() if _workers is not None else {'workers': 0}
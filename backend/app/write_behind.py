@@ -0,0 +1,339 @@
+"""
+Optional write-behind buffer for counter updates.
+
+Every activity log (single or batch sync) adds XP with its own $inc on
+the user's document, and every activity log or quest completion adds to the
+day's daily_stats document. With WRITE_BEHIND_ENABLED these updates are
+held in memory for WRITE_BEHIND_WINDOW_MS and merged per (collection,
+query) - $inc values are summed, $min/$max keep the extreme, the first
+$setOnInsert wins - then written as one unordered bulk_write per
+collection. A user logging several activities in a burst costs one write
+to the users collection per window instead of one per request. The
+sentiment job worker writes directly: its updates are conditional on the
+activity not having been credited yet, which cannot be merged.
+
+At most WRITE_BEHIND_MAX_PENDING distinct updates are held. The request
+that fills the buffer flushes it on its own thread, so under sustained load
+requests wait for writes instead of growing the buffer without bound.
+
+Failed writes are appended to a local JSON lines spill file and replayed on
+the next start and periodically while the buffer runs. The buffer is flushed
+when the process exits. A write that failed with a network error may have
+been applied before the connection dropped, so a replayed spill can apply
+such an increment twice.
+
+Buffered updates are not durable: buffered_update returns before anything
+is written, and a crash (or a failed spill) loses what was still in memory.
+A caller that records an update as done (a completion flag, a removed
+pending step) must write it with confirmed_update instead. That writes the
+update, together with anything buffered for the same document, before it
+returns, and raises if the write fails.
+
+Reads that need exact values (e.g. XP before a level-up) call
+flush_pending_writes(user_id) first; it returns once everything buffered
+for that user has been written, including a flush already in progress.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+
+from bson import json_util
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+MERGEABLE_OPERATORS = ('$inc', '$min', '$max', '$setOnInsert')
+SPILL_RETRY_SECONDS = 30
+
+
+def _merge(target, update):
+    """Merge one update document into another, in place"""
+    for operator, fields in update.items():
+        current = target.setdefault(operator, {})
+        for field, value in fields.items():
+            if field not in current:
+                current[field] = value
+            elif operator == '$inc':
+                current[field] += value
+            elif operator == '$min':
+                current[field] = min(current[field], value)
+            elif operator == '$max':
+                current[field] = max(current[field], value)
+
+
+def _check_mergeable(update):
+    for operator in update:
+        if operator not in MERGEABLE_OPERATORS:
+            raise ValueError(f"{operator} updates cannot be buffered")
+
+
+def _final_update(update):
+    """Drop $setOnInsert fields that another operator of the merged update sets"""
+    written = {field for operator, fields in update.items() if operator != '$setOnInsert' for field in fields}
+    final = {operator: fields for operator, fields in update.items() if operator != '$setOnInsert'}
+    on_insert = {field: value for field, value in update.get('$setOnInsert', {}).items() if field not in written}
+    if on_insert:
+        final['$setOnInsert'] = on_insert
+    return final
+
+
+class WriteBehindBuffer:
+    """Coalesces counter updates in memory and flushes them in bulk"""
+
+    def __init__(self, window=0.25, spill_path='write_behind_spill.jsonl', max_pending=10000):
+        self.window = window
+        self.spill_path = spill_path
+        self.max_pending = max_pending
+        self.db = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        # Held while a batch is taken and written, so a flush for exact reads
+        # also waits for a write the background thread already started
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.buffered = 0
+        self.written = 0
+        self.flushes = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.full_flushes = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and not self._stop.is_set()
+
+    def start(self, db):
+        if self._thread is not None:
+            return
+        self.db = db
+        self._replay_spill()
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stop the flush thread and write everything still buffered"""
+        if self._thread is None or self._stop.is_set():
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def update(self, collection, query, update, upsert=False):
+        """Buffer an update made only of MERGEABLE_OPERATORS"""
+        _check_mergeable(update)
+
+        key = (collection, json_util.dumps(query, sort_keys=True))
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._pending[key] = {'collection': collection, 'query': query, 'update': {}, 'upsert': upsert}
+            entry['upsert'] = entry['upsert'] or upsert
+            _merge(entry['update'], update)
+            self.buffered += 1
+            full = len(self._pending) >= self.max_pending
+        if full:
+            # Back-pressure: write now rather than let the buffer keep growing
+            with self._lock:
+                self.full_flushes += 1
+            self.flush()
+
+    def write_now(self, collection, query, update, upsert=False):
+        """
+        Write an update before returning, merged with anything buffered for
+        the same document. If the write fails the buffered part goes back
+        into the buffer and the error is raised.
+        """
+        _check_mergeable(update)
+        key = (collection, json_util.dumps(query, sort_keys=True))
+        with self._lock:
+            entry = self._pending.pop(key, None)
+
+        merged = {}
+        if entry is not None:
+            _merge(merged, entry['update'])
+            upsert = upsert or entry['upsert']
+        _merge(merged, update)
+
+        target = self.db.get_collection(collection)
+        try:
+            try:
+                target.update_one(query, _final_update(merged), upsert=upsert)
+            except DuplicateKeyError:
+                if not upsert:
+                    raise
+                # Raced another insert of the same document; it exists now
+                target.update_one(query, _final_update(merged), upsert=True)
+        except PyMongoError:
+            if entry is not None:
+                self.update(collection, entry['query'], entry['update'], entry['upsert'])
+            raise
+
+        with self._lock:
+            self.written += 1 if entry is None else 2
+
+    def flush(self, user_id=None):
+        """Write buffered updates (only the user's, if given); returns how many were written"""
+        with self._flush_lock:
+            with self._lock:
+                if user_id is None:
+                    entries = list(self._pending.values())
+                    self._pending.clear()
+                else:
+                    keys = [
+                        key for key, entry in self._pending.items()
+                        if user_id in (entry['query'].get('_id'), entry['query'].get('user_id'))
+                    ]
+                    entries = [self._pending.pop(key) for key in keys]
+            if entries:
+                self._write(entries)
+            return len(entries)
+
+    def _write(self, entries):
+        by_collection = {}
+        for entry in entries:
+            by_collection.setdefault(entry['collection'], []).append(entry)
+
+        for collection, batch in by_collection.items():
+            operations = [
+                UpdateOne(entry['query'], _final_update(entry['update']), upsert=entry['upsert'])
+                for entry in batch
+            ]
+            try:
+                self.db.get_collection(collection).bulk_write(operations, ordered=False)
+                failed = []
+            except BulkWriteError as e:
+                errors = [(batch[error['index']], error.get('code')) for error in e.details.get('writeErrors', [])]
+                failed = self._retry_duplicate_upserts(collection, errors)
+            except PyMongoError as e:
+                logger.error(f"Write-behind flush to {collection} failed: {e}")
+                failed = batch
+
+            with self._lock:
+                self.flushes += 1
+                self.written += len(batch) - len(failed)
+            if failed:
+                self._spill(failed)
+
+    def _retry_duplicate_upserts(self, collection, errors):
+        """Upserts that raced another insert of the same document succeed when retried"""
+        failed = []
+        for entry, code in errors:
+            if code != 11000 or not entry['upsert']:
+                failed.append(entry)
+                continue
+            try:
+                self.db.get_collection(collection).update_one(
+                    entry['query'], _final_update(entry['update']), upsert=True
+                )
+            except PyMongoError as e:
+                logger.error(f"Write-behind retry on {collection} failed: {e}")
+                failed.append(entry)
+        return failed
+
+    def _spill(self, entries):
+        """Append failed updates to the spill file so they survive a restart"""
+        try:
+            with self._lock, open(self.spill_path, 'a') as f:
+                for entry in entries:
+                    f.write(json_util.dumps(entry) + '\n')
+                self.spilled += len(entries)
+            logger.warning(f"⚠️ Spilled {len(entries)} write-behind updates to {self.spill_path}")
+        except OSError as e:
+            logger.error(f"Could not spill {len(entries)} write-behind updates: {e}")
+
+    def _replay_spill(self):
+        """Buffer the updates of a spill file left by an earlier failure"""
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        # Renaming claims the file, so only one worker process replays it
+        claimed = f'{self.spill_path}.replay-{os.getpid()}'
+        try:
+            os.rename(self.spill_path, claimed)
+        except OSError:
+            return
+
+        count = 0
+        with open(claimed) as f:
+            for line in f:
+                if line.strip():
+                    entry = json_util.loads(line)
+                    self.update(entry['collection'], entry['query'], entry['update'], entry['upsert'])
+                    count += 1
+        os.remove(claimed)
+        with self._lock:
+            self.replayed += count
+        logger.info(f"Replaying {count} spilled write-behind updates")
+
+    def _run(self):
+        next_replay = time.monotonic() + SPILL_RETRY_SECONDS
+        while not self._stop.is_set():
+            self._wake.wait(self.window)
+            self._wake.clear()
+            try:
+                if time.monotonic() >= next_replay:
+                    next_replay = time.monotonic() + SPILL_RETRY_SECONDS
+                    self._replay_spill()
+                self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.running,
+                'window_ms': int(self.window * 1000),
+                'pending': len(self._pending),
+                'buffered': self.buffered,
+                'written': self.written,
+                'flushes': self.flushes,
+                'spilled': self.spilled,
+                'replayed': self.replayed,
+                'full_flushes': self.full_flushes
+            }
+
+
+WRITE_BEHIND = WriteBehindBuffer(
+    Config.WRITE_BEHIND_WINDOW_MS / 1000,
+    Config.WRITE_BEHIND_SPILL_PATH,
+    Config.WRITE_BEHIND_MAX_PENDING
+)
+
+
+def start_write_behind(db):
+    WRITE_BEHIND.start(db)
+    logger.info(f"✅ Write-behind buffer started ({Config.WRITE_BEHIND_WINDOW_MS} ms window)")
+
+
+def buffered_update(db, collection, query, update, upsert=False):
+    """update_one through the write-behind buffer when it runs, directly otherwise (not durable on return)"""
+    if WRITE_BEHIND.running:
+        WRITE_BEHIND.update(collection, query, update, upsert)
+    else:
+        db.get_collection(collection).update_one(query, update, upsert=upsert)
+
+
+def confirmed_update(db, collection, query, update, upsert=False):
+    """update_one that has been written when it returns, even while the buffer runs"""
+    if WRITE_BEHIND.running:
+        WRITE_BEHIND.write_now(collection, query, update, upsert)
+    else:
+        db.get_collection(collection).update_one(query, update, upsert=upsert)
+
+
+def flush_pending_writes(user_id):
+    """Write the user's buffered updates now; True if there were any"""
+    return WRITE_BEHIND.running and WRITE_BEHIND.flush(user_id) > 0
+
+
+def get_write_behind_metrics():
+    return WRITE_BEHIND.stats()
@@ -0,0 +1,7 @@
+"""Helpers shared by the benchmark scripts."""
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty sequence"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
@@ -0,0 +1,58 @@
+"""
+Memory benchmark for the streaming history export.
+
+Streams the export of a synthetic user with --rows activities (plus one
+daily_stats and quest_progress document per day) through
+app.activity_export.export_stream, discarding the output like a client
+socket would. The synthetic collections generate documents lazily, the way
+a Mongo cursor fetches batches, so the Python heap measured with tracemalloc
+is what the export itself holds. Fails (exit code 1) if the peak exceeds
+--max-peak-mb.
+
+Run from the backend directory:
+    python -m benchmarks.bench_export_memory --rows 1000000 --format csv --gzip
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+from app.activity_export import export_stream
+from tests.synthetic_export import SyntheticUser
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000, help='synthetic activities')
+    parser.add_argument('--format', default='ndjson', choices=('ndjson', 'csv'))
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--max-peak-mb', type=float, default=16)
+    args = parser.parse_args()
+
+    db = SyntheticUser(args.rows)
+    tracemalloc.start()
+    started = time.perf_counter()
+    total_bytes = 0
+    chunks = 0
+    for chunk in export_stream(db, 'user', args.format, gzip=args.gzip, batch_size=args.batch_size):
+        total_bytes += len(chunk)
+        chunks += 1
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    peak_mb = peak / 1024 / 1024
+    print(f"{args.rows} activities as {args.format}{' (gzip)' if args.gzip else ''}: "
+          f"{total_bytes / 1024 / 1024:.1f} MB in {chunks} chunks, {elapsed:.1f}s "
+          f"({args.rows / elapsed:,.0f} rows/s)")
+    print(f"peak traced memory {peak_mb:.2f} MB (limit {args.max_peak_mb:.0f} MB)")
+    if peak_mb > args.max_peak_mb:
+        print("FAIL: export memory grew with the history size")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
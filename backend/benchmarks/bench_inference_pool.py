@@ -0,0 +1,139 @@
+"""
+Request-thread latency with sentiment inference in-process vs. in a pool.
+
+Runs a mixed load for a fixed duration: INFERENCE client threads keep
+scoring reflections while LIGHT client threads run a small request-like task
+(JSON round trip of a user document) and record its latency. The same load
+is run with inference on the request threads and then with inference in
+worker processes, and p50/p95/p99 of the light requests are compared.
+
+Run from the backend directory:
+    python -m benchmarks.bench_inference_pool --workers 2
+    python -m benchmarks.bench_inference_pool --synthetic   # no model needed
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ai import sentiment
+from benchmarks._util import percentile
+
+REFLECTIONS = [
+    "Feeling great after my morning run!",
+    "So tired today, barely slept.",
+    "Really proud of finishing all my quests.",
+    "Stressed about work but managed a short walk.",
+]
+
+USER_DOC = {
+    'username': 'hero_warrior', 'level': 12, 'current_xp': 340, 'total_xp': 5400,
+    'stats': {'strength': 32, 'wisdom': 30, 'vitality': 34},
+    'quests_completed': [f'quest_{i}' for i in range(50)],
+}
+
+
+THINK_TIME = 0.005
+
+
+def synthetic_infer(texts):
+    """Pure-Python CPU work standing in for model inference (holds the GIL)"""
+    total = 0
+    for text in texts:
+        for i in range(200_000):
+            total += (i * len(text)) % 7
+    return [("neutral", 0.0) for _ in texts]
+
+
+def light_request():
+    return json.loads(json.dumps(USER_DOC))
+
+
+def run_mixed_load(infer, inference_clients, light_clients, duration):
+    stop = threading.Event()
+    latencies = []
+    inferences = [0]
+    lock = threading.Lock()
+
+    def inference_client(offset):
+        i = offset
+        while not stop.is_set():
+            infer([REFLECTIONS[i % len(REFLECTIONS)]])
+            i += 1
+            with lock:
+                inferences[0] += 1
+
+    def light_client():
+        # Latency counts from when the request is due (end of the think time)
+        # so time spent waiting to get scheduled onto the GIL is included
+        local = []
+        while not stop.is_set():
+            due = time.perf_counter() + THINK_TIME
+            time.sleep(THINK_TIME)
+            light_request()
+            local.append((time.perf_counter() - due) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=inference_client, args=(n,)) for n in range(inference_clients)]
+    threads += [threading.Thread(target=light_client) for _ in range(light_clients)]
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    return {
+        'light_requests': len(latencies),
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'inferences_per_sec': round(inferences[0] / duration, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2, help='inference worker processes')
+    parser.add_argument('--inference-clients', type=int, default=4)
+    parser.add_argument('--light-clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--synthetic', action='store_true',
+                        help='use pure-Python CPU work instead of the transformers model')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        in_process = synthetic_infer
+        pool = ProcessPoolExecutor(max_workers=args.workers)
+        out_of_process = lambda texts: pool.submit(synthetic_infer, texts).result()
+    else:
+        if not sentiment.warm_up_sentiment_model():
+            raise SystemExit("transformers pipeline is not available (try --synthetic)")
+        in_process = sentiment._infer_transformers_local
+        sentiment.start_inference_pool(args.workers)
+        sentiment.warm_up_sentiment_model()
+        out_of_process = sentiment._infer_transformers
+
+    baseline = run_mixed_load(lambda texts: time.sleep(0.05), args.inference_clients,
+                              args.light_clients, args.duration)
+    local = run_mixed_load(in_process, args.inference_clients, args.light_clients, args.duration)
+    remote = run_mixed_load(out_of_process, args.inference_clients, args.light_clients, args.duration)
+
+    if args.synthetic:
+        pool.shutdown()
+    else:
+        sentiment.stop_inference_pool()
+
+    print(f"{'mode':<16} {'requests':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'infer/s':>9}")
+    for name, result in (('no inference', baseline), ('in-process', local),
+                         (f'pool x{args.workers}', remote)):
+        print(f"{name:<16} {result['light_requests']:>9} {result['p50_ms']:>9} "
+              f"{result['p95_ms']:>9} {result['p99_ms']:>9} {result['inferences_per_sec']:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Microbenchmark for the compiled lexicon engine.
+
+Scores journal entries of increasing length with the previous approach
+(one substring scan per keyword and phrase) and with a single pass over the
+compiled LexiconEngine. The engine's time per character should stay flat as
+entries grow, and it should not grow with the vocabulary either.
+
+Run from the backend directory:
+    python -m benchmarks.bench_lexicon
+"""
+
+import argparse
+import random
+import time
+
+from ai import sentiment
+from ai.lexicon import LexiconEngine
+
+FILLER = ("today i went for a walk around the park and then had lunch with friends "
+          "before heading back home to rest and read for a while").split()
+
+
+def make_entry(n_words, seed=7):
+    rng = random.Random(seed)
+    vocab = FILLER + list(sentiment.POSITIVE_WORDS) + list(sentiment.NEGATIVE_WORDS)
+    return ' '.join(rng.choice(vocab) for _ in range(n_words))
+
+
+def substring_scan(text, vocabulary):
+    """The old approach: `term in text_lower` for every term"""
+    text_lower = text.lower()
+    return sum(1 for term in vocabulary if term in text_lower)
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--vocab-scale', type=int, default=20,
+                        help='multiply the vocabulary to show the dependency on its size')
+    args = parser.parse_args()
+
+    base_vocab = (list(sentiment.POSITIVE_WORDS) + list(sentiment.NEGATIVE_WORDS)
+                  + list(sentiment.INTENSITY_MODIFIERS) + list(sentiment.NEGATIONS)
+                  + sentiment.POSITIVE_PHRASES + sentiment.NEGATIVE_PHRASES
+                  + sentiment.NEUTRAL_PHRASES)
+    big_vocab = base_vocab + [f"{term}{i}" for i in range(args.vocab_scale) for term in base_vocab]
+    big_engine = LexiconEngine({'term': {term: 1.0 for term in big_vocab}})
+
+    print(f"{'words':>8} {'chars':>9} | {'substring':>12} {'engine':>12} | "
+          f"{'substring x' + str(args.vocab_scale):>16} {'engine x' + str(args.vocab_scale):>14}   (ns/char)")
+
+    for n_words in (50, 500, 5000, 50000):
+        text = make_entry(n_words)
+        chars = len(text)
+
+        timings = [
+            best_of(lambda: substring_scan(text, base_vocab), args.repeat),
+            best_of(lambda: sentiment.SENTIMENT_LEXICON.scan(text), args.repeat),
+            best_of(lambda: substring_scan(text, big_vocab), args.repeat),
+            best_of(lambda: big_engine.scan(text), args.repeat),
+        ]
+        per_char = [t / chars * 1e9 for t in timings]
+
+        print(f"{n_words:>8} {chars:>9} | {per_char[0]:>12.1f} {per_char[1]:>12.1f} | "
+              f"{per_char[2]:>16.1f} {per_char[3]:>14.1f}")
+
+    print(f"\nVocabulary: {len(base_vocab)} terms (x{args.vocab_scale}: {len(big_vocab)} terms)")
+
+
+if __name__ == '__main__':
+    main()
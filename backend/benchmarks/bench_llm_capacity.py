@@ -0,0 +1,87 @@
+"""
+Capacity benchmark for the LLM call path behind the AI endpoints.
+
+Drives app.llm.generate_text from many concurrent "request" threads with
+the in-process stand-in provider, so thread usage, deadlines, bulkhead
+rejections and fallbacks can be measured without an API key or network.
+Reports request latency percentiles, how many requests got a fallback and
+the llm metrics (bulkhead queue depth, wait times, late results).
+
+Run from the backend directory:
+    python -m benchmarks.bench_llm_capacity --clients 32 --requests 400 \
+        --latency-ms 2000 --spread-ms 1500 --error-rate 0.05
+
+Pass --replay recording.jsonl to use a recording made with LLM_RECORD_PATH
+instead of canned answers.
+"""
+
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ai.providers import ReplayProvider, StandInProvider, set_provider
+from app import llm
+from benchmarks._util import percentile
+
+ENDPOINTS = ('health_insights', 'workout_plan', 'nutrition_tips', 'coaching', 'narrative')
+FALLBACK = object()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=32, help='concurrent request threads')
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--distinct-prompts', type=int, default=50)
+    parser.add_argument('--latency-dist', default='lognormal', choices=('fixed', 'uniform', 'lognormal'))
+    parser.add_argument('--latency-ms', type=float, default=2000)
+    parser.add_argument('--spread-ms', type=float, default=1500)
+    parser.add_argument('--error-rate', type=float, default=0.05)
+    parser.add_argument('--replay', help='JSON lines recording to replay instead of the stand-in')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.replay:
+        set_provider(ReplayProvider(args.replay, replay_latency=True))
+        with open(args.replay) as f:
+            prompts = [(r['model'], r['prompt']) for r in map(json.loads, f) if r]
+    else:
+        set_provider(StandInProvider(args.latency_dist, args.latency_ms, args.spread_ms,
+                                     args.error_rate, seed=args.seed))
+        prompts = [('gemini-1.5-flash', f'workout plan for user {i}') for i in range(args.distinct_prompts)]
+
+    rng = random.Random(args.seed)
+    jobs = [(rng.choice(ENDPOINTS), *rng.choice(prompts)) for _ in range(args.requests)]
+    latencies = []
+    fallbacks = 0
+    lock = threading.Lock()
+
+    def run(job):
+        nonlocal fallbacks
+        endpoint, model, prompt = job
+        started = time.perf_counter()
+        result = llm.generate_text(prompt, model, endpoint, lambda: FALLBACK)
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed)
+            if result is FALLBACK:
+                fallbacks += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        list(pool.map(run, jobs))
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.requests} requests from {args.clients} clients in {elapsed:.1f}s "
+          f"({args.requests / elapsed:.1f} req/s)")
+    print(f"latency ms  p50 {statistics.median(latencies):.0f}  p95 {percentile(latencies, 95):.0f}  "
+          f"max {max(latencies):.0f}")
+    print(f"fallbacks   {fallbacks} ({fallbacks / args.requests:.1%})")
+    print(json.dumps(llm.get_llm_metrics(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
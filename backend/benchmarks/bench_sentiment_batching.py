@@ -0,0 +1,88 @@
+"""
+Compare single-item transformers inference against the micro-batching queue.
+
+Simulates a check-in spike: CONCURRENCY client threads each score ITEMS
+reflections, first by calling the pipeline one text at a time, then by
+submitting to a SentimentBatcher. Reports reflections per second for both.
+
+Run from the backend directory:
+    python -m benchmarks.bench_sentiment_batching --concurrency 32 --items 20
+"""
+
+import argparse
+import threading
+import time
+
+from ai import sentiment
+
+REFLECTIONS = [
+    "Feeling great after my morning run!",
+    "So tired today, barely slept.",
+    "Meh, nothing special happened.",
+    "Really proud of finishing all my quests.",
+    "Stressed about work but managed a short walk.",
+    "Had a wonderful, relaxing meditation session.",
+    "Exhausted and a bit frustrated with my progress.",
+    "Pretty good day overall, drank plenty of water.",
+]
+
+
+def run_clients(score_one, concurrency, items):
+    """Run concurrent clients and return reflections per second"""
+    start_barrier = threading.Barrier(concurrency + 1)
+
+    def client(offset):
+        start_barrier.wait()
+        for i in range(items):
+            score_one(REFLECTIONS[(offset + i) % len(REFLECTIONS)])
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+
+    start_barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    return (concurrency * items) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--items', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=sentiment.SENTIMENT_BATCH_SIZE)
+    parser.add_argument('--wait-ms', type=float, default=sentiment.SENTIMENT_BATCH_WAIT_MS)
+    args = parser.parse_args()
+
+    if not sentiment.warm_up_sentiment_model():
+        raise SystemExit("transformers pipeline is not available")
+
+    single = run_clients(
+        lambda text: sentiment._infer_transformers([text]),
+        args.concurrency, args.items
+    )
+
+    batcher = sentiment.SentimentBatcher(
+        sentiment._infer_transformers,
+        max_batch_size=args.batch_size,
+        max_wait_ms=args.wait_ms,
+    )
+    batched = run_clients(
+        lambda text: batcher.submit(text).result(),
+        args.concurrency, args.items
+    )
+
+    print(f"Model:          {sentiment.HF_MODEL}")
+    print(f"Clients:        {args.concurrency} x {args.items} reflections")
+    print(f"Single-item:    {single:8.1f} reflections/sec")
+    print(f"Micro-batched:  {batched:8.1f} reflections/sec "
+          f"(batch size {args.batch_size}, wait {args.wait_ms:g} ms, "
+          f"avg batch {batcher.items / max(1, batcher.batches):.1f})")
+    print(f"Speedup:        {batched / single:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Accuracy and latency benchmark for every sentiment analyzer tier.
+
+Runs each tier over a labelled corpus (JSON lines with "text" and "label")
+and reports items/sec, p50/p95 latency per item, peak memory allocated
+during a pass, and agreement with the labels. Results are written as JSON
+so runs can be compared between releases.
+
+Tiers:
+- transformers           ai.sentiment.analyze_sentiment_transformers
+- enhanced-rule-based    ai.sentiment.analyze_sentiment_enhanced_rulebased
+- simple-rule-based      ai.sentiment.analyze_sentiment_rulebased
+- activity-keywords      app.routes.activity_routes.analyze_sentiment
+
+Tiers whose dependencies are missing are reported as skipped.
+
+Run from the backend directory:
+    python -m benchmarks.bench_sentiment_tiers --output sentiment_benchmark.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from ai import sentiment
+from ai.cache import TTLCache
+from benchmarks._util import percentile
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), 'sentiment_corpus.jsonl')
+LABELS = ('positive', 'neutral', 'negative')
+
+
+def load_corpus(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_tiers():
+    """Return {name: callable(text) -> sentiment label} and {name: reason} for skipped tiers"""
+    tiers = {}
+    skipped = {}
+
+    if sentiment.warm_up_sentiment_model():
+        tiers['transformers'] = lambda text: sentiment.analyze_sentiment_transformers(text)['sentiment']
+    else:
+        skipped['transformers'] = 'transformers pipeline not available'
+
+    tiers['enhanced-rule-based'] = lambda text: sentiment.analyze_sentiment_enhanced_rulebased(text)['sentiment']
+    tiers['simple-rule-based'] = lambda text: sentiment.analyze_sentiment_rulebased(text)['sentiment']
+
+    try:
+        from app.routes import activity_routes
+        # Entries expire immediately, so every call measures a cache miss
+        activity_routes.SENTIMENT_CACHE = TTLCache(max_size=1, ttl=0)
+        tiers['activity-keywords'] = lambda text: activity_routes.analyze_sentiment(text)[0]
+    except ImportError as e:
+        skipped['activity-keywords'] = f'cannot import activity_routes: {e}'
+
+    return tiers, skipped
+
+
+def run_tier(analyze, corpus, repeat):
+    latencies = []
+    predictions = []
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        predictions = []
+        for item in corpus:
+            t0 = time.perf_counter()
+            predictions.append(analyze(item['text']))
+            latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+
+    # Separate pass so tracing overhead does not skew the timings
+    tracemalloc.start()
+    for item in corpus:
+        analyze(item['text'])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    correct = sum(1 for item, p in zip(corpus, predictions) if p == item['label'])
+    confusion = {label: {other: 0 for other in LABELS} for label in LABELS}
+    for item, p in zip(corpus, predictions):
+        if item['label'] in confusion and p in confusion[item['label']]:
+            confusion[item['label']][p] += 1
+
+    return {
+        'items': len(corpus) * repeat,
+        'items_per_sec': round(len(corpus) * repeat / elapsed, 1),
+        'latency_ms_p50': round(statistics.median(latencies), 4),
+        'latency_ms_p95': round(percentile(latencies, 95), 4),
+        'peak_memory_kb': round(peak / 1024, 1),
+        'agreement': round(correct / len(corpus), 4),
+        'confusion': confusion,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default='sentiment_benchmark.json')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    tiers, skipped = load_tiers()
+
+    report = {
+        'generated_at': datetime.utcnow().isoformat() + 'Z',
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'hf_model': sentiment.HF_MODEL,
+        'corpus': os.path.basename(args.corpus),
+        'corpus_size': len(corpus),
+        'repeat': args.repeat,
+        'tiers': {},
+        'skipped': skipped,
+    }
+
+    for name, analyze in tiers.items():
+        report['tiers'][name] = run_tier(analyze, corpus, args.repeat)
+        result = report['tiers'][name]
+        print(f"{name:<22} {result['items_per_sec']:>10} items/s  "
+              f"p50 {result['latency_ms_p50']:>8} ms  p95 {result['latency_ms_p95']:>8} ms  "
+              f"peak {result['peak_memory_kb']:>8} KB  agreement {result['agreement']:.2%}")
+    for name, reason in skipped.items():
+        print(f"{name:<22} skipped: {reason}")
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
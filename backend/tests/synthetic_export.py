@@ -0,0 +1,78 @@
+"""
+Synthetic export source: a user whose activities, daily stats and quest
+progress are generated lazily, shared by tests/test_activity_export.py and
+benchmarks/bench_export_memory.py.
+"""
+
+from datetime import datetime, timedelta
+
+ACTIVITIES_PER_DAY = 4
+
+
+class SyntheticCursor:
+    """Generates documents on iteration, fetched in batches like a Mongo cursor"""
+
+    def __init__(self, make_doc, count):
+        self.make_doc = make_doc
+        self.count = count
+        # Size of MongoDB's first batch when batch_size is not set
+        self.batch = 101
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def batch_size(self, size):
+        self.batch = size
+        return self
+
+    def __iter__(self):
+        for start in range(0, self.count, self.batch):
+            yield from [self.make_doc(i) for i in range(start, min(start + self.batch, self.count))]
+
+    def close(self):
+        pass
+
+
+class SyntheticCollection:
+    def __init__(self, make_doc, count):
+        self.make_doc = make_doc
+        self.count = count
+
+    def find(self, query, projection):
+        return SyntheticCursor(self.make_doc, self.count)
+
+
+class SyntheticUser:
+    """Stands in for the Database with the collections the export reads"""
+
+    def __init__(self, rows):
+        start = datetime(2020, 1, 1)
+        days = rows // ACTIVITIES_PER_DAY + 1
+        self.collections = {
+            'activities': SyntheticCollection(lambda i: {
+                '_id': f'{i:024x}',
+                'timestamp': start + timedelta(minutes=i * 360 // ACTIVITIES_PER_DAY),
+                'reflection': f'Walked, meditated and drank water on check-in {i}.',
+                'sentiment': 'positive',
+                'multiplier': 1.2,
+                'xp_earned': 12,
+                'activities': {'steps': 8000 + i % 2000, 'water': 6, 'sleep': 7.5}
+            }, rows),
+            'daily_stats': SyntheticCollection(lambda i: {
+                '_id': f'{i:024x}',
+                'date': start + timedelta(days=i),
+                'activities_logged': ACTIVITIES_PER_DAY,
+                'xp_gained': 48,
+                'quests_completed': 3,
+                'activity_entries': ACTIVITIES_PER_DAY,
+                'activity_totals': {'steps': 36000, 'water': 24}
+            }, days),
+            'quest_progress': SyntheticCollection(lambda i: {
+                '_id': f'{i:024x}',
+                'date': start + timedelta(days=i),
+                'completed_quests': ['steps', 'water', 'sleep']
+            }, days)
+        }
+
+    def get_collection(self, name):
+        return self.collections[name]
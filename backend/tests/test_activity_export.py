@@ -0,0 +1,140 @@
+"""
+Output of the streaming history export (see benchmarks/bench_export_memory.py
+for its memory use): NDJSON and CSV records, gzip framing, and buffered
+writes being flushed before the export reads.
+"""
+
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+
+import pytest
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+
+from app import write_behind
+from app.activity_export import CSV_COLUMNS, EXPORT_CHUNK_BYTES, export_stream
+from app.daily_stats import daily_stats_update, day_start
+from app.routes import activity_routes
+from tests.synthetic_export import SyntheticUser
+
+mongomock = pytest.importorskip('mongomock')
+
+TRICKY_REFLECTION = 'Ran 5k, then "rested",\nthen ran again'
+
+
+class MockDatabase:
+    """Stand-in for app.database.Database over a mongomock database"""
+
+    def __init__(self):
+        self.db = mongomock.MongoClient().healthquest
+
+    def __getattr__(self, name):
+        return self.db[name]
+
+    def get_collection(self, name):
+        return self.db[name]
+
+
+@pytest.fixture
+def db():
+    database = MockDatabase()
+    user_id = database.users.insert_one({'username': 'hero'}).inserted_id
+    database.activities.insert_one({
+        'user_id': user_id,
+        'timestamp': datetime(2024, 5, 1, 8, 30),
+        'reflection': TRICKY_REFLECTION,
+        'sentiment': 'positive',
+        'multiplier': 1.2,
+        'xp_earned': 12,
+        'activities': {'steps': 5000, 'water': 4}
+    })
+    database.daily_stats.insert_one({
+        'user_id': user_id,
+        'date': datetime(2024, 5, 1),
+        'activities_logged': 1,
+        'xp_gained': 12,
+        'quests_completed': 0
+    })
+    database.user_id = user_id
+    return database
+
+
+def export_bytes(db, user_id, export_format, compress=False):
+    return b''.join(export_stream(db, user_id, export_format, gzip=compress))
+
+
+def test_ndjson_has_one_record_per_line(db):
+    lines = export_bytes(db, db.user_id, 'ndjson').decode('utf-8').splitlines()
+    records = [json.loads(line) for line in lines]
+
+    assert [record['type'] for record in records] == ['activity', 'daily_stat']
+    activity = records[0]
+    assert activity['reflection'] == TRICKY_REFLECTION
+    assert activity['date'] == '2024-05-01T08:30:00'
+    assert activity['activities'] == {'steps': 5000, 'water': 4}
+
+
+def test_csv_has_header_and_escapes_values(db):
+    text = export_bytes(db, db.user_id, 'csv').decode('utf-8')
+    rows = list(csv.reader(io.StringIO(text)))
+
+    assert tuple(rows[0]) == CSV_COLUMNS
+    activity = dict(zip(CSV_COLUMNS, rows[1]))
+    assert activity['reflection'] == TRICKY_REFLECTION
+    assert json.loads(activity['activities']) == {'steps': 5000, 'water': 4}
+    assert activity['quests_completed'] == ''
+    stat = dict(zip(CSV_COLUMNS, rows[2]))
+    assert stat['type'] == 'daily_stat'
+    assert stat['xp_gained'] == '12'
+    assert len(rows) == 3
+
+
+@pytest.mark.parametrize('export_format', ['ndjson', 'csv'])
+def test_gzip_is_one_valid_stream_of_the_same_bytes(export_format):
+    # Large enough to span several output chunks
+    source = SyntheticUser(5000)
+    plain = export_bytes(source, 'user', export_format)
+    compressed = list(export_stream(source, 'user', export_format, gzip=True))
+
+    assert len(plain) > 2 * EXPORT_CHUNK_BYTES
+    assert b''.join(compressed)[:2] == b'\x1f\x8b'
+    assert gzip.decompress(b''.join(compressed)) == plain
+
+
+@pytest.fixture
+def buffer(db, monkeypatch):
+    # A long window, so only an explicit flush writes the buffered update
+    buffer = write_behind.WriteBehindBuffer(window=60, spill_path=None)
+    monkeypatch.setattr(write_behind, 'WRITE_BEHIND', buffer)
+    buffer.start(db)
+    yield buffer
+    buffer.stop()
+
+
+def test_export_flushes_buffered_writes_first(db, buffer, monkeypatch):
+    monkeypatch.setattr(activity_routes, 'get_db', lambda: db)
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'test-secret-key-with-enough-length'
+    JWTManager(app)
+    app.register_blueprint(activity_routes.activity_bp)
+    with app.app_context():
+        token = create_access_token(identity=str(db.user_id))
+
+    today = day_start()
+    buffer.update('daily_stats', {'user_id': db.user_id, 'date': today},
+                  daily_stats_update({'xp_gained': 30}), upsert=True)
+    assert db.daily_stats.count_documents({'date': today}) == 0
+
+    response = app.test_client().get(
+        '/api/activity/export?format=ndjson',
+        headers={'Authorization': f'Bearer {token}', 'Accept-Encoding': 'gzip'}
+    )
+
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    records = [json.loads(line) for line in gzip.decompress(response.data).decode('utf-8').splitlines()]
+    flushed = records[-1]
+    assert (flushed['type'], flushed['date'], flushed['xp_gained']) == ('daily_stat', today.isoformat(), 30)
@@ -0,0 +1,63 @@
+"""Malformed activities are rejected before anything is written"""
+
+import pytest
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+
+from app.routes import activity_routes
+
+mongomock = pytest.importorskip('mongomock')
+
+
+class MockDatabase:
+    def __init__(self):
+        self.db = mongomock.MongoClient().healthquest
+
+    def __getattr__(self, name):
+        return self.db[name]
+
+    def get_collection(self, name):
+        return self.db[name]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = MockDatabase()
+    database.user_id = database.users.insert_one({'username': 'hero', 'current_xp': 0, 'total_xp': 0}).inserted_id
+    monkeypatch.setattr(activity_routes, 'get_db', lambda: database)
+    return database
+
+
+@pytest.fixture
+def client(db):
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'test-secret-key-with-enough-length'
+    app.config['ACTIVITY_SENTIMENT_ASYNC'] = False
+    JWTManager(app)
+    app.register_blueprint(activity_routes.activity_bp)
+    with app.app_context():
+        token = create_access_token(identity=str(db.user_id))
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    return client
+
+
+@pytest.mark.parametrize('activities', [['steps'], 'steps', {'steps': 'many'}, {'water': True}, {'sleep': -1}])
+def test_log_rejects_malformed_activities(db, client, activities):
+    response = client.post('/api/activity/log', json={'reflection': 'Good walk today', 'activities': activities})
+
+    assert response.status_code == 400
+    assert db.activities.count_documents({}) == 0
+    assert db.daily_stats.count_documents({}) == 0
+    assert db.users.find_one()['total_xp'] == 0
+
+
+def test_batch_rejects_only_malformed_entries(db, client):
+    response = client.post('/api/activity/log/batch', json={'entries': [
+        {'reflection': 'Good walk today', 'activities': ['steps'], 'idempotency_key': 'a'},
+        {'reflection': 'Good walk today', 'activities': {'steps': 4000}, 'idempotency_key': 'b'}
+    ]})
+
+    assert response.status_code == 200
+    assert [item['index'] for item in response.get_json()['rejected']] == [0]
+    assert [doc['idempotency_key'] for doc in db.activities.find()] == ['b']
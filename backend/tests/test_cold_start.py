@@ -0,0 +1,9 @@
+"""Cold-start budget for the API in lazy startup mode (see tools/check_cold_start.py)"""
+
+from tools.check_cold_start import DEFAULT_BUDGET_MS, cold_start_failures, measure_cold_start
+
+
+def test_lazy_startup_fits_the_cold_start_budget():
+    result = measure_cold_start()
+
+    assert cold_start_failures(result, DEFAULT_BUDGET_MS) == []
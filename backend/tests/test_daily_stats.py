@@ -0,0 +1,55 @@
+"""
+Concurrent writers of daily_stats must share one document per (user_id, date).
+
+Runs against MongoDB when MONGO_TEST_URI is set (in a scratch database that
+is dropped afterwards), otherwise against mongomock.
+"""
+
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from bson import ObjectId
+
+from app.daily_stats import day_start, increment_daily_stats, increment_daily_stats_by_day
+from tools.check_daily_stats_race import ScratchDatabase
+
+
+@pytest.fixture
+def db():
+    uri = os.getenv('MONGO_TEST_URI')
+    if uri:
+        from pymongo import MongoClient
+        client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    else:
+        mongomock = pytest.importorskip('mongomock')
+        client = mongomock.MongoClient()
+    name = f'daily_stats_test_{uuid.uuid4().hex[:8]}'
+    database = ScratchDatabase(client[name])
+    database.daily_stats.create_index([('user_id', 1), ('date', 1)], unique=True)
+    yield database
+    client.drop_database(name)
+
+
+def test_concurrent_increments_share_one_day_document(db):
+    user_id = ObjectId()
+    today = day_start()
+    writes = 600
+
+    def write(i):
+        if i % 3 == 0:
+            increment_daily_stats(db, user_id, {'activities_logged': 1, 'xp_gained': 10})
+        elif i % 3 == 1:
+            increment_daily_stats(db, user_id, {'quests_completed': 1, 'xp_gained': 25})
+        else:
+            increment_daily_stats_by_day(db, user_id, {today: {'activities_logged': 1, 'xp_gained': 10}})
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        list(pool.map(write, range(writes)))
+
+    docs = list(db.daily_stats.find({'user_id': user_id, 'date': today}))
+    assert len(docs) == 1
+    assert docs[0]['activities_logged'] == 400
+    assert docs[0]['quests_completed'] == 200
+    assert docs[0]['xp_gained'] == 400 * 10 + 200 * 25
@@ -0,0 +1,38 @@
+"""Terms the rule-based analyzer matches through the compiled lexicon"""
+
+from ai.lexicon import LexiconEngine
+from ai.sentiment import SENTIMENT_LEXICON, analyze_sentiment_enhanced_rulebased
+
+
+def categories(text):
+    _, matches = SENTIMENT_LEXICON.scan(text)
+    return [(match.category, match.term) for match in matches]
+
+
+def test_multi_word_modifiers_soften_the_next_word():
+    plain = analyze_sentiment_enhanced_rulebased('I feel tired today')
+    for modifier in ('a bit', 'kind of'):
+        softened = analyze_sentiment_enhanced_rulebased(f'I feel {modifier} tired today')
+        assert ('intensity', modifier) in categories(f'I feel {modifier} tired today')
+        assert plain['score'] < softened['score'] < 0
+        assert (plain['sentiment'], softened['sentiment']) == ('negative', 'neutral')
+
+
+def test_contractions_are_negations():
+    assert ('negation', "can't") in categories("I can't sleep")
+    assert ('negation', "can't") in categories('I cant sleep')
+    negated = analyze_sentiment_enhanced_rulebased("Honestly I wasn't happy")
+    assert negated['score'] < 0
+
+
+def test_terms_match_whole_tokens_only():
+    assert categories('tokay, alsoso') == []
+    # "also so" is not the neutral phrase "so so", so the score is not clamped to +-0.1
+    assert analyze_sentiment_enhanced_rulebased('Went for a run, also so happy')['score'] > 0.1
+    assert analyze_sentiment_enhanced_rulebased('tokay great')['sentiment'] == 'positive'
+    assert analyze_sentiment_enhanced_rulebased('okay run, felt great')['sentiment'] == 'neutral'
+
+
+def test_count_distinct_counts_each_term_once():
+    engine = LexiconEngine({'positive': {'great': 1.0, 'feel good': 1.0}})
+    assert engine.count_distinct('Great great day, I feel good') == {'positive': 2}
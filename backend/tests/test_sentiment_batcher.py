@@ -0,0 +1,33 @@
+"""Cancelled callers do not take a place in a sentiment batch"""
+
+import threading
+
+from ai.sentiment import SentimentBatcher
+
+
+def test_cancelled_texts_are_not_scored():
+    started = threading.Event()
+    release = threading.Event()
+    batches = []
+
+    def run_batch(texts):
+        batches.append(texts)
+        started.set()
+        release.wait(5)
+        return [text.upper() for text in texts]
+
+    batcher = SentimentBatcher(run_batch, max_batch_size=2, max_wait_ms=50)
+    first = batcher.submit('first')
+    assert started.wait(5)
+
+    # Queued behind the running batch; the caller gives up on the first one
+    timed_out = batcher.submit('timed out')
+    waiting = batcher.submit('waiting')
+    last = batcher.submit('last')
+    assert timed_out.cancel()
+    release.set()
+
+    assert first.result(5) == 'FIRST'
+    assert waiting.result(5) == 'WAITING'
+    assert last.result(5) == 'LAST'
+    assert batches == [['first'], ['waiting', 'last']]
@@ -0,0 +1,79 @@
+"""Settling the XP difference of a background-scored activity"""
+
+from datetime import datetime
+
+import pytest
+
+from app import sentiment_jobs
+
+mongomock = pytest.importorskip('mongomock')
+
+
+class MockDatabase:
+    def __init__(self):
+        self.db = mongomock.MongoClient().healthquest
+
+    def __getattr__(self, name):
+        return self.db[name]
+
+    def get_collection(self, name):
+        return self.db[name]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = MockDatabase()
+    database.users.insert_one({'_id': 'hero', 'current_xp': 10, 'total_xp': 10})
+    database.daily_stats.insert_one({'user_id': 'hero', 'date': datetime(2024, 5, 1), 'xp_gained': 10})
+    activity_id = database.activities.insert_one({
+        'user_id': 'hero',
+        'reflection': 'Great run, felt amazing',
+        'timestamp': datetime(2024, 5, 1, 8, 30),
+        'sentiment_status': 'pending'
+    }).inserted_id
+    database.sentiment_jobs.insert_one({
+        'activity_id': activity_id,
+        'user_id': 'hero',
+        'reflection': 'Great run, felt amazing',
+        'provisional_xp': 10,
+        'status': 'processing',
+        'attempts': 1
+    })
+    monkeypatch.setattr(sentiment_jobs, 'score_reflection',
+                        lambda text: ('positive', 1.2, {'score': 0.9, 'model_used': 'test'}))
+    return database
+
+
+def credited_xp(db):
+    return db.users.find_one({'_id': 'hero'})['total_xp'], db.daily_stats.find_one()['xp_gained']
+
+
+def test_job_credits_xp_difference_once(db):
+    job = db.sentiment_jobs.find_one()
+    sentiment_jobs.process_job(db, job)
+    sentiment_jobs.process_job(db, job)
+
+    assert credited_xp(db) == (12, 12)
+    activity = db.activities.find_one()
+    assert (activity['sentiment_status'], activity['xp_pending']) == ('scored', [])
+    assert db.sentiment_jobs.find_one()['status'] == 'done'
+
+
+def test_retry_after_crash_credits_only_what_is_left(db, monkeypatch):
+    job = db.sentiment_jobs.find_one()
+    increment_daily_stats = sentiment_jobs.increment_daily_stats
+
+    def crash(*args, **kwargs):
+        raise RuntimeError('worker died')
+
+    monkeypatch.setattr(sentiment_jobs, 'increment_daily_stats', crash)
+    with pytest.raises(RuntimeError):
+        sentiment_jobs.process_job(db, job)
+    assert credited_xp(db) == (12, 10)
+    assert db.activities.find_one()['xp_pending'] == ['daily_stats']
+
+    monkeypatch.setattr(sentiment_jobs, 'increment_daily_stats', increment_daily_stats)
+    sentiment_jobs.process_job(db, job)
+
+    assert credited_xp(db) == (12, 12)
+    assert db.activities.find_one()['xp_pending'] == []
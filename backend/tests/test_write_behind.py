@@ -0,0 +1,55 @@
+"""confirmed writes through a running write-behind buffer"""
+
+import pytest
+from pymongo.errors import PyMongoError
+
+from app import write_behind
+
+mongomock = pytest.importorskip('mongomock')
+
+
+class MockDatabase:
+    def __init__(self):
+        self.db = mongomock.MongoClient().healthquest
+
+    def get_collection(self, name):
+        return self.db[name]
+
+
+@pytest.fixture
+def buffer(monkeypatch):
+    # A long window, so nothing is written unless a test asks for it
+    buffer = write_behind.WriteBehindBuffer(window=60, spill_path=None)
+    monkeypatch.setattr(write_behind, 'WRITE_BEHIND', buffer)
+    buffer.start(MockDatabase())
+    yield buffer
+    buffer.stop()
+
+
+def test_confirmed_update_writes_buffered_increments_with_it(buffer):
+    users = buffer.db.get_collection('users')
+    users.insert_one({'_id': 1, 'total_xp': 0})
+    write_behind.buffered_update(buffer.db, 'users', {'_id': 1}, {'$inc': {'total_xp': 10}})
+    assert users.find_one({'_id': 1})['total_xp'] == 0
+
+    write_behind.confirmed_update(buffer.db, 'users', {'_id': 1}, {'$inc': {'total_xp': 5}})
+
+    assert users.find_one({'_id': 1})['total_xp'] == 15
+    assert buffer.stats()['pending'] == 0
+
+
+def test_failed_confirmed_update_keeps_the_buffered_part(buffer, monkeypatch):
+    users = buffer.db.get_collection('users')
+    users.insert_one({'_id': 1, 'total_xp': 0})
+    write_behind.buffered_update(buffer.db, 'users', {'_id': 1}, {'$inc': {'total_xp': 10}})
+
+    def fail(*args, **kwargs):
+        raise PyMongoError('connection lost')
+
+    monkeypatch.setattr(users, 'update_one', fail)
+    with pytest.raises(PyMongoError):
+        write_behind.confirmed_update(buffer.db, 'users', {'_id': 1}, {'$inc': {'total_xp': 5}})
+    monkeypatch.undo()
+
+    buffer.flush()
+    assert users.find_one({'_id': 1})['total_xp'] == 10
@@ -0,0 +1,113 @@
+"""
+Cold-start check for the API.
+
+Loads app.py (which calls create_app) in a fresh interpreter with
+`python -X importtime` and LAZY_STARTUP=true, then fails (exit code 1) if
+loading it takes longer than the budget or if a heavy optional SDK was
+imported at startup instead of on first use. The slowest imports are
+printed to show where time went, along with the time of a second
+create_app() call once everything is imported. tests/test_cold_start.py
+runs the same check under pytest.
+
+Run from the backend directory:
+    python -m tools.check_cold_start --budget-ms 1500
+
+MONGO_URI should point at an address that does not need to answer; in lazy
+mode nothing connects while the app is created. It defaults to a closed
+local port here.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+DEFAULT_BUDGET_MS = float(os.getenv('COLD_START_BUDGET_MS', 1500))
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+# Imported on first use only; seeing one at startup is a regression
+LAZY_MODULES = ('google.genai', 'google.generativeai', 'transformers', 'torch', 'openai', 'requests')
+
+# Loaded by path: `import app` finds the app/ package, not app.py
+LOADER = """
+import importlib.util, json, os, sys, time
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location('healthquest_app', sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+loaded = time.perf_counter()
+module.create_app(os.getenv('FLASK_ENV', 'development'))
+created = time.perf_counter()
+print(json.dumps({'load_ms': (loaded - started) * 1000, 'create_app_ms': (created - loaded) * 1000}))
+"""
+
+
+def measure_cold_start(app_path=APP_PATH):
+    """
+    Load app_path in a fresh interpreter; returns {'load_ms', 'create_app_ms',
+    'imports'} where imports is [(cumulative_us, self_us, name)]
+    """
+    env = dict(os.environ)
+    env['LAZY_STARTUP'] = 'true'
+    env.setdefault('MONGO_URI', 'mongodb://127.0.0.1:1/healthquest_cold_start')
+    env.setdefault('SENTIMENT_WARMUP', 'false')
+    env.setdefault('ACTIVITY_SENTIMENT_ASYNC', 'false')
+
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', LOADER, app_path],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(app_path)
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f'loading {app_path} failed:\n{proc.stderr[-2000:]}')
+
+    imports = []
+    for line in proc.stderr.splitlines():
+        # import time:   self [us] |   cumulative | imported package
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        imports.append((int(cumulative_us), int(self_us), name.rstrip()))
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['imports'] = imports
+    return result
+
+
+def cold_start_failures(result, budget_ms=DEFAULT_BUDGET_MS):
+    """Reasons the measured start misses the budget or imported a lazy SDK"""
+    failures = []
+    if result['load_ms'] > budget_ms:
+        failures.append(f"loading app.py took {result['load_ms']:.0f} ms, budget is {budget_ms:.0f} ms")
+    imported = {name.strip() for _, _, name in result['imports']}
+    for module in LAZY_MODULES:
+        if module in imported:
+            failures.append(f"{module} was imported at startup")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--app-path', default=APP_PATH)
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    result = measure_cold_start(args.app_path)
+
+    print(f"Slowest imports loading {args.app_path}:")
+    for cumulative, self_us, name in sorted(result['imports'], reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:>9.1f} ms cumulative  {self_us / 1000:>8.1f} ms self  {name.strip()}")
+
+    failures = cold_start_failures(result, args.budget_ms)
+    print(f"\nLoading app.py: {result['load_ms']:.0f} ms (budget {args.budget_ms:.0f} ms); "
+          f"create_app() once imported: {result['create_app_ms']:.0f} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
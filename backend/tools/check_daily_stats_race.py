@@ -0,0 +1,91 @@
+"""
+Concurrency check for the daily_stats writer.
+
+Fires many parallel increment_daily_stats calls for the same user and day
+against a real MongoDB (a scratch database that is dropped afterwards), then
+fails (exit code 1) unless exactly one day document exists and its counters
+equal the sum of all writes.
+
+Run from the backend directory:
+    python -m tools.check_daily_stats_race --mongo-uri mongodb://localhost:27017 \
+        --threads 32 --writes 2000
+"""
+
+import argparse
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+from app.daily_stats import day_start, increment_daily_stats
+
+
+class ScratchDatabase:
+    """Minimal stand-in for app.database.Database over one pymongo database"""
+
+    def __init__(self, db):
+        self.db = db
+
+    @property
+    def daily_stats(self):
+        return self.db.daily_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--writes', type=int, default=2000)
+    parser.add_argument('--without-index', action='store_true',
+                        help='skip the unique (user_id, date) index to see what it protects against')
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_uri, serverSelectionTimeoutMS=5000)
+    name = f'daily_stats_race_{uuid.uuid4().hex[:8]}'
+    db = ScratchDatabase(client[name])
+    try:
+        if not args.without_index:
+            db.daily_stats.create_index([('user_id', 1), ('date', 1)], unique=True)
+
+        user_id = ObjectId()
+        today = day_start()
+
+        def write(i):
+            if i % 2:
+                increment_daily_stats(db, user_id, {'activities_logged': 1, 'xp_gained': 10})
+            else:
+                increment_daily_stats(db, user_id, {'quests_completed': 1, 'xp_gained': 25})
+
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            list(pool.map(write, range(args.writes)))
+
+        docs = list(db.daily_stats.find({'user_id': user_id, 'date': today}))
+        activity_writes = args.writes // 2
+        quest_writes = args.writes - activity_writes
+        expected = {
+            'activities_logged': activity_writes,
+            'quests_completed': quest_writes,
+            'xp_gained': activity_writes * 10 + quest_writes * 25
+        }
+
+        failures = []
+        if len(docs) != 1:
+            failures.append(f"expected 1 day document, found {len(docs)}")
+        totals = {field: sum(doc.get(field, 0) for doc in docs) for field in expected}
+        if totals != expected:
+            failures.append(f"expected totals {expected}, got {totals}")
+
+        print(f"{args.writes} writes from {args.threads} threads -> {len(docs)} document(s) {totals}")
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        if failures:
+            sys.exit(1)
+        print("OK")
+    finally:
+        client.drop_database(name)
+
+
+if __name__ == '__main__':
+    main()
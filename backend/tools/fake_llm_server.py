@@ -0,0 +1,106 @@
+"""
+Fake Gemini-compatible LLM server for offline testing.
+
+Answers POST /v1beta/models/<model>:generateContent with a canned response
+after a configurable delay, so deadline and fallback behavior of the AI
+endpoints can be exercised without an API key or network access.
+:streamGenerateContent?alt=sse sends the same response word by word as
+server-sent events, spreading the delay across the chunks.
+
+Run from the backend directory:
+    python -m tools.fake_llm_server --port 8090 --delay-ms 8000
+
+Then start the API pointed at it:
+    LLM_BASE_URL=http://127.0.0.1:8090 python app.py
+
+To test without any server, LLM_PROVIDER=standin runs the same canned
+answers in-process (see ai/providers.py).
+"""
+
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ai.providers import canned_response
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    delay_ms = 0
+    jitter_ms = 0
+    error_rate = 0.0
+
+    def do_POST(self):
+        streaming = ':streamGenerateContent' in self.path
+        if ':generateContent' not in self.path and not streaming:
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        prompt = ' '.join(
+            part.get('text', '')
+            for content in body.get('contents', [])
+            for part in content.get('parts', [])
+        )
+
+        delay = max(0, self.delay_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+        if random.random() < self.error_rate:
+            time.sleep(delay)
+            self.send_error(503, 'Fake upstream error')
+            return
+
+        if streaming:
+            self.stream_response(canned_response(prompt), delay)
+            return
+
+        time.sleep(delay)
+
+        payload = json.dumps({
+            'candidates': [{'content': {'role': 'model', 'parts': [{'text': canned_response(prompt)}]}}]
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def stream_response(self, text, delay):
+        words = text.split(' ')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        for i, word in enumerate(words):
+            time.sleep(delay / len(words))
+            chunk = word if i == 0 else ' ' + word
+            event = json.dumps({'candidates': [{'content': {'role': 'model', 'parts': [{'text': chunk}]}}]})
+            self.wfile.write(f"data: {event}\r\n\r\n".encode('utf-8'))
+            self.wfile.flush()
+
+    def log_message(self, format, *args):
+        print(f"[fake-llm] {self.address_string()} {format % args}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--delay-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    FakeLLMHandler.delay_ms = args.delay_ms
+    FakeLLMHandler.jitter_ms = args.jitter_ms
+    FakeLLMHandler.error_rate = args.error_rate
+
+    server = ThreadingHTTPServer((args.host, args.port), FakeLLMHandler)
+    print(f"Fake LLM server on http://{args.host}:{args.port} "
+          f"(delay {args.delay_ms:g}±{args.jitter_ms:g} ms, error rate {args.error_rate:.0%})")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -132,6 +132,33 @@ const AIRecommendations = () => {
     }
   };
 
+  // Loads insights, workout plan and nutrition tips with a single request
+  const fetchRecommendationBundle = async (goal) => {
+    setLoading(prev => ({ ...prev, insights: true, workout: true, nutrition: true }));
+    try {
+      const token = localStorage.getItem('token');
+      const response = await fetch(`http://localhost:5000/api/recommendations/bundle?goal=${encodeURIComponent(goal)}`, {
+        headers: {
+          'Authorization': `Bearer ${token}`
+        }
+      });
+      const data = await response.json();
+      
+      if (data.success) {
+        setInsights(data.insights);
+        setWorkoutPlan(data.plan);
+        setNutritionTips(data.tips);
+      }
+    } catch (error) {
+      console.error('Error fetching recommendations:', error);
+      setInsights('Failed to load insights. Please try again later.');
+      setWorkoutPlan('Failed to generate workout plan. Please try again later.');
+      setNutritionTips('Failed to load nutrition tips. Please try again later.');
+    } finally {
+      setLoading(prev => ({ ...prev, insights: false, workout: false, nutrition: false }));
+    }
+  };
+
   const handleWorkoutGoalChange = (goal) => {
     setWorkoutGoal(goal);
     fetchWorkoutPlan(goal);
@@ -141,7 +168,10 @@ const AIRecommendations = () => {
     setActiveTab(tab);
     
     // Fetch data for tab if not already loaded
-    if (tab === 'insights' && !insights) {
+    const recommendationTabs = ['insights', 'workout', 'nutrition'];
+    if (recommendationTabs.includes(tab) && !insights && !workoutPlan && !nutritionTips) {
+      fetchRecommendationBundle(workoutGoal);
+    } else if (tab === 'insights' && !insights) {
       fetchHealthInsights();
     } else if (tab === 'workout' && !workoutPlan) {
       fetchWorkoutPlan(workoutGoal);